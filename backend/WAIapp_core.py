@@ -1,28 +1,42 @@
 # backend/WAIapp_core.py
 
 import os
+import hashlib
 import pandas as pd
 import numpy as np
 import warnings
+import time
+from typing import Iterator, Optional
 from dotenv import load_dotenv
-from volcenginesdkarkruntime import Ark
 import markdown2
-import json
-from pandarallel import pandarallel
+from dataset_store import load_dataset, save_dataset, save_cluster_points, iter_dataset
+from basket_mining import mine_frequent_itemsets
+from basket_index import update_basket_index
+from sentiment_scoring import score_texts, SENTIMENT_ENGINES
+from response_encoding import ndjson_records
+from llm_client import build_request, stream_response
+from model_registry import (
+    forecast_lineage_key, classify_history, load_forecast_entry, save_forecast_entry,
+    clustering_lineage_key, load_clustering_entry, save_clustering_entry
+)
+from data_ingest import (
+    UploadSource, read_sales_upload, read_reviews_upload, iter_reviews_upload,
+    SALES_COLUMN_ALIASES, SALES_REQUIRED_COLUMNS, VALID_ORDER_STATUSES
+)
 
 # 分析库
-from sklearn.cluster import KMeans, MiniBatchKMeans
+from scipy import sparse
+from scipy.optimize import linear_sum_assignment
+from sklearn.cluster import KMeans, MiniBatchKMeans, kmeans_plusplus
+from sklearn.metrics import silhouette_score
+from joblib import Parallel, delayed
 from sklearn.preprocessing import StandardScaler, MinMaxScaler
-from keras.models import Sequential
-from keras.layers import LSTM, Dense, Input
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 from pandas.errors import SettingWithCopyWarning, DtypeWarning
-from mlxtend.preprocessing import TransactionEncoder
-from mlxtend.frequent_patterns import apriori, association_rules, fpgrowth
+from pandas.tseries.api import guess_datetime_format
+from mlxtend.frequent_patterns import association_rules
 
-# 可视化库
-import plotly.graph_objects as go
-import plotly.express as px
+# 可视化库（直接输出 Plotly JSON 规格，plotly 只用于提供模板与 plotly.js 版本）
+from figure_spec import FigureSpec, patch_figure, figure_html, plotly_cdn_script
 
 # 加载环境变量
 load_dotenv()
@@ -30,9 +44,6 @@ load_dotenv()
 # (关键) 解决 KMeans 内存泄漏警告
 os.environ['OMP_NUM_THREADS'] = '1'
 
-# 初始化 pandarallel，禁用进度条以保持日志清洁
-pandarallel.initialize(progress_bar=False) 
-
 # 抑制特定的Pandas警告
 warnings.filterwarnings('ignore', category=SettingWithCopyWarning)
 warnings.filterwarnings('ignore', category=DtypeWarning)
@@ -41,16 +52,11 @@ warnings.filterwarnings('ignore', category=DtypeWarning)
 # AI Agent 模块
 # ==============================================================================
 
-def get_ark_client():
-    """获取并返回一个配置好的 Ark 客户端实例"""
-    api_key = os.getenv("ARK_API_KEY")
-    if not api_key:
-        raise ValueError("ARK_API_KEY not found in environment variables.")
-    return Ark(api_key=api_key)
+# 模型请求统一经由 llm_client 的共享异步客户端发出，三个 Agent 均为异步生成器，
+# 等待模型输出期间不占用线程
 
-def generate_full_report_stream(user_profile: dict):
+async def generate_full_report_stream(user_profile: dict):
     """【核心】生成主市场分析报告的流式函数"""
-    ark_client = get_ark_client()
     market = user_profile['target_market']
     categories = user_profile['supply_chain']
     seller = user_profile['seller_type']
@@ -138,36 +144,13 @@ def generate_full_report_stream(user_profile: dict):
     user_input = f"请基于我的画像，为我生成一份关于'{market}'市场的机会识别与竞争分析报告，重点关注'{categories}'品类。"
 
     use_websearch = user_profile.get("use_websearch", False)
-    request_params = {
-        "model": "doubao-seed-1-6-250615",
-        "input": [
-            {
-                "role": "system",
-                "content": [{"type": "input_text", "text": system_prompt}]
-            },
-            {
-                "role": "user",
-                "content": [{"type": "input_text", "text": user_input}]
-            }
-        ],
-        "stream": True
-    }
-    if use_websearch:
-        request_params["tools"] = [{"type": "web_search", "limit": 15}]
-    
-    try:
-        response = ark_client.responses.create(**request_params)
-        for chunk in response:
-            delta_content = getattr(chunk, 'delta', None)
-            if isinstance(delta_content, str):
-                yield delta_content
-    except Exception as e:
-        yield f"❌ AI Agent请求失败: {e}"
+    tools = [{"type": "web_search", "limit": 15}] if use_websearch else None
+    async for delta_content in stream_response(build_request(system_prompt, user_input, tools), "AI Agent"):
+        yield delta_content
 
 
-def agent_action_planner(market_report: str, validation_summary: str):
+async def agent_action_planner(market_report: str, validation_summary: str):
     """生成行动计划的流式函数"""
-    ark_client = get_ark_client()
     system_prompt = f"""
     你是 "WeaveAI" 应用内的一位顶级的 **首席运营官(COO)兼首席营销官(CMO)**，极其擅长将战略分析转化为一份**高度具体、可落地执行的季度行动路线图**。你的报告必须专业、结构化，并使用精美的Markdown格式。
 
@@ -231,20 +214,12 @@ def agent_action_planner(market_report: str, validation_summary: str):
         *   [例如：首批1000件产品按时交付，无质量问题。]
     """
     user_input = f"以下是我的决策依据：\n--- [市场机会报告] ---\n{market_report}\n--- [内部数据验证摘要] ---\n{validation_summary}\n---\n请基于以上信息，为我生成一份具体的行动计划。"
-    try:
-        request_params = {"model": "doubao-seed-1-6-250615", "input": [{"role": "system", "content": [{"type": "input_text", "text": system_prompt}]}, {"role": "user", "content": [{"type": "input_text", "text": user_input}]}], "stream": True}
-        response = ark_client.responses.create(**request_params)
-        for chunk in response:
-            delta_content = getattr(chunk, 'delta', None)
-            if isinstance(delta_content, str):
-                yield delta_content
-    except Exception as e:
-        yield f"❌ 行动规划师Agent请求失败: {e}"
+    async for delta_content in stream_response(build_request(system_prompt, user_input), "行动规划师Agent"):
+        yield delta_content
 
 
-def generate_review_summary_report(positive_reviews_sample: str, negative_reviews_sample: str):
+async def generate_review_summary_report(positive_reviews_sample: str, negative_reviews_sample: str):
     """分析评论的流式函数"""
-    ark_client = get_ark_client()
     system_prompt = f"""
     你是 "WeaveAI" 应用内的一位高级用户洞察分析师，专注于从用户评论中提炼出深刻的商业洞见。你的报告必须专业、结构清晰、富有洞察力，并使用精美的Markdown格式，大量使用Emoji来增强可读性。
 
@@ -302,146 +277,646 @@ def generate_review_summary_report(positive_reviews_sample: str, negative_review
         2.  **加强出厂质检流程**: 针对“质量稳定性不足”的问题，建议对特定批次的产品（特别是缝合处）**增加一道出厂前的拉力测试**。虽然这会略微增加成本，但对于提升品牌口碑、降低长期售后成本至关重要。
     """
     user_input = f"以下是关于某款产品的用户评论样本。\n--- [正面评论样本] ---\n{positive_reviews_sample}\n--- [正面评论样本结束] ---\n--- [负面评论样本] ---\n{negative_reviews_sample}\n--- [负面评论样本结束] ---\n请根据以上评论，为我生成一份用户洞察分析报告。"
-    try:
-        request_params = {"model": "doubao-seed-1-6-250615", "input": [{"role": "system", "content": [{"type": "input_text", "text": system_prompt}]}, {"role": "user", "content": [{"type": "input_text", "text": user_input}]}], "stream": True}
-        response = ark_client.responses.create(**request_params)
-        for chunk in response:
-            delta_content = getattr(chunk, 'delta', None)
-            if isinstance(delta_content, str):
-                yield delta_content
-    except Exception as e:
-        yield f"❌ AI评论分析请求失败: {e}"
+    async for delta_content in stream_response(build_request(system_prompt, user_input), "AI评论分析"):
+        yield delta_content
 
 
 # ==============================================================================
 # 数据处理与分析模块 (优化版)
 # ==============================================================================
 
+# 最近成功解析过的日期格式（最近使用的排在最前）。同一店铺导出的文件格式通常固定，
+# 命中缓存时只需用一个格式做一次严格解析。
+_DATE_FORMAT_CACHE = ['%m-%d-%y']
+_DATE_FORMAT_CACHE_SIZE = 8
+
+def _remember_date_format(fmt: str):
+    if fmt in _DATE_FORMAT_CACHE:
+        _DATE_FORMAT_CACHE.remove(fmt)
+    _DATE_FORMAT_CACHE.insert(0, fmt)
+    del _DATE_FORMAT_CACHE[_DATE_FORMAT_CACHE_SIZE:]
+
+def _parse_unique_dates(uniques: pd.Index) -> pd.DatetimeIndex:
+    """解析去重后的日期字符串：依次尝试缓存格式、推断格式，最后退回逐元素容错解析"""
+    candidates = list(_DATE_FORMAT_CACHE)
+    first_valid = next((v for v in uniques if isinstance(v, str) and v.strip()), None)
+    if first_valid is not None:
+        guessed = guess_datetime_format(first_valid)
+        if guessed and guessed not in candidates:
+            candidates.append(guessed)
+    for fmt in candidates:
+        try:
+            parsed = pd.to_datetime(uniques, format=fmt)
+        except (ValueError, TypeError):
+            continue
+        _remember_date_format(fmt)
+        return pd.DatetimeIndex(parsed)
+    return pd.DatetimeIndex(pd.to_datetime(uniques, errors='coerce'))
+
+def _parse_dates(values: pd.Series) -> pd.Series:
+    """只对不重复的日期值做解析，再按类别编码映射回整列"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    codes, uniques = pd.factorize(values)
+    parsed = _parse_unique_dates(pd.Index(uniques))
+    result = parsed.take(codes, allow_fill=True, fill_value=pd.NaT)
+    return pd.Series(result, index=values.index)
+
 def clean_sales_data(df: pd.DataFrame) -> pd.DataFrame:
-    """封装的数据清洗逻辑"""
-    for old, new in {'Total Sales':'Amount','Product':'SKU','Quantity':'Qty','Order_ID':'Order ID'}.items():
-        if old in df.columns: df.rename(columns={old:new}, inplace=True)
-    
-    req_cols = ["Amount","Category","Date","Status","SKU","Order ID","Qty"]
-    if missing := [c for c in req_cols if c not in df.columns]:
+    """
+    封装的数据清洗逻辑（单次遍历版）：
+    一次性计算全部过滤条件后只做一次行筛选；日期只解析去重后的取值；
+    字符串主键转为 category，Qty 下转为最小整数类型，后续 groupby 直接在整数编码上进行。
+    """
+    # 按别名解析出各标准列在原表中的列名，直接按列取值，避免 rename 复制整张表
+    source_cols = {col: col for col in SALES_REQUIRED_COLUMNS}
+    for old, new in SALES_COLUMN_ALIASES.items():
+        if old in df.columns:
+            source_cols[new] = old
+    if missing := [c for c, src in source_cols.items() if src not in df.columns]:
         raise ValueError(f"文件中缺少关键列: {', '.join(missing)}")
+    col = {c: df[src] for c, src in source_cols.items()}
+
+    dates = _parse_dates(col["Date"])
+    amount = pd.to_numeric(col["Amount"], errors='coerce')
+    qty = pd.to_numeric(col["Qty"], errors='coerce')
+    keep = (
+        col["Status"].isin(VALID_ORDER_STATUSES).to_numpy()
+        & dates.notna().to_numpy()
+        & amount.notna().to_numpy()
+        & qty.notna().to_numpy()
+        & col["Category"].notna().to_numpy()
+        & col["SKU"].notna().to_numpy()
+        & col["Order ID"].notna().to_numpy()
+    )
 
-    df.dropna(subset=["Amount", "Category", "Date"], inplace=True)
-    try:
-        df["Date"] = pd.to_datetime(df["Date"], format='%m-%d-%y')
-    except ValueError:
-        df["Date"] = pd.to_datetime(df["Date"], errors='coerce')
-    
-    df["Amount"] = pd.to_numeric(df["Amount"], errors='coerce')
-    df = df[df["Status"].isin(["Shipped","Shipped - Delivered to Buyer","Completed","Pending","Cancelled"])]
-    df.dropna(subset=['Date','Amount','SKU','Order ID','Qty'], inplace=True)
-    return df
+    return pd.DataFrame({
+        "Amount": amount[keep],
+        "Category": _to_category(col["Category"][keep]),
+        "Date": dates[keep],
+        "Status": _to_category(col["Status"][keep]),
+        "SKU": _to_category(col["SKU"][keep]),
+        "Order ID": _to_category(col["Order ID"][keep]),
+        "Qty": _downcast_qty(qty[keep]),
+    })
+
+def _to_category(values: pd.Series) -> pd.Series:
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.remove_unused_categories()
+    # 数字与字符串混杂的主键统一转为字符串，避免同一 SKU 被拆成两个类别
+    if values.dtype == object:
+        values = values.astype(str)
+    return values.astype('category')
+
+def _downcast_qty(qty: pd.Series) -> pd.Series:
+    if qty.empty or not np.all(np.mod(qty.to_numpy(), 1) == 0):
+        return qty
+    return pd.to_numeric(qty, downcast='integer')
+
+# ==============================================================================
+# 销售预测引擎
+# 每个引擎接收按日汇总的销售额序列，返回 (未来 horizon 天的预测值, 附加信息 dict)。
+# LSTM 仍然可用；统计引擎基于 NumPy 向量化实现，不依赖 TensorFlow，通常在百毫秒内完成。
+# ==============================================================================
+
+FORECAST_HORIZON = 30
+LSTM_LOOK_BACK = 7
+SEASON_LENGTH = 7
+
+FORECAST_ENGINES = {}
+
+def register_forecast_engine(name: str, label: str):
+    """注册预测引擎；label 用于图表标题与图例"""
+    def decorator(fn):
+        FORECAST_ENGINES[name] = (fn, label)
+        return fn
+    return decorator
+
+def _compile_recursive_forecast(model, look_back: int, horizon: int):
+    """
+    把逐日递推预测编译成一个 tf.function：30 步递推在同一张计算图内完成，
+    不再为每一步支付一次 model.predict 的调度开销和 np.append 的数组重分配。
+    """
+    import tensorflow as tf
+
+    @tf.function
+    def rollout(window):
+        preds = tf.TensorArray(tf.float32, size=horizon)
+        for i in tf.range(horizon):
+            next_pred = model(window, training=False)
+            preds = preds.write(i, next_pred[0, 0])
+            window = tf.concat([window[:, 1:, :], tf.reshape(next_pred, (1, 1, 1))], axis=1)
+            window.set_shape((1, look_back, 1))
+        return preds.stack()
+    return rollout
+
+def make_forecast_windows(series: np.ndarray, look_back: int, output_size: int = 1):
+    """
+    用 stride trick 生成滑动窗口（零拷贝视图），替代逐个切片 append 的 Python 循环。
+    返回 X: (n, look_back, 1)，y: (n, output_size)
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(series.astype(np.float32), look_back + output_size)
+    X = windows[:, :look_back, np.newaxis]
+    y = windows[:, look_back:]
+    return X, y
+
+LSTM_MAX_EPOCHS = 20
+LSTM_BATCH_SIZE = 32
+EARLY_STOPPING_PATIENCE = 3
+VALIDATION_TAIL_RATIO = 0.1
+# XLA 编译在 CPU 上对小型 LSTM 反而更慢（编译开销远大于收益），默认关闭，可用环境变量开启
+LSTM_JIT_COMPILE = os.getenv("WEAVEAI_LSTM_JIT", "0") == "1"
+
+def fit_lstm_fast(model, X, y: np.ndarray, max_epochs: int, validate: bool = True,
+                  batch_size: int = LSTM_BATCH_SIZE):
+    """
+    tf.data 流水线（打乱 + 分批 + 预取）训练；以时间上最后 10% 的窗口作为验证集，
+    验证损失连续 EARLY_STOPPING_PATIENCE 轮不下降即停止并回滚到最佳权重。
+    X 可以是数组，也可以是按第一维对齐的多输入元组（如 (窗口, 序列编号)）。
+    返回 (实际训练轮数, 训练耗时毫秒)。
+    """
+    import tensorflow as tf
+    from keras.callbacks import EarlyStopping
+
+    def take(part):
+        return tuple(x[part] for x in X) if isinstance(X, tuple) else X[part]
+
+    n_val = int(len(y) * VALIDATION_TAIL_RATIO) if validate else 0
+    if n_val < 8 or len(y) - n_val < batch_size:
+        n_val = 0
+    n_train = len(y) - n_val
+
+    train_ds = (tf.data.Dataset.from_tensor_slices((take(slice(None, n_train)), y[:n_train]))
+                .shuffle(n_train, seed=42)
+                .batch(batch_size)
+                .prefetch(tf.data.AUTOTUNE))
+    fit_kwargs = {}
+    if n_val:
+        fit_kwargs["validation_data"] = (tf.data.Dataset.from_tensor_slices((take(slice(n_train, None)), y[n_train:]))
+                                         .batch(batch_size)
+                                         .prefetch(tf.data.AUTOTUNE))
+        fit_kwargs["callbacks"] = [EarlyStopping(monitor='val_loss', patience=EARLY_STOPPING_PATIENCE,
+                                                 restore_best_weights=True)]
+
+    start = time.perf_counter()
+    history = model.fit(train_ds, epochs=max_epochs, verbose=0, **fit_kwargs)
+    return len(history.history['loss']), (time.perf_counter() - start) * 1000
+
+# 增量微调：只在最近这么多天（至少覆盖全部新增日期）的窗口上训练少量轮次
+FINE_TUNE_EPOCHS = 3
+FINE_TUNE_CONTEXT_DAYS = 60
+# 新数据超出已保存缩放范围的比例超过该阈值时，放弃微调、完整重训
+MAX_SCALE_DRIFT = 0.25
+# LSTM 引擎的预测方式：recursive 单步递推 / direct 多输出头一次给出
+FORECAST_MODES = ("recursive", "direct")
+
+@register_forecast_engine("lstm", "LSTM")
+def lstm_forecast_engine(values: np.ndarray, horizon: int, forecast_mode: str = "recursive",
+                         series_name: str = "total", use_registry: bool = True):
+    """
+    LSTM 引擎（TensorFlow 只在选用该引擎时才加载）。
+    forecast_mode:
+      - "recursive": 单步模型 + 编译后的递推（与原逐步 predict 结果一致）
+      - "direct":    多输出头一次前向直接给出未来 horizon 天（序列过短时自动退回 recursive）
+    use_registry 为 True 时按序列指纹复用已保存的模型：数据未变直接预测，
+    只追加了新日期则在新增窗口上微调，历史被修改时才完整重训。
+    """
+    import tensorflow as tf
+    from keras.models import Sequential
+    from keras.layers import LSTM, Dense, Input
+
+    if forecast_mode not in FORECAST_MODES:
+        raise ValueError(f"未知的预测模式: {forecast_mode}，可选值为 recursive / direct")
+
+    look_back = LSTM_LOOK_BACK
+    if forecast_mode == "direct" and len(values) - look_back - horizon + 1 < 32:
+        forecast_mode = "recursive"
+    output_size = horizon if forecast_mode == "direct" else 1
+    if len(values) - look_back - output_size + 1 <= 0:
+        raise ValueError(f"销售数据不足：LSTM 预测至少需要 {look_back + output_size} 天的数据。")
+
+    # --- 查找可复用的模型 ---
+    config = {"look_back": look_back, "output_size": output_size, "units": 50}
+    key = forecast_lineage_key(values, series_name, config) if use_registry else None
+    state, model, history = None, None, "new"
+    if key is not None:
+        try:
+            state, model = load_forecast_entry(key)
+        except Exception:
+            state, model = None, None
+        history = classify_history(state, values) if model is not None else "new"
 
-def perform_lstm_forecast(df: pd.DataFrame) -> go.Figure:
-    """LSTM 预测函数，返回 Plotly Figure 对象"""
-    sales_ts = df.groupby('Date')['Amount'].sum().asfreq('D', fill_value=0)
-    sales_values = sales_ts.values.reshape(-1, 1)
     scaler = MinMaxScaler(feature_range=(0, 1))
-    scaled_values = scaler.fit_transform(sales_values)
-    
-    def create_dataset(data, look_back=7):
-        X, y = [], []
-        for i in range(len(data) - look_back):
-            X.append(data[i:(i + look_back), 0])
-            y.append(data[i + look_back, 0])
-        return np.array(X), np.array(y)
-
-    look_back = 7
-    X, y = create_dataset(scaled_values, look_back)
-    X = np.reshape(X, (X.shape[0], X.shape[1], 1))
-
-    model = Sequential([Input(shape=(look_back, 1)), LSTM(50), Dense(1)])
-    model.compile(loss='mean_squared_error', optimizer='adam')
-    model.fit(X, y, epochs=20, batch_size=32, verbose=0)
-
-    last_days_scaled = scaled_values[-look_back:]
+    if history in ("unchanged", "extended"):
+        data_min, data_max = state["data_min"], state["data_max"]
+        span = max(data_max - data_min, 1e-9)
+        if values.min() < data_min - MAX_SCALE_DRIFT * span or values.max() > data_max + MAX_SCALE_DRIFT * span:
+            history = "changed"
+        else:
+            scaler.fit(np.array([[data_min], [data_max]]))
+    if history in ("new", "changed"):
+        scaler.fit(values.reshape(-1, 1))
+    scaled_values = scaler.transform(values.reshape(-1, 1))
+
+    # --- 训练：完整训练 / 增量微调 / 直接复用 ---
+    X, y = make_forecast_windows(scaled_values[:, 0], look_back, output_size)
+    train_ms = 0.0
+    if history in ("new", "changed"):
+        training = "full"
+        model = Sequential([Input(shape=(look_back, 1)), LSTM(50), Dense(output_size)])
+        model.compile(loss='mean_squared_error', optimizer='adam', jit_compile=LSTM_JIT_COMPILE)
+        epochs, train_ms = fit_lstm_fast(model, X, y, max_epochs=LSTM_MAX_EPOCHS)
+    elif history == "extended":
+        training = "fine_tune"
+        # 窗口 i 的目标覆盖 [i+look_back, i+look_back+output_size)，只保留目标落在最近一段的窗口
+        cutoff = min(state["n_obs"], len(values) - FINE_TUNE_CONTEXT_DAYS)
+        first_window = max(0, cutoff - look_back - output_size + 1)
+        epochs, train_ms = fit_lstm_fast(model, X[first_window:], y[first_window:],
+                                         max_epochs=FINE_TUNE_EPOCHS, validate=False)
+    else:
+        training, epochs = "reused", 0
+
+    if key is not None and training != "reused":
+        save_forecast_entry(key, model, values, {
+            "data_min": float(scaler.data_min_[0]),
+            "data_max": float(scaler.data_max_[0]),
+            "config": config,
+            "series_name": series_name,
+        })
+
+    last_days_scaled = scaled_values[-look_back:].astype(np.float32)
     current_input = np.reshape(last_days_scaled, (1, look_back, 1))
-    future_predictions_scaled = []
-    for _ in range(30):
-        next_pred_scaled = model.predict(current_input, verbose=0)
-        future_predictions_scaled.append(next_pred_scaled[0, 0])
-        new_pred_reshaped = np.reshape(next_pred_scaled, (1, 1, 1))
-        current_input = np.append(current_input[:, 1:, :], new_pred_reshaped, axis=1)
+    inference_start = time.perf_counter()
+    if forecast_mode == "direct":
+        future_predictions_scaled = model(current_input, training=False).numpy()[0]
+    else:
+        rollout = _compile_recursive_forecast(model, look_back, horizon)
+        future_predictions_scaled = rollout(tf.constant(current_input)).numpy()
+    inference_ms = (time.perf_counter() - inference_start) * 1000
 
     future_predictions = scaler.inverse_transform(np.array(future_predictions_scaled).reshape(-1, 1))
+    return future_predictions.flatten(), {
+        "forecast_mode": forecast_mode,
+        "inference_ms": round(inference_ms, 2),
+        "training": training,
+        "epochs": epochs,
+        "train_ms": round(train_ms, 2),
+    }
+
+@register_forecast_engine("seasonal_naive", "季节性朴素")
+def seasonal_naive_forecast_engine(values: np.ndarray, horizon: int, period: int = SEASON_LENGTH):
+    """用最近一个完整周期（默认 7 天）的取值重复填满预测窗口"""
+    if len(values) == 0:
+        raise ValueError("销售数据为空，无法预测。")
+    if len(values) < period:
+        return np.repeat(values[-1], horizon).astype(float), {"period": 1}
+    last_season = values[-period:]
+    return np.resize(last_season, horizon).astype(float), {"period": period}
+
+# 平滑参数网格：所有组合在时间维上同步递推（向量化），按一步预测误差选最优
+_ETS_ALPHAS = np.array([0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9])
+_ETS_BETAS = np.array([0.01, 0.05, 0.1, 0.2])
+_ETS_GAMMAS = np.array([0.01, 0.05, 0.1, 0.2, 0.3, 0.5])
+# 前两个周期用于初始化，之后至少还要有一个周期计算一步预测误差，否则无法选择参数
+ETS_MIN_PERIODS = 3
+
+def _fit_additive_ets(values: np.ndarray, horizon: int, period: int, trend: bool):
+    """
+    加性 Holt-Winters / ETS(A,A,A) 与 ETS(A,N,A) 的网格拟合。
+    网格中的每组 (alpha, beta, gamma) 作为一行，逐个时间步同时更新全部组合的状态。
+    """
+    y = values.astype(float)
+    betas = _ETS_BETAS if trend else np.array([0.0])
+    alpha, beta, gamma = (g.ravel() for g in np.meshgrid(_ETS_ALPHAS, betas, _ETS_GAMMAS, indexing='ij'))
+    n_params = alpha.size
+
+    # 用前两个周期初始化水平、趋势与季节项
+    level = np.full(n_params, y[:period].mean())
+    slope = np.full(n_params, (y[period:2 * period].mean() - y[:period].mean()) / period if trend else 0.0)
+    season = np.tile(y[:period] - y[:period].mean(), (n_params, 1))
+
+    sse = np.zeros(n_params)
+    for t in range(period, len(y)):
+        idx = t % period
+        forecast = level + slope + season[:, idx]
+        if t >= 2 * period:
+            sse += (y[t] - forecast) ** 2
+        prev_level = level
+        level = alpha * (y[t] - season[:, idx]) + (1 - alpha) * (level + slope)
+        slope = beta * (level - prev_level) + (1 - beta) * slope
+        season[:, idx] = gamma * (y[t] - level) + (1 - gamma) * season[:, idx]
+
+    best = int(np.argmin(sse))
+    steps = np.arange(1, horizon + 1)
+    season_idx = (len(y) + steps - 1) % period
+    preds = level[best] + steps * slope[best] + season[best, season_idx]
+    info = {"alpha": float(alpha[best]), "gamma": float(gamma[best]), "period": period}
+    if trend:
+        info["beta"] = float(beta[best])
+    return np.clip(preds, 0, None), info
+
+@register_forecast_engine("holt_winters", "Holt-Winters")
+def holt_winters_forecast_engine(values: np.ndarray, horizon: int, period: int = SEASON_LENGTH):
+    """加性趋势 + 周季节的 Holt-Winters；数据不足 ETS_MIN_PERIODS（3）个周期时退回季节性朴素"""
+    if len(values) < ETS_MIN_PERIODS * period:
+        return seasonal_naive_forecast_engine(values, horizon, period)
+    return _fit_additive_ets(values, horizon, period, trend=True)
+
+@register_forecast_engine("ets_weekly", "周季节 ETS")
+def ets_weekly_forecast_engine(values: np.ndarray, horizon: int, period: int = SEASON_LENGTH):
+    """无趋势、周季节的 ETS(A,N,A)，适合平稳但有明显周内波动的销售额；数据不足 3 个周期时同样退回季节性朴素"""
+    if len(values) < ETS_MIN_PERIODS * period:
+        return seasonal_naive_forecast_engine(values, horizon, period)
+    return _fit_additive_ets(values, horizon, period, trend=False)
+
+def perform_sales_forecast(df: pd.DataFrame, engine: str = "lstm", **engine_options) -> FigureSpec:
+    """
+    按日汇总销售额并调用指定的预测引擎，返回 Plotly Figure 对象。
+    引擎名称、拟合耗时及引擎附加信息记录在 layout.meta 中。
+    """
+    if engine not in FORECAST_ENGINES:
+        raise ValueError(f"未知的预测引擎: {engine}，可选值为 {list(FORECAST_ENGINES)}")
+    engine_fn, label = FORECAST_ENGINES[engine]
+
+    sales_ts = df.groupby('Date')['Amount'].sum().asfreq('D', fill_value=0)
+    if sales_ts.empty:
+        raise ValueError("清洗后没有可用于预测的销售数据。")
+
+    horizon = FORECAST_HORIZON
+    fit_start = time.perf_counter()
+    future_predictions, info = engine_fn(sales_ts.values, horizon, **engine_options)
+    fit_ms = (time.perf_counter() - fit_start) * 1000
+
     last_date = sales_ts.index[-1]
-    future_dates = pd.date_range(start=last_date + pd.Timedelta(days=1), periods=30)
-    
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=sales_ts.index, y=sales_ts.values, name='历史销售额', line=dict(color='royalblue', width=2), fill='tozeroy', fillcolor='rgba(65, 105, 225, 0.2)'))
-    fig.add_trace(go.Scatter(x=future_dates, y=future_predictions.flatten(), name='LSTM 预测销售额', line=dict(color='darkorange', dash='dash', width=2), fill='tozeroy', fillcolor='rgba(255, 140, 0, 0.2)'))
-    fig.update_layout(title='未来30天销售额深度学习预测 (LSTM模型)', xaxis_title='日期', yaxis_title='销售额', template='plotly_white')
+    future_dates = pd.date_range(start=last_date + pd.Timedelta(days=1), periods=horizon)
+    title = '未来30天销售额深度学习预测 (LSTM模型)' if engine == "lstm" else f'未来30天销售额预测 ({label}模型)'
+
+    fig = FigureSpec()
+    fig.add_trace('scatter', x=sales_ts.index, y=sales_ts.to_numpy(dtype=np.float64), name='历史销售额', mode='lines', line=dict(color='royalblue', width=2), fill='tozeroy', fillcolor='rgba(65, 105, 225, 0.2)')
+    fig.add_trace('scatter', x=future_dates, y=np.asarray(future_predictions, dtype=np.float64), name=f'{label} 预测销售额', mode='lines', line=dict(color='darkorange', dash='dash', width=2), fill='tozeroy', fillcolor='rgba(255, 140, 0, 0.2)')
+    fig.update_layout(title=dict(text=title), xaxis=dict(title=dict(text='日期')), yaxis=dict(title=dict(text='销售额')), template='plotly_white')
+    fig.update_layout(meta={"engine": engine, "fit_ms": round(fit_ms, 2), **info})
     return fig
 
-def calculate_wcss_for_elbow(scaled_data, max_k=6):
+def perform_lstm_forecast(df: pd.DataFrame, forecast_mode: str = "recursive") -> FigureSpec:
+    """LSTM 预测函数，返回图表规格对象（perform_sales_forecast 的 LSTM 快捷方式）"""
+    return perform_sales_forecast(df, engine="lstm", forecast_mode=forecast_mode)
+
+# ==============================================================================
+# 批量预测：一个全局 LSTM 同时学习所有品类 / SKU 序列
+# 各序列按自身最大值缩放后把窗口堆叠在一起训练，序列编号经 Embedding 输入模型区分个体差异；
+# 训练一次、一次前向即得到全部序列的预测，耗时随序列数近似线性增长而不是每条序列单独训练。
+# ==============================================================================
+
+BATCH_FORECAST_GROUPS = ("Category", "SKU")
+BATCH_FORECAST_MAX_SERIES = 5000
+GLOBAL_LSTM_EMBEDDING_DIM = 8
+GLOBAL_LSTM_BATCH_SIZE = 512
+# 堆叠后的训练窗口超过该数量时随机抽样，控制单次训练耗时
+GLOBAL_LSTM_MAX_TRAIN_WINDOWS = 50_000
+
+def _build_sales_panel(df: pd.DataFrame, group_by: str, top_n: int) -> pd.DataFrame:
+    """按 (日期, 分组) 汇总销售额，返回 日期 x 序列 的宽表（按总销售额取前 top_n 个序列，缺失日期补 0）"""
+    totals = df.groupby(group_by, observed=True)['Amount'].sum().nlargest(top_n)
+    if totals.empty:
+        raise ValueError("清洗后没有可用于预测的销售数据。")
+    subset = df[df[group_by].isin(totals.index)]
+    panel = subset.groupby(['Date', group_by], observed=True)['Amount'].sum().unstack(group_by, fill_value=0)
+    panel = panel.asfreq('D', fill_value=0)
+    return panel[totals.index]
+
+def _build_global_forecast_model(n_series: int, look_back: int, output_size: int):
+    from keras import Model
+    from keras.layers import LSTM, Concatenate, Dense, Embedding, Input
+
+    window_in = Input(shape=(look_back, 1), name="window")
+    series_in = Input(shape=(), dtype="int32", name="series_id")
+    series_emb = Embedding(n_series, GLOBAL_LSTM_EMBEDDING_DIM)(series_in)
+    hidden = Concatenate()([LSTM(50)(window_in), series_emb])
+    model = Model([window_in, series_in], Dense(output_size)(hidden))
+    model.compile(loss='mean_squared_error', optimizer='adam', jit_compile=LSTM_JIT_COMPILE)
+    return model
+
+def _compile_batched_recursive_forecast(model, look_back: int, horizon: int):
+    """_compile_recursive_forecast 的多序列版本：所有序列在同一批内同步递推"""
+    import tensorflow as tf
+
+    @tf.function
+    def rollout(window, series_ids):
+        preds = tf.TensorArray(tf.float32, size=horizon)
+        for i in tf.range(horizon):
+            next_pred = model([window, series_ids], training=False)
+            preds = preds.write(i, next_pred[:, 0])
+            window = tf.concat([window[:, 1:, :], next_pred[:, :, tf.newaxis]], axis=1)
+            window.set_shape((None, look_back, 1))
+        return tf.transpose(preds.stack())
+    return rollout
+
+def global_lstm_batch_forecast(panel: np.ndarray, horizon: int):
     """
-    为手肘法计算不同K值下的WCSS (簇内平方差)。
-    默认仅计算到 K=6，并在数据量过大时自动抽样，以避免内存占用过高。
+    panel: (序列数, 天数) 的销售额矩阵。返回 (预测矩阵 (序列数, horizon), 附加信息)。
+    数据足够时使用多输出头一次给出全部 horizon 天，否则退回单步模型 + 批量递推。
     """
-    sample = scaled_data
-    if sample.shape[0] > 2000:
-        rng = np.random.default_rng(42)
-        idx = rng.choice(sample.shape[0], 2000, replace=False)
-        sample = sample[idx]
+    import tensorflow as tf
+
+    n_series, n_days = panel.shape
+    look_back = LSTM_LOOK_BACK
+    output_size = horizon if n_days - look_back - horizon + 1 > 0 else 1
+    if n_days - look_back - output_size + 1 <= 0:
+        raise ValueError(f"销售数据不足：批量预测至少需要 {look_back + 1} 天的数据。")
+
+    scale = panel.max(axis=1)
+    scale[scale <= 0] = 1.0
+    scaled = (panel / scale[:, np.newaxis]).astype(np.float32)
+
+    # (序列, 窗口, look_back + output_size) -> 按窗口时间优先堆叠，验证集自然落在所有序列最近的窗口上
+    windows = np.lib.stride_tricks.sliding_window_view(scaled, look_back + output_size, axis=1)
+    n_windows = windows.shape[1]
+    stacked = windows.transpose(1, 0, 2).reshape(-1, look_back + output_size)
+    series_ids = np.tile(np.arange(n_series, dtype=np.int32), n_windows)
+    if len(stacked) > GLOBAL_LSTM_MAX_TRAIN_WINDOWS:
+        keep = np.sort(np.random.default_rng(42).choice(len(stacked), GLOBAL_LSTM_MAX_TRAIN_WINDOWS, replace=False))
+        stacked, series_ids = stacked[keep], series_ids[keep]
+    X = stacked[:, :look_back, np.newaxis]
+    y = stacked[:, look_back:]
+
+    model = _build_global_forecast_model(n_series, look_back, output_size)
+    epochs, train_ms = fit_lstm_fast(model, (X, series_ids), y, max_epochs=LSTM_MAX_EPOCHS,
+                                     batch_size=GLOBAL_LSTM_BATCH_SIZE)
+
+    last_windows = tf.constant(scaled[:, -look_back:, np.newaxis])
+    all_ids = tf.constant(np.arange(n_series, dtype=np.int32))
+    inference_start = time.perf_counter()
+    if output_size == horizon:
+        preds_scaled = model([last_windows, all_ids], training=False).numpy()
+    else:
+        preds_scaled = _compile_batched_recursive_forecast(model, look_back, horizon)(last_windows, all_ids).numpy()
+    inference_ms = (time.perf_counter() - inference_start) * 1000
+
+    preds = np.clip(preds_scaled * scale[:, np.newaxis], 0, None)
+    return preds, {
+        "forecast_mode": "direct" if output_size == horizon else "recursive",
+        "n_series": n_series,
+        "train_windows": int(len(y)),
+        "epochs": epochs,
+        "train_ms": round(train_ms, 2),
+        "inference_ms": round(inference_ms, 2),
+    }
 
-    max_k = max(1, min(max_k, sample.shape[0]))
+def perform_batch_forecast(df: pd.DataFrame, group_by: str = "Category", top_n: int = 50) -> dict:
+    """
+    按品类或 SKU 批量预测未来 30 天销售额。
+    group_by 为 "SKU" 时按总销售额取前 top_n 个 SKU；返回每条序列的预测值及整体训练信息。
+    """
+    if group_by not in BATCH_FORECAST_GROUPS:
+        raise ValueError(f"不支持的分组字段: {group_by}，可选值为 {list(BATCH_FORECAST_GROUPS)}")
+    if not 1 <= top_n <= BATCH_FORECAST_MAX_SERIES:
+        raise ValueError(f"top_n 需在 1 到 {BATCH_FORECAST_MAX_SERIES} 之间。")
+
+    panel = _build_sales_panel(df, group_by, top_n)
+    horizon = FORECAST_HORIZON
+    fit_start = time.perf_counter()
+    preds, info = global_lstm_batch_forecast(panel.values.T.astype(np.float64), horizon)
+    fit_ms = (time.perf_counter() - fit_start) * 1000
+
+    future_dates = pd.date_range(start=panel.index[-1] + pd.Timedelta(days=1), periods=horizon)
+    history_totals = panel.sum(axis=0)
+    return {
+        "group_by": group_by,
+        "dates": future_dates.strftime('%Y-%m-%d').tolist(),
+        "series": [
+            {
+                "name": str(name),
+                "history_total": float(history_totals[name]),
+                "forecast": np.round(preds[i], 2).tolist(),
+            }
+            for i, name in enumerate(panel.columns)
+        ],
+        "meta": {"engine": "global_lstm", "fit_ms": round(fit_ms, 2), **info},
+    }
 
-    wcss = []
-    for k in range(1, max_k + 1):
-        kmeans = MiniBatchKMeans(
-            n_clusters=k,
-            batch_size=512,
-            n_init=10,
-            random_state=42
-        )
-        kmeans.fit(sample)
-        wcss.append(kmeans.inertia_)
+# ==============================================================================
+# 聚类数选择：候选 K 并行评估 + 自动选 K
+# kmeans++ 的播种是逐个选点的贪心过程，前 k 个种子本身就是一组合法的 k 簇 kmeans++ 初始化，
+# 因此每轮只播种一次 max_k 个中心，所有 K 共用其前缀，不再为每个 K 各做 10 次随机初始化。
+# ==============================================================================
 
-    return [{"k": i + 1, "wcss": val} for i, val in enumerate(wcss)]
+ELBOW_SAMPLE_SIZE = 2000
+ELBOW_MAX_K = 6
+# 共享播种的轮数：每个 K 取这几轮中 inertia 最小的结果
+KMEANS_SEED_ROUNDS = 3
+# 轮廓系数是 O(n²) 的，只在抽样中再取这么多点计算
+SILHOUETTE_SAMPLE_SIZE = 1000
+K_SELECTION_METHODS = ("silhouette", "knee")
+
+def _fit_k_candidate(sample: np.ndarray, k: int, seedings: list) -> dict:
+    start = time.perf_counter()
+    best = None
+    for seeds in seedings:
+        model = KMeans(n_clusters=k, init=seeds[:k], n_init=1, random_state=42).fit(sample)
+        if best is None or model.inertia_ < best.inertia_:
+            best = model
+    silhouette = None
+    if 2 <= k < sample.shape[0] and len(np.unique(best.labels_)) > 1:
+        silhouette = float(silhouette_score(sample, best.labels_, sample_size=min(SILHOUETTE_SAMPLE_SIZE, sample.shape[0]),
+                                            random_state=42))
+    return {
+        "k": k,
+        "wcss": float(best.inertia_),
+        "silhouette": silhouette,
+        "fit_ms": round((time.perf_counter() - start) * 1000, 2),
+        "centers": best.cluster_centers_,
+    }
 
+def _knee_point(ks: list, wcss: list) -> Optional[int]:
+    """Kneedle：归一化后离首尾连线最远（向下凸出最多）的点；曲线没有拐点时返回 None"""
+    if len(ks) < 3 or wcss[0] == wcss[-1]:
+        return None
+    x = (np.asarray(ks, dtype=float) - ks[0]) / (ks[-1] - ks[0])
+    y = (np.asarray(wcss, dtype=float) - min(wcss)) / (max(wcss) - min(wcss))
+    gap = (1 - y) - x
+    best = int(np.argmax(gap))
+    return int(ks[best]) if gap[best] > 0 else None
 
-def perform_basket_analysis(df: pd.DataFrame):
+def evaluate_cluster_counts(scaled_data: np.ndarray, max_k: int = ELBOW_MAX_K, method: str = "silhouette") -> dict:
     """
-    执行购物篮分析（默认采用 FP-Growth），并在数据规模过大时自动裁剪。
+    在抽样数据上并行评估 K=1..max_k，返回每个 K 的 WCSS / 轮廓系数 / 耗时以及自动选出的 K。
+    method: "silhouette" 取轮廓系数最大的 K；"knee" 取手肘拐点（找不到时退回轮廓系数）。
     """
-    basket_df = df[['Order ID', 'SKU', 'Qty']].copy()
-    basket_df = basket_df[basket_df['Qty'] > 0]
+    if method not in K_SELECTION_METHODS:
+        raise ValueError(f"未知的选 K 方法: {method}，可选值为 {list(K_SELECTION_METHODS)}")
+    sample = scaled_data
+    if sample.shape[0] > ELBOW_SAMPLE_SIZE:
+        rng = np.random.default_rng(42)
+        idx = rng.choice(sample.shape[0], ELBOW_SAMPLE_SIZE, replace=False)
+        sample = sample[idx]
 
-    if basket_df.empty:
-        return []
+    max_k = max(1, min(max_k, len(np.unique(sample, axis=0))))
+    seedings = [kmeans_plusplus(sample, n_clusters=max_k, random_state=seed)[0]
+                for seed in range(42, 42 + KMEANS_SEED_ROUNDS)]
 
-    order_count = basket_df['Order ID'].nunique()
-    if order_count > 5000:
-        sampled_orders = basket_df['Order ID'].drop_duplicates().sample(5000, random_state=42)
-        basket_df = basket_df[basket_df['Order ID'].isin(sampled_orders)]
+    ks = list(range(1, max_k + 1))
+    # sklearn 的 Lloyd 迭代与轮廓系数计算会释放 GIL，线程即可并行，无需复制样本到子进程
+    candidates = Parallel(n_jobs=min(len(ks), os.cpu_count() or 1), prefer="threads")(
+        delayed(_fit_k_candidate)(sample, k, seedings) for k in ks
+    )
 
-    sku_totals = basket_df.groupby('SKU')['Qty'].sum()
-    keep_skus = sku_totals[sku_totals >= 5].index
-    basket_df = basket_df[basket_df['SKU'].isin(keep_skus)]
+    scored = [c for c in candidates if c["silhouette"] is not None]
+    silhouette_k = max(scored, key=lambda c: c["silhouette"])["k"] if scored else 1
+    knee_k = _knee_point(ks, [c["wcss"] for c in candidates])
+    chosen_k = knee_k if method == "knee" and knee_k is not None else silhouette_k
 
-    if basket_df.empty:
-        return []
+    return {
+        "elbow_data": [{key: c[key] for key in ("k", "wcss", "silhouette", "fit_ms")} for c in candidates],
+        "chosen_k": chosen_k,
+        "silhouette_k": silhouette_k,
+        "knee_k": knee_k,
+        "method": method,
+        "centers": candidates[chosen_k - 1]["centers"],
+    }
 
-    basket = (basket_df.groupby(['Order ID', 'SKU'])['Qty']
-              .sum().unstack().reset_index().fillna(0)
-              .set_index('Order ID'))
 
-    basket_sets = basket.gt(0)
+BASKET_MIN_SUPPORT = 0.02
+BASKET_MIN_LIFT = 1.05
 
-    frequent_itemsets = fpgrowth(
-        basket_sets,
-        min_support=0.02,
-        use_colnames=True
+def build_basket_matrix(df: pd.DataFrame, min_support: float = BASKET_MIN_SUPPORT):
+    """
+    由订单行直接构造稀疏布尔交易矩阵（订单 x SKU，CSR），不经过稠密的 unstack。
+    支持度低于 min_support 的 SKU 不可能出现在任何频繁项集中，先行剔除不影响挖掘结果；
+    订单行全部保留（即使剔除后为空），保证支持度的分母仍是全部订单数。
+    返回 (CSR 矩阵, SKU 名称列表)。
+    """
+    lines = df.loc[df['Qty'] > 0, ['Order ID', 'SKU']]
+    order_codes, _ = pd.factorize(lines['Order ID'])
+    sku_codes, skus = pd.factorize(lines['SKU'])
+    n_orders, n_skus = (order_codes.max() + 1, len(skus)) if len(lines) else (0, 0)
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(lines), dtype=bool), (order_codes, sku_codes)),
+        shape=(n_orders, n_skus),
     )
+    matrix.sum_duplicates()
+
+    # 每个 SKU 出现在多少个订单中（同一订单多行已合并）
+    order_counts = np.bincount(matrix.indices, minlength=n_skus)
+    keep = order_counts >= np.ceil(min_support * n_orders)
+    return matrix[:, keep], [str(s) for s in np.asarray(skus)[keep]]
+
+def perform_basket_analysis(df: pd.DataFrame):
+    """
+    执行购物篮分析（并行分区 FP-Growth），在稀疏交易矩阵上挖掘全部订单，不再抽样。
+    """
+    matrix, items = build_basket_matrix(df)
+    n_orders = matrix.shape[0]
+    if n_orders == 0 or not items:
+        return []
+
+    # 按项前缀分区后在进程池中并行挖掘，结果与单进程 fpgrowth 一致
+    frequent_itemsets = mine_frequent_itemsets(matrix, items, min_support=BASKET_MIN_SUPPORT)
     if frequent_itemsets.empty:
         return []
 
-    rules = association_rules(frequent_itemsets, metric="lift", min_threshold=1.05)
+    rules = association_rules(frequent_itemsets, num_itemsets=n_orders, metric="lift", min_threshold=BASKET_MIN_LIFT)
 
     if rules.empty:
         return []
@@ -459,15 +934,208 @@ def perform_basket_analysis(df: pd.DataFrame):
     return result.to_dict(orient='records')
 
 
-def perform_product_clustering(df: pd.DataFrame) -> dict:
+CLUSTER_FEATURES = ['total_amount', 'total_qty', 'order_count']
+CLUSTERING_MODES = ("top_n", "streaming")
+CLUSTERING_TOP_N = 5000
+# 流式聚类：每块的 SKU 行数与遍历全部数据的轮数
+STREAM_CHUNK_SIZE = 8192
+STREAM_EPOCHS = 3
+
+def _cluster_top_products(features: np.ndarray, n_clusters: Optional[int], k_selection: str):
+    """用销售额最高的 CLUSTERING_TOP_N 个 SKU 拟合（features 已按销售额降序），再为全部 SKU 预测"""
+    k_info = {"mode": "top_n", "method": k_selection, "chosen_k": 1, "silhouette_k": None, "knee_k": None}
+    if features.shape[0] < 2:
+        return np.zeros(features.shape[0], dtype=np.int32), [], k_info, None
+
+    scaler = StandardScaler()
+    features_scaled = scaler.fit_transform(features[:CLUSTERING_TOP_N])
+    selection = evaluate_cluster_counts(features_scaled, method=k_selection)
+    elbow_data = selection.pop("elbow_data")
+    sample_centers = selection.pop("centers")
+    k_info.update(selection)
+    if n_clusters is None:
+        # 直接以抽样上的最优中心作为最终拟合的初始化
+        init, n_init = sample_centers, 1
+        n_clusters = selection["chosen_k"]
+    else:
+        n_clusters = max(1, min(n_clusters, features_scaled.shape[0]))
+        init, n_init = "k-means++", 10
+    k_info["chosen_k"] = n_clusters
+    final_start = time.perf_counter()
+    kmeans = KMeans(n_clusters=n_clusters, init=init, n_init=n_init, random_state=42)
+    kmeans.fit(features_scaled)
+    k_info["final_fit_ms"] = round((time.perf_counter() - final_start) * 1000, 2)
+    return kmeans.predict(scaler.transform(features)), elbow_data, k_info, _cluster_model(scaler, kmeans)
+
+def _chunks(n_rows: int, rng: Optional[np.random.Generator] = None):
+    # 不足一块的尾部并入上一块：打乱顺序后它可能排在第一位，而首次 partial_fit 的样本数不能少于簇数
+    bounds = np.arange(0, n_rows, STREAM_CHUNK_SIZE)
+    if len(bounds) > 1 and n_rows - bounds[-1] < STREAM_CHUNK_SIZE:
+        bounds = bounds[:-1]
+    bounds = np.append(bounds, n_rows)
+    order = np.arange(len(bounds) - 1)
+    if rng is not None:
+        rng.shuffle(order)
+    for i in order:
+        yield slice(bounds[i], bounds[i + 1])
+
+def _cluster_streaming(features: np.ndarray, n_clusters: Optional[int], k_selection: str):
+    """
+    全部 SKU 分块流式聚类：
+      1. 分块累计均值 / 方差（StandardScaler.partial_fit）
+      2. 在随机抽样上评估 K 并得到初始中心
+      3. 打乱块顺序，逐块 MiniBatchKMeans.partial_fit，共 STREAM_EPOCHS 轮
+      4. 分块预测
+    任何时刻只有一个块被标准化，耗时与内存随 SKU 数线性增长。
+    """
+    n_rows = features.shape[0]
+    k_info = {"mode": "streaming", "method": k_selection, "chosen_k": 1, "silhouette_k": None, "knee_k": None}
+    if n_rows < 2:
+        return np.zeros(n_rows, dtype=np.int32), [], k_info, None
+
+    scaler = StandardScaler()
+    for part in _chunks(n_rows):
+        scaler.partial_fit(features[part])
+
+    rng = np.random.default_rng(42)
+    sample = scaler.transform(features[np.sort(rng.choice(n_rows, min(n_rows, ELBOW_SAMPLE_SIZE), replace=False))])
+    selection = evaluate_cluster_counts(sample, method=k_selection)
+    elbow_data = selection.pop("elbow_data")
+    init = selection.pop("centers")
+    k_info.update(selection)
+    if n_clusters is None:
+        n_clusters = selection["chosen_k"]
+    else:
+        n_clusters = max(1, min(n_clusters, len(np.unique(sample, axis=0))))
+        init = kmeans_plusplus(sample, n_clusters=n_clusters, random_state=42)[0]
+    k_info["chosen_k"] = n_clusters
+
+    final_start = time.perf_counter()
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, init=init, n_init=1, random_state=42)
+    n_chunks = 0
+    for _ in range(STREAM_EPOCHS):
+        for part in _chunks(n_rows, rng):
+            kmeans.partial_fit(scaler.transform(features[part]))
+            n_chunks += 1
+
+    labels = np.empty(n_rows, dtype=np.int32)
+    for part in _chunks(n_rows):
+        labels[part] = kmeans.predict(scaler.transform(features[part]))
+    k_info.update(final_fit_ms=round((time.perf_counter() - final_start) * 1000, 2), chunks=n_chunks)
+    return labels, elbow_data, k_info, _cluster_model(scaler, kmeans)
+
+def _cluster_model(scaler: StandardScaler, kmeans) -> dict:
+    return {
+        "mean": scaler.mean_.astype(np.float64),
+        "scale": scaler.scale_.astype(np.float64),
+        "centers": kmeans.cluster_centers_.astype(np.float64),
+    }
+
+# ==============================================================================
+# 聚类模型复用：按数据集谱系保存标准化参数与簇中心
+# 再次分析同一谱系的数据时直接把 SKU 分配到已有簇（一次向量化的最近中心计算）；
+# 分配后的平均距离相对拟合时增长超过阈值（漂移）才重新拟合，重新拟合的簇经匈牙利匹配沿用旧编号。
+# ==============================================================================
+
+CLUSTER_MODEL_MODES = ("auto", "predict", "refit")
+CLUSTER_DRIFT_THRESHOLD = 0.25
+
+def _nearest_centers(model: dict, features: np.ndarray, chunk_size: int = STREAM_CHUNK_SIZE):
+    """分块计算每个 SKU 最近的簇中心及距离（标准化空间）"""
+    nearest = np.empty(features.shape[0], dtype=np.int64)
+    distances = np.empty(features.shape[0], dtype=np.float64)
+    for start in range(0, features.shape[0], chunk_size):
+        part = (features[start:start + chunk_size] - model["mean"]) / model["scale"]
+        d2 = ((part[:, np.newaxis, :] - model["centers"][np.newaxis, :, :]) ** 2).sum(axis=2)
+        nearest[start:start + chunk_size] = d2.argmin(axis=1)
+        distances[start:start + chunk_size] = np.sqrt(d2.min(axis=1))
+    return nearest, distances
+
+def match_cluster_ids(previous: dict, model: dict) -> np.ndarray:
+    """
+    匈牙利匹配：把新簇中心与旧簇中心（都换算到新模型的标准化空间）一一配对，
+    配上的新簇沿用旧编号，多出的新簇依次分配新编号。
+    """
+    old_raw = previous["centers"] * previous["scale"] + previous["mean"]
+    old_scaled = (old_raw - model["mean"]) / model["scale"]
+    cost = ((model["centers"][:, np.newaxis, :] - old_scaled[np.newaxis, :, :]) ** 2).sum(axis=2)
+    new_idx, old_idx = linear_sum_assignment(cost)
+    ids = np.full(len(model["centers"]), -1, dtype=np.int64)
+    ids[new_idx] = previous["cluster_ids"][old_idx]
+    next_id = int(previous["cluster_ids"].max()) + 1
+    for i in np.flatnonzero(ids < 0):
+        ids[i], next_id = next_id, next_id + 1
+    return ids
+
+def _clustering_lineage(df: pd.DataFrame, clustering_mode: str, k_selection: str) -> str:
+    # 拟合方式与 K 选择方法不同的结果分属不同谱系，避免把 top_n / silhouette 的簇与 K 信息复用给其他配置
+    first_day = df.loc[df['Date'] == df['Date'].min(), 'Order ID'].astype(str)
+    config = {"features": CLUSTER_FEATURES, "clustering_mode": clustering_mode, "k_selection": k_selection}
+    return clustering_lineage_key(sorted(first_day.unique()), config)
+
+# ==============================================================================
+# 商品点降采样（LOD）：响应与 3D 散点图只保留每簇销售额最高的 SKU + 按簇分层的随机样本，
+# 完整的商品点落盘后通过分页接口读取，响应体积与前端渲染量不再随 SKU 数增长。
+# ==============================================================================
+
+LOD_MAX_POINTS = 5000
+LOD_TOP_PER_CLUSTER = 200
+
+def downsample_product_points(product_df: pd.DataFrame, max_points: int = LOD_MAX_POINTS,
+                              top_per_cluster: int = LOD_TOP_PER_CLUSTER):
+    """
+    product_df 需已按 total_amount 降序排列。返回 (降采样后的 DataFrame, 采样信息)。
+    SKU 数不超过 max_points 时原样返回。
+    """
+    total = len(product_df)
+    cluster_sizes = product_df['cluster'].value_counts()
+    if total <= max_points:
+        sampled = product_df
+    else:
+        per_cluster = max(1, min(top_per_cluster, max_points // (2 * len(cluster_sizes))))
+        top = product_df.groupby('cluster', sort=False).head(per_cluster)
+        rest = product_df.drop(top.index)
+        frac = min(1.0, (max_points - len(top)) / max(len(rest), 1))
+        # 每个簇按相同比例抽样（分层抽样），各簇在样本中的占比与全体一致
+        sample = rest.groupby('cluster', group_keys=False).sample(frac=frac, random_state=42)
+        sampled = pd.concat([top, sample]).sort_values('total_amount', ascending=False)
+
+    returned_sizes = sampled['cluster'].value_counts()
+    return sampled, {
+        "total_points": total,
+        "returned_points": len(sampled),
+        "sampling_ratio": round(len(sampled) / total, 6) if total else 1.0,
+        "per_cluster": [
+            {"cluster": int(c), "total": int(n), "returned": int(returned_sizes.get(c, 0))}
+            for c, n in cluster_sizes.sort_index().items()
+        ],
+    }
+
+def perform_product_clustering(df: pd.DataFrame, n_clusters: Optional[int] = None,
+                               k_selection: str = "silhouette", clustering_mode: str = "top_n",
+                               cluster_model: str = "auto", use_registry: bool = True,
+                               as_frames: bool = False) -> dict:
     """
     【最终修正版】产品聚类函数，修正了图表JSON生成的bug，并加入数据裁剪以降低内存占用。
+    n_clusters 为 None 时由 evaluate_cluster_counts 自动选择 K（k_selection 指定方法）。
+    clustering_mode:
+      - "top_n":     只用销售额前 5000 的 SKU 拟合，其余 SKU 直接预测所属簇
+      - "streaming": 全部 SKU 分块流式拟合（partial_fit），适合长尾的大型商品目录
+    cluster_model（use_registry 为 True 时生效）:
+      - "auto":    有已保存的模型且漂移不超过阈值时只预测，否则重新拟合
+      - "predict": 只预测（没有已保存的模型时才拟合）
+      - "refit":   强制重新拟合并覆盖已保存的模型（簇编号经匈牙利匹配保持稳定）
+    as_frames 为 True 时 cluster_summary / product_points 以 DataFrame 返回，由 response_encoding 编码。
     """
+    if clustering_mode not in CLUSTERING_MODES:
+        raise ValueError(f"未知的聚类模式: {clustering_mode}，可选值为 {list(CLUSTERING_MODES)}")
+    if cluster_model not in CLUSTER_MODEL_MODES:
+        raise ValueError(f"未知的模型复用方式: {cluster_model}，可选值为 {list(CLUSTER_MODEL_MODES)}")
     required_cols = ['SKU', 'Amount', 'Qty', 'Order ID']
     if not all(col in df.columns for col in required_cols):
         raise ValueError("聚类分析失败：缺少必要的列")
 
-    product_agg_df = df.groupby('SKU').agg(
+    product_agg_df = df.groupby('SKU', observed=True).agg(
         total_amount=('Amount', 'sum'),
         total_qty=('Qty', 'sum'),
         order_count=('Order ID', 'nunique')
@@ -478,36 +1146,50 @@ def perform_product_clustering(df: pd.DataFrame) -> dict:
             "cluster_summary": [],
             "product_points": [],
             "elbow_data": [],
-            "elbow_chart_json": go.Figure().to_json(),
-            "scatter_3d_chart_json": go.Figure().to_json()
+            "k_selection": None,
+            "cluster_model": None,
+            "points_id": None,
+            "lod": None,
+            "elbow_chart_json": FigureSpec().to_json(),
+            "scatter_3d_chart_json": FigureSpec().to_json()
         }
 
     product_agg_df.sort_values('total_amount', ascending=False, inplace=True)
 
-    top_k = min(len(product_agg_df), 5000)
-    df_for_clustering = product_agg_df.head(top_k).copy()
-
-    features_for_fit = df_for_clustering[['total_amount', 'total_qty', 'order_count']].astype(np.float32)
-    scaler = StandardScaler()
-    features_scaled = scaler.fit_transform(features_for_fit)
-
-    if features_scaled.shape[0] < 2:
-        elbow_data = []
-        product_agg_df['cluster'] = 0
-    else:
-        elbow_data = calculate_wcss_for_elbow(features_scaled)
-        n_clusters = min(3, features_scaled.shape[0])
-        kmeans = MiniBatchKMeans(
-            n_clusters=n_clusters,
-            batch_size=512,
-            n_init=10,
-            random_state=42
-        )
-        kmeans.fit(features_scaled)
-
-        all_features = product_agg_df[['total_amount', 'total_qty', 'order_count']].astype(np.float32)
-        all_features_scaled = scaler.transform(all_features)
-        product_agg_df['cluster'] = kmeans.predict(all_features_scaled)
+    features = product_agg_df[CLUSTER_FEATURES].to_numpy(dtype=np.float32)
+
+    # --- 查找可复用的聚类模型 ---
+    key = _clustering_lineage(df, clustering_mode, k_selection) if use_registry else None
+    previous = load_clustering_entry(key) if key is not None else None
+    model_info = {"lineage": key, "status": "fitted", "drift": None, "drift_threshold": CLUSTER_DRIFT_THRESHOLD}
+    labels = None
+    if previous is not None and cluster_model != "refit" and n_clusters in (None, len(previous["centers"])):
+        nearest, distances = _nearest_centers(previous, features)
+        drift = float(distances.mean() / max(previous["baseline_distance"], 1e-9) - 1)
+        model_info["drift"] = round(drift, 4)
+        if cluster_model == "predict" or drift <= CLUSTER_DRIFT_THRESHOLD:
+            labels = previous["cluster_ids"][nearest]
+            elbow_data, k_info = previous["elbow_data"], previous["k_info"]
+            model_info["status"] = "reused"
+
+    if labels is None:
+        if clustering_mode == "streaming":
+            labels, elbow_data, k_info, model = _cluster_streaming(features, n_clusters, k_selection)
+        else:
+            labels, elbow_data, k_info, model = _cluster_top_products(features, n_clusters, k_selection)
+        if model is not None and key is not None:
+            model["cluster_ids"] = (match_cluster_ids(previous, model) if previous is not None
+                                    else np.arange(len(model["centers"])))
+            model_info["status"] = "refitted" if previous is not None else "fitted"
+            _, distances = _nearest_centers(model, features)
+            save_clustering_entry(key, {
+                **model,
+                "baseline_distance": float(distances.mean()),
+                "elbow_data": elbow_data,
+                "k_info": k_info,
+            })
+            labels = model["cluster_ids"][labels]
+    product_agg_df['cluster'] = labels
 
     cluster_summary_df = product_agg_df.groupby('cluster')[['total_amount', 'total_qty', 'order_count']].mean().sort_values(by='total_amount', ascending=False).reset_index()
 
@@ -518,104 +1200,272 @@ def perform_product_clustering(df: pd.DataFrame) -> dict:
         cluster_summary_df['is_hot_cluster'] = False
 
     # --- 生成图表对象 ---
-    fig_elbow = go.Figure()
+    # 直接输出 Plotly JSON 规格（数值列为二进制类型数组），不经过 go.Figure 的属性校验
+    fig_elbow = FigureSpec()
     if elbow_data:
-        fig_elbow.add_trace(go.Scatter(
+        fig_elbow.add_trace(
+            'scatter',
             x=[d['k'] for d in elbow_data],
             y=[d['wcss'] for d in elbow_data],
             mode='lines+markers'
-        ))
+        )
+        fig_elbow.add_vline(k_info["chosen_k"], dash='dash', color='darkorange')
     fig_elbow.update_layout(
-        title='手肘法确定最佳聚类数',
-        xaxis_title='聚类数量 K',
-        yaxis_title='簇内平方差 (WCSS)',
+        title=dict(text='手肘法确定最佳聚类数'),
+        xaxis=dict(title=dict(text='聚类数量 K')),
+        yaxis=dict(title=dict(text='簇内平方差 (WCSS)')),
         template='plotly_dark'
     )
 
-    fig_3d = go.Figure()
-    fig_3d.add_trace(go.Scatter3d(
-        x=product_agg_df['total_amount'],
-        y=product_agg_df['total_qty'],
-        z=product_agg_df['order_count'],
-        text=product_agg_df['SKU'],
+    # 完整商品点按内容哈希落盘供分页读取，响应与图表只用降采样后的点
+    points_id = hashlib.sha256(pd.util.hash_pandas_object(product_agg_df, index=False).values.tobytes()).hexdigest()[:32]
+    save_cluster_points(product_agg_df, points_id)
+    points_df, lod_info = downsample_product_points(product_agg_df)
+
+    fig_3d = FigureSpec()
+    fig_3d.add_trace(
+        'scatter3d',
+        x=points_df['total_amount'],
+        y=points_df['total_qty'],
+        z=points_df['order_count'],
+        text=points_df['SKU'].astype(str),
         hoverinfo='x+y+z+text',
         mode='markers',
         marker=dict(
             size=5,
-            color=product_agg_df['cluster'],
+            color=points_df['cluster'],
             colorscale='Viridis',
             opacity=0.8
         )
-    ))
+    )
     fig_3d.update_layout(
-        title='3D聚类结果可视化',
+        title=dict(text='3D聚类结果可视化'),
         template='plotly_dark',
         scene=dict(
-            xaxis_title='总销售额',
-            yaxis_title='总销量',
-            zaxis_title='订单数'
+            xaxis=dict(title=dict(text='总销售额')),
+            yaxis=dict(title=dict(text='总销量')),
+            zaxis=dict(title=dict(text='订单数'))
         )
     )
 
     return {
-        "cluster_summary": cluster_summary_df.to_dict(orient='records'),
-        "product_points": product_agg_df.to_dict(orient='records'),
+        "cluster_summary": cluster_summary_df if as_frames else cluster_summary_df.to_dict(orient='records'),
+        "product_points": points_df if as_frames else points_df.to_dict(orient='records'),
+        "points_id": points_id,
+        "lod": lod_info,
         "elbow_data": elbow_data,
+        "k_selection": k_info,
+        "cluster_model": model_info,
         "elbow_chart_json": fig_elbow.to_json(),
         "scatter_3d_chart_json": fig_3d.to_json()
     }
 
 
-def perform_sentiment_analysis(df: pd.DataFrame) -> dict:
-    """
-    【优化版】情感分析函数，使用并行处理
-    """
-    def find_review_column(df_to_check: pd.DataFrame) -> str | None:
-        priority_cols = ['reviews.text', 'review_text', 'content', 'comment', 'review']
-        for p_col in priority_cols:
-            if p_col in df_to_check.columns and df_to_check[p_col].dropna().astype(str).str.strip().any():
-                return p_col
-        
-        possible_cols = [col for col in df_to_check.columns if any(key in str(col).lower() for key in ['text', 'review', 'content', 'comment'])]
-        if possible_cols:
-            string_cols = [col for col in possible_cols if df_to_check[col].dtype == 'object']
-            if string_cols:
-                return max(string_cols, key=lambda col: df_to_check[col].dropna().astype(str).str.len().mean())
-        
-        object_cols = df_to_check.select_dtypes(include=['object']).columns
-        if not object_cols.empty:
-            for col in object_cols:
-                if df_to_check[col].dropna().astype(str).str.strip().any():
-                    return col
-        return None
+def find_review_column(df_to_check: pd.DataFrame) -> str | None:
+    priority_cols = ['reviews.text', 'review_text', 'content', 'comment', 'review']
+    for p_col in priority_cols:
+        if p_col in df_to_check.columns and df_to_check[p_col].dropna().astype(str).str.strip().any():
+            return p_col
+    
+    possible_cols = [col for col in df_to_check.columns if any(key in str(col).lower() for key in ['text', 'review', 'content', 'comment'])]
+    if possible_cols:
+        string_cols = [col for col in possible_cols if df_to_check[col].dtype == 'object']
+        if string_cols:
+            return max(string_cols, key=lambda col: df_to_check[col].dropna().astype(str).str.len().mean())
+    
+    object_cols = df_to_check.select_dtypes(include=['object']).columns
+    if not object_cols.empty:
+        for col in object_cols:
+            if df_to_check[col].dropna().astype(str).str.strip().any():
+                return col
+    return None
+
+def sentiment_to_rating(sentiment: pd.Series) -> np.ndarray:
+    """compound 分数映射为 1~5 星（>=0.5 / >=0.05 / >-0.05 / >-0.5 / 其余）"""
+    return np.select(
+        [sentiment >= 0.5, sentiment >= 0.05, sentiment > -0.05, sentiment > -0.5],
+        [5, 4, 3, 2], default=1
+    )
 
-    review_column_name = find_review_column(df)
-    if review_column_name is None:
-        raise ValueError("错误: 未能在评论文件中找到有效的文本列。")
-        
+def _score_reviews(df: pd.DataFrame, review_column_name: str, engine: str) -> tuple[pd.DataFrame, dict]:
+    """清理评论列并打分，返回 (rating / review_text / sentiment 三列, 打分统计)"""
     df[review_column_name] = df[review_column_name].astype(str).dropna()
     df = df[df[review_column_name].str.strip() != 'None'].copy()
     
-    analyzer = SentimentIntensityAnalyzer()
-    df['sentiment'] = df[review_column_name].parallel_apply(lambda text: analyzer.polarity_scores(text)['compound'])
-    
-    def sentiment_to_rating(sentiment):
-        if sentiment >= 0.5: return 5
-        elif sentiment >= 0.05: return 4
-        elif sentiment > -0.05: return 3
-        elif sentiment > -0.5: return 2
-        else: return 1
+    df['sentiment'], scoring_info = score_texts(df[review_column_name], engine=engine)
         
     if 'rating' not in df.columns:
-        df['rating'] = df['sentiment'].apply(sentiment_to_rating)
+        df['rating'] = sentiment_to_rating(df['sentiment'])
         
     df.rename(columns={review_column_name: 'review_text'}, inplace=True)
-    
+    return df[['rating', 'review_text', 'sentiment']], scoring_info
+
+def perform_sentiment_analysis(df: pd.DataFrame, as_frames: bool = False, engine: str = "vader") -> dict:
+    """
+    【优化版】情感分析函数：评论去重后查询分数缓存，只有未见过的文本交给打分引擎（见 sentiment_scoring）
+    engine 为 vader（逐条参考实现）或 lexicon（向量化词典打分，适合百万级评论）。
+    as_frames 为 True 时 reviews 以 DataFrame 返回，由 response_encoding 按请求的格式编码。
+    """
+    review_column_name = find_review_column(df)
+    if review_column_name is None:
+        raise ValueError("错误: 未能在评论文件中找到有效的文本列。")
+        
+    reviews, scoring_info = _score_reviews(df, review_column_name, engine)
     return {
-        "reviews": df[['rating','review_text','sentiment']].to_dict(orient='records'),
-        "average_sentiment": df['sentiment'].mean()
+        "reviews": reviews if as_frames else reviews.to_dict(orient='records'),
+        "average_sentiment": reviews['sentiment'].mean(),
+        "scoring": scoring_info
     }
 
+# ==============================================================================
+# 流式情感分析：按块读取、逐块打分并输出 NDJSON，汇总指标以固定大小的状态滚动累计，
+# 内存占用只与块大小有关，与文件大小无关
+# ==============================================================================
+
+SENTIMENT_STREAM_CHUNK_ROWS = 50_000
+SENTIMENT_TOP_SAMPLES = 5
+
+def iter_review_chunks(source, chunk_rows: int = SENTIMENT_STREAM_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    if isinstance(source, str):
+        yield from iter_dataset(source, chunk_rows, kind="reviews")
+    elif isinstance(source, UploadSource):
+        yield from iter_reviews_upload(source, chunk_rows)
+    else:
+        for offset in range(0, len(source), chunk_rows):
+            yield source.iloc[offset:offset + chunk_rows].copy()
+
+def _numeric_ratings(ratings: pd.Series) -> pd.Series:
+    """CSV 分块读取时 rating 是字符串：能全部解析为数值时转为数值，否则保持原样"""
+    if ratings.dtype != object:
+        return ratings
+    numeric = pd.to_numeric(ratings, errors='coerce')
+    return numeric if numeric.notna().sum() == ratings.notna().sum() else ratings
+
+def new_sentiment_summary() -> dict:
+    return {
+        "reviews": 0,
+        "sentiment_sum": 0.0,
+        "rating_sum": 0.0,
+        "rating_count": 0,
+        "rating_histogram": {},
+        "top_positive": [],
+        "top_negative": [],
+        "scoring": {"texts": 0, "unique": 0, "cache_hits": 0, "scored": 0, "score_ms": 0.0},
+    }
+
+def _summarize_reviews(reviews: pd.DataFrame, scoring_info: dict) -> dict:
+    numeric = pd.to_numeric(reviews['rating'], errors='coerce').dropna()
+    samples = reviews[['rating', 'review_text', 'sentiment']]
+    return {
+        "reviews": len(reviews),
+        "sentiment_sum": float(reviews['sentiment'].sum()),
+        "rating_sum": float(numeric.sum()),
+        "rating_count": int(len(numeric)),
+        "rating_histogram": {str(k): int(v) for k, v in reviews['rating'].astype(str).value_counts().items()},
+        "top_positive": samples.nlargest(SENTIMENT_TOP_SAMPLES, 'sentiment').to_dict(orient='records'),
+        "top_negative": samples.nsmallest(SENTIMENT_TOP_SAMPLES, 'sentiment').to_dict(orient='records'),
+        "scoring": {k: scoring_info[k] for k in ("texts", "unique", "cache_hits", "scored", "score_ms")},
+    }
+
+def merge_sentiment_summary(summary: dict, partial: dict) -> dict:
+    """把一块的汇总并入累计汇总（就地修改）；精选样本只保留前 SENTIMENT_TOP_SAMPLES 条"""
+    for key in ("reviews", "sentiment_sum", "rating_sum", "rating_count"):
+        summary[key] += partial[key]
+    for rating, count in partial["rating_histogram"].items():
+        summary["rating_histogram"][rating] = summary["rating_histogram"].get(rating, 0) + count
+    for key, reverse in (("top_positive", True), ("top_negative", False)):
+        merged = sorted(summary[key] + partial[key], key=lambda r: r['sentiment'], reverse=reverse)
+        summary[key] = merged[:SENTIMENT_TOP_SAMPLES]
+    for key, value in partial["scoring"].items():
+        summary["scoring"][key] += value
+    return summary
+
+def finalize_sentiment_summary(summary: dict, engine: str) -> dict:
+    n = summary["reviews"]
+    return {
+        "event": "summary",
+        "reviews": n,
+        "average_sentiment": summary["sentiment_sum"] / n if n else None,
+        "average_rating": summary["rating_sum"] / summary["rating_count"] if summary["rating_count"] else None,
+        "rating_histogram": dict(sorted(summary["rating_histogram"].items())),
+        "top_positive": summary["top_positive"],
+        "top_negative": summary["top_negative"],
+        "scoring": {"engine": engine, **summary["scoring"], "score_ms": round(summary["scoring"]["score_ms"], 2)},
+    }
+
+def score_review_chunk(chunk: pd.DataFrame, review_column_name: str, engine: str = "vader") -> tuple[bytes, dict]:
+    """在分析子进程中为一块评论打分，返回 (该块的 NDJSON 评论行, 该块的汇总指标)"""
+    if review_column_name not in chunk.columns:
+        raise ValueError(f"错误: 评论数据块中缺少文本列 {review_column_name}。")
+    if 'rating' in chunk.columns:
+        chunk['rating'] = _numeric_ratings(chunk['rating'])
+    reviews, scoring_info = _score_reviews(chunk, review_column_name, engine)
+    return ndjson_records(reviews, event="review"), _summarize_reviews(reviews, scoring_info)
+
+# ==============================================================================
+# 分析任务流水线（在 job_engine 的子进程中执行，必须是模块级函数）
+# ==============================================================================
+
+def _read_upload(source: UploadSource, reader) -> pd.DataFrame:
+    try:
+        return reader(source)
+    finally:
+        source.discard()
+
+def _load_sales_source(source) -> pd.DataFrame:
+    """
+    source 可以是：已清洗入库的 dataset_id（内存映射读取）、已落盘的上传文件（按需列投影解析）、
+    或者已经解析好的原始 DataFrame。
+    """
+    if isinstance(source, str):
+        return load_dataset(source, kind="sales")
+    if isinstance(source, UploadSource):
+        source = _read_upload(source, read_sales_upload)
+    return clean_sales_data(source)
+
+def _load_reviews_source(source) -> pd.DataFrame:
+    if isinstance(source, str):
+        return load_dataset(source, kind="reviews")
+    if isinstance(source, UploadSource):
+        return _read_upload(source, read_reviews_upload)
+    return source
+
+def run_ingest_pipeline(source: UploadSource, dataset_id: str) -> dict:
+    """解析 + 清洗（仅销售数据，同时计入共现索引）并持久化为可内存映射的数据集"""
+    if dataset_id.startswith("sales-"):
+        df = _load_sales_source(source)
+        update_basket_index(df)
+    else:
+        df = _load_reviews_source(source)
+    return save_dataset(df, dataset_id, filename=source.filename)
+
+def run_forecast_pipeline(source, engine: str = "lstm", forecast_mode: str = "recursive") -> str:
+    """清洗 + 销售预测，返回 Plotly Figure 的 JSON 字符串"""
+    cleaned_df = _load_sales_source(source)
+    engine_options = {"forecast_mode": forecast_mode} if engine == "lstm" else {}
+    return perform_sales_forecast(cleaned_df, engine=engine, **engine_options).to_json()
+
+def run_batch_forecast_pipeline(source, group_by: str = "Category", top_n: int = 50) -> dict:
+    """清洗 + 按品类 / SKU 批量预测"""
+    return perform_batch_forecast(_load_sales_source(source), group_by=group_by, top_n=top_n)
+
+def run_clustering_pipeline(source, n_clusters: Optional[int] = None, k_selection: str = "silhouette",
+                            clustering_mode: str = "top_n", cluster_model: str = "auto") -> dict:
+    """清洗 + 产品聚类 + 购物篮分析（并增量更新共现索引）"""
+    cleaned_df = _load_sales_source(source)
+    return {
+        "clustering_results": perform_product_clustering(cleaned_df, n_clusters=n_clusters, k_selection=k_selection,
+                                                         clustering_mode=clustering_mode, cluster_model=cluster_model,
+                                                         as_frames=True),
+        "basket_analysis_results": perform_basket_analysis(cleaned_df),
+        # 只把本次上传中新出现的订单累加进共现索引
+        "basket_index": update_basket_index(cleaned_df)
+    }
+
+def run_sentiment_pipeline(source, engine: str = "vader") -> dict:
+    """评论情感分析"""
+    return perform_sentiment_analysis(_load_reviews_source(source), as_frames=True, engine=engine)
+
 # ==============================================================================
 # Final Report Generation 模块
 # ==============================================================================
@@ -720,11 +1570,11 @@ def generate_final_html_report(
     action_plan_html = md_converter.convert(action_plan)
     sentiment_report_html = md_converter.convert(sentiment_report) if sentiment_report else ""
 
+    # 图表 JSON 以字典补丁覆盖主题后直接生成 Plotly.newPlot 片段，不再经过 go.Figure 重新校验
     forecast_chart_html = ""
     if forecast_chart_json:
         try:
-            fig = go.Figure(json.loads(forecast_chart_json))
-            forecast_chart_html = fig.to_html(full_html=False, include_plotlyjs='cdn')
+            forecast_chart_html = figure_html(patch_figure(forecast_chart_json, {}))
         except Exception:
             forecast_chart_html = "<p><i>销售预测图表生成失败。</i></p>"
     
@@ -732,14 +1582,13 @@ def generate_final_html_report(
     elbow_chart_html = ""
     if elbow_chart_json:
         try:
-            fig = go.Figure(json.loads(elbow_chart_json))
-            fig.update_layout(
+            fig = patch_figure(elbow_chart_json, dict(
                 template='plotly_white',
                 paper_bgcolor="#ffffff",
                 plot_bgcolor="#ffffff",
                 font=dict(color="#111827")
-            )
-            elbow_chart_html = fig.to_html(full_html=False, include_plotlyjs='cdn')
+            ))
+            elbow_chart_html = figure_html(fig)
         except Exception:
             elbow_chart_html = "<p><i>手肘法图表生成失败。</i></p>"
     
@@ -747,37 +1596,26 @@ def generate_final_html_report(
     scatter_3d_chart_html = ""
     if scatter_3d_chart_json:
         try:
-            fig = go.Figure(json.loads(scatter_3d_chart_json))
             # 覆盖模板和颜色，确保不受 plotly_dark 影响
-            fig.update_layout(template='plotly_white')
-            fig.layout.template = 'plotly_white'  # 再次显式指定
-            fig.update_layout(
+            axis_style = dict(
+                backgroundcolor="#ffffff",
+                gridcolor="#e5e7eb",
+                zerolinecolor="#9ca3af",
+                showbackground=True
+            )
+            fig = patch_figure(scatter_3d_chart_json, dict(
+                template='plotly_white',
                 paper_bgcolor="#ffffff",
                 plot_bgcolor="#ffffff",
                 font=dict(color="#111827"),
                 scene=dict(
                     bgcolor="#ffffff",
-                    xaxis=dict(
-                        backgroundcolor="#ffffff",
-                        gridcolor="#e5e7eb",
-                        zerolinecolor="#9ca3af",
-                        showbackground=True
-                    ),
-                    yaxis=dict(
-                        backgroundcolor="#ffffff",
-                        gridcolor="#e5e7eb",
-                        zerolinecolor="#9ca3af",
-                        showbackground=True
-                    ),
-                    zaxis=dict(
-                        backgroundcolor="#ffffff",
-                        gridcolor="#e5e7eb",
-                        zerolinecolor="#9ca3af",
-                        showbackground=True
-                    ),
+                    xaxis=dict(axis_style),
+                    yaxis=dict(axis_style),
+                    zaxis=dict(axis_style),
                 ),
-            )
-            scatter_3d_chart_html = fig.to_html(full_html=False, include_plotlyjs='cdn')
+            ))
+            scatter_3d_chart_html = figure_html(fig)
         except Exception:
             scatter_3d_chart_html = "<p><i>3D聚类图表生成失败。</i></p>"
 
@@ -820,6 +1658,7 @@ def generate_final_html_report(
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <title>WeaveAI 综合分析报告</title>
         {css_styles}
+        {plotly_cdn_script() if (forecast_chart_html or elbow_chart_html or scatter_3d_chart_html) else ''}
     </head>
     <body>
         <div class="container">
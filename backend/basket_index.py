@@ -0,0 +1,208 @@
+# backend/basket_index.py
+
+"""
+增量共现索引：持久化每个 SKU 的订单数与每对 SKU 的共同出现次数（稀疏上三角矩阵），
+以及已计入的订单 ID 指纹。每次上传只把「之前没见过的订单」累加进索引，
+成对关联规则（support / confidence / lift）直接由计数算出，无需重新运行 FP-Growth。
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+DATA_DIR = Path(os.getenv("WEAVEAI_DATA_DIR", "data"))
+BASKET_INDEX_DIR = DATA_DIR / "basket_index"
+INDEX_PATH = BASKET_INDEX_DIR / "index.npz"
+LOCK_PATH = BASKET_INDEX_DIR / "index.lock"
+
+try:
+    import fcntl
+
+    def _lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+except ImportError:  # Windows
+    import msvcrt
+
+    def _lock_file(f):
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+
+@contextmanager
+def _index_lock():
+    """跨进程互斥：多个分析子进程可能同时更新索引"""
+    BASKET_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    with open(LOCK_PATH, "a+b") as f:
+        _lock_file(f)
+        yield  # 文件关闭时锁自动释放
+
+
+def _empty_index() -> dict:
+    return {
+        "items": np.array([], dtype=str),
+        "item_counts": np.zeros(0, dtype=np.int64),
+        "pairs": sparse.csr_matrix((0, 0), dtype=np.int64),
+        "seen_orders": np.zeros(0, dtype=np.uint64),
+        "n_orders": 0,
+        "updated_at": None,
+    }
+
+
+def _read_index() -> dict:
+    if not INDEX_PATH.exists():
+        return _empty_index()
+    with np.load(INDEX_PATH, allow_pickle=False) as data:
+        n_items = len(data["items"])
+        meta = json.loads(str(data["meta"]))
+        return {
+            "items": data["items"],
+            "item_counts": data["item_counts"],
+            "pairs": sparse.csr_matrix(
+                (data["pair_counts"], (data["pair_rows"], data["pair_cols"])),
+                shape=(n_items, n_items),
+            ),
+            "seen_orders": data["seen_orders"],
+            "n_orders": meta["n_orders"],
+            "updated_at": meta["updated_at"],
+        }
+
+
+def _write_index(index: dict):
+    pairs = index["pairs"].tocoo()
+    tmp_path = BASKET_INDEX_DIR / f"index.{os.getpid()}.tmp.npz"
+    np.savez(
+        tmp_path,
+        items=index["items"],
+        item_counts=index["item_counts"],
+        pair_rows=pairs.row.astype(np.int32),
+        pair_cols=pairs.col.astype(np.int32),
+        pair_counts=pairs.data.astype(np.int64),
+        seen_orders=index["seen_orders"],
+        meta=np.array(json.dumps({"n_orders": index["n_orders"], "updated_at": index["updated_at"]})),
+    )
+    os.replace(tmp_path, INDEX_PATH)
+
+
+def _order_fingerprints(order_ids: pd.Series) -> np.ndarray:
+    return pd.util.hash_array(order_ids.astype(str).to_numpy(dtype=object))
+
+
+def update_basket_index(df: pd.DataFrame) -> dict:
+    """
+    把 df 中尚未计入索引的订单累加进去；已见过的订单 ID 整单跳过（同一订单不会被重复计数）。
+    返回本次更新的摘要。
+    """
+    lines = df.loc[df['Qty'] > 0, ['Order ID', 'SKU']]
+    with _index_lock():
+        index = _read_index()
+        fingerprints = _order_fingerprints(lines['Order ID'])
+        is_new = ~np.isin(fingerprints, index["seen_orders"])
+        lines, fingerprints = lines[is_new], fingerprints[is_new]
+        if lines.empty:
+            return {"new_orders": 0, **index_summary(index)}
+
+        # 新出现的 SKU 追加到列表末尾，已有 SKU 的列号保持不变
+        item_positions = {sku: i for i, sku in enumerate(index["items"])}
+        skus = lines['SKU'].astype(str).to_numpy()
+        new_items = pd.unique(skus[~np.isin(skus, index["items"])])
+        for sku in new_items:
+            item_positions[sku] = len(item_positions)
+        n_items = len(item_positions)
+
+        order_codes, new_orders = pd.factorize(fingerprints)
+        sku_codes = np.fromiter((item_positions[s] for s in skus), dtype=np.int64, count=len(skus))
+        baskets = sparse.csr_matrix(
+            (np.ones(len(skus), dtype=np.int64), (order_codes, sku_codes)),
+            shape=(len(new_orders), n_items),
+        )
+        baskets.sum_duplicates()
+        baskets.data[:] = 1
+
+        # 订单 x SKU 的 0/1 矩阵 X：XᵀX 的对角线是单品订单数，上三角是成对共现次数
+        co_occurrence = (baskets.T @ baskets).tocsr()
+        pairs = index["pairs"]
+        pairs.resize((n_items, n_items))
+        index.update({
+            "items": np.concatenate([index["items"], np.asarray(new_items, dtype=str)]) if len(new_items) else index["items"],
+            "item_counts": np.pad(index["item_counts"], (0, len(new_items))) + np.asarray(co_occurrence.diagonal(), dtype=np.int64),
+            "pairs": (pairs + sparse.triu(co_occurrence, k=1)).tocsr(),
+            "seen_orders": np.union1d(index["seen_orders"], new_orders.astype(np.uint64)),
+            "n_orders": index["n_orders"] + len(new_orders),
+            "updated_at": time.time(),
+        })
+        _write_index(index)
+    _cache.clear()
+    return {"new_orders": int(len(new_orders)), **index_summary(index)}
+
+
+def index_summary(index: dict) -> dict:
+    return {
+        "total_orders": int(index["n_orders"]),
+        "items": int(len(index["items"])),
+        "pairs": int(index["pairs"].nnz),
+        "updated_at": index["updated_at"],
+    }
+
+
+# 查询侧缓存：索引文件未变化时直接复用已加载的计数
+_cache: dict = {}
+
+
+def load_basket_index() -> dict:
+    mtime = INDEX_PATH.stat().st_mtime_ns if INDEX_PATH.exists() else None
+    if _cache.get("mtime") != mtime or "index" not in _cache:
+        _cache.update(mtime=mtime, index=_read_index())
+    return _cache["index"]
+
+
+def query_pair_rules(sku: Optional[str] = None, min_support: float = 0.02, min_confidence: float = 0.0,
+                     min_lift: float = 1.05, top_n: int = 20) -> list:
+    """
+    由共现计数计算成对规则 A -> B（两个方向都会给出），按 lift 降序返回前 top_n 条。
+    指定 sku 时只返回以该 SKU 为前件的规则。输出格式与 perform_basket_analysis 相同。
+    """
+    index = load_basket_index()
+    n_orders = index["n_orders"]
+    if n_orders == 0 or index["pairs"].nnz == 0:
+        return []
+
+    pairs = index["pairs"].tocoo()
+    # 上三角只存一次，展开成两个方向
+    antecedents = np.concatenate([pairs.row, pairs.col])
+    consequents = np.concatenate([pairs.col, pairs.row])
+    both = np.concatenate([pairs.data, pairs.data]).astype(float)
+    counts = index["item_counts"].astype(float)
+
+    support = both / n_orders
+    confidence = both / counts[antecedents]
+    lift = confidence / (counts[consequents] / n_orders)
+    keep = (support >= min_support) & (confidence >= min_confidence) & (lift >= min_lift)
+    if sku is not None:
+        matches = np.flatnonzero(index["items"] == sku)
+        if len(matches) == 0:
+            return []
+        keep &= antecedents == matches[0]
+
+    selected = np.flatnonzero(keep)
+    selected = selected[np.argsort(-lift[selected], kind='stable')[:top_n]]
+    items = index["items"]
+    return [
+        {
+            "antecedents": str(items[antecedents[i]]),
+            "consequents": str(items[consequents[i]]),
+            "support": f"{support[i]:.2%}",
+            "confidence": f"{confidence[i]:.2%}",
+            "lift": f"{lift[i]:.2f}",
+        }
+        for i in selected
+    ]
+
+
+def get_basket_index_info() -> dict:
+    return index_summary(load_basket_index())
@@ -0,0 +1,145 @@
+# backend/basket_mining.py
+
+"""
+并行分区 FP-Growth：按「项前缀」把频繁项集挖掘拆成互不重叠的条件模式库，分发到进程池并合并结果。
+
+把频繁 SKU 按订单数从少到多排序后，每个频繁项集都由其中「最不频繁的那个 SKU」唯一归属：
+以 SKU i 结尾的全部项集，只需在「包含 i 的订单、并且只保留比 i 更频繁的 SKU」这一条件库中挖掘。
+各分区之间没有交集，合并后的频繁项集（及支持度）与在整个交易矩阵上直接运行 fpgrowth 完全一致。
+交易矩阵的索引只落盘一次，子进程以内存映射方式读取并自行切出分到的条件库。
+"""
+
+import math
+import os
+import tempfile
+import warnings
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from mlxtend.frequent_patterns import fpgrowth
+from scipy import sparse
+
+from job_engine import NestedPool, nested_workers
+
+# 交易矩阵非零元素少于该值时直接单进程挖掘，进程启动与数据序列化的开销不值得
+PARALLEL_MIN_NNZ = 200_000
+# 每个进程分到的分区批次数，批次越多负载越均衡
+BATCHES_PER_WORKER = 4
+
+
+# 二级进程池：spawn 出的子进程只导入本模块，不会加载 TensorFlow；空闲超时后自动关闭
+_pool = NestedPool()
+
+
+def _fpgrowth_counts(matrix: sparse.csr_matrix, min_count: int) -> list:
+    """在交易矩阵上运行 fpgrowth，返回 [(列号元组, 订单数)]"""
+    n_rows = matrix.shape[0]
+    if matrix.shape[1] == 0 or matrix.nnz == 0 or n_rows < min_count:
+        return []
+    with warnings.catch_warnings():
+        # from_spmatrix 对布尔矩阵使用 fill_value=0，pandas 会提示 FutureWarning，结果不受影响
+        warnings.simplefilter('ignore', FutureWarning)
+        frame = pd.DataFrame.sparse.from_spmatrix(matrix, columns=range(matrix.shape[1]))
+    # fpgrowth 内部按 ceil(min_support * 行数) 取整，减去 0.5 保证阈值恰好落在 min_count 上
+    itemsets = fpgrowth(frame, min_support=(min_count - 0.5) / n_rows, use_colnames=True)
+    counts = np.rint(itemsets['support'].to_numpy() * n_rows).astype(np.int64)
+    return [(tuple(s), int(c)) for s, c in zip(itemsets['itemsets'], counts)]
+
+
+def _save_base(matrix: sparse.csr_matrix, directory: str):
+    """把交易矩阵的 CSR / CSC 索引写成 .npy，子进程以内存映射方式读取（布尔矩阵不需要 data 数组）"""
+    csc = matrix.tocsc()
+    for name, array in (("row_ptr", matrix.indptr), ("row_idx", matrix.indices),
+                        ("col_ptr", csc.indptr), ("col_idx", csc.indices)):
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+
+
+def _load_base(directory: str) -> dict:
+    return {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            for name in ("row_ptr", "row_idx", "col_ptr", "col_idx")}
+
+
+def _conditional(base: dict, rank_of: np.ndarray, order: np.ndarray, rank: int) -> sparse.csr_matrix:
+    """
+    以 order[rank] 为前缀的条件库：包含该列的订单，只保留排名更高（更频繁）的列，
+    列号为 order[rank + 1:] 中的位置。
+    """
+    col = order[rank]
+    rows = np.asarray(base["col_idx"][base["col_ptr"][col]:base["col_ptr"][col + 1]])
+    starts = np.asarray(base["row_ptr"][rows])
+    lengths = np.asarray(base["row_ptr"][rows + 1]) - starts
+    # 把各订单的列号区间拼接成一个下标数组，一次性从映射文件中取出
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    cols = np.asarray(base["row_idx"][offsets])
+    local = rank_of[cols] - (rank + 1)
+    keep = local >= 0
+    row_ids = np.repeat(np.arange(len(rows)), lengths)[keep]
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(row_ids, minlength=len(rows)))))
+    return sparse.csr_matrix((np.ones(keep.sum(), dtype=bool), local[keep], indptr),
+                             shape=(len(rows), len(order) - rank - 1))
+
+
+def _mine_partitions(base_dir: str, order: np.ndarray, n_cols: int, ranks: list, min_count: int) -> list:
+    """
+    在子进程中按需构建 ranks 对应的条件库并挖掘，
+    返回这些分区中所有以前缀结尾的频繁项集 [(全局列号元组, 订单数)]
+    """
+    base = _load_base(base_dir)
+    rank_of = np.full(n_cols, -1, dtype=np.int64)
+    rank_of[order] = np.arange(len(order))
+    results = []
+    for rank in ranks:
+        prefix, higher = int(order[rank]), order[rank + 1:]
+        conditional = _conditional(base, rank_of, order, rank)
+        results.append(((prefix,), conditional.shape[0]))
+        for local_items, count in _fpgrowth_counts(conditional, min_count):
+            results.append((tuple(int(higher[i]) for i in local_items) + (prefix,), count))
+    return results
+
+
+def _batch_ranks(costs: np.ndarray, n_batches: int) -> list:
+    """按估计的条件库大小做贪心装箱，使各批次的挖掘量大致相等"""
+    batches = [[] for _ in range(n_batches)]
+    loads = np.zeros(n_batches)
+    for rank in np.argsort(-costs, kind='stable'):
+        i = int(np.argmin(loads))
+        batches[i].append(int(rank))
+        loads[i] += costs[rank] + 1
+    return [b for b in batches if b]
+
+
+def mine_frequent_itemsets(matrix: sparse.csr_matrix, items: list, min_support: float,
+                           workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    挖掘频繁项集，返回与 mlxtend fpgrowth(use_colnames=True) 相同格式的 DataFrame（support, itemsets）。
+    workers 默认取 WEAVEAI_FPGROWTH_WORKERS 或按分析进程数均分的 CPU 核数；数据量较小或只有一个进程时直接单进程运行。
+    """
+    n_orders = matrix.shape[0]
+    if n_orders == 0 or matrix.shape[1] == 0:
+        return pd.DataFrame(columns=['support', 'itemsets'])
+    min_count = math.ceil(min_support * n_orders)
+    workers = workers or nested_workers("WEAVEAI_FPGROWTH_WORKERS")
+
+    if workers <= 1 or matrix.nnz < PARALLEL_MIN_NNZ:
+        counts = _fpgrowth_counts(matrix, min_count)
+    else:
+        support_counts = np.bincount(matrix.indices, minlength=matrix.shape[1])
+        frequent = np.flatnonzero(support_counts >= min_count)
+        order = frequent[np.argsort(support_counts[frequent], kind='stable')]
+        # 条件库大小估计：包含前缀的订单数 × 平均订单长度 × 排名更高的列所占比例
+        mean_length = matrix.nnz / n_orders
+        costs = support_counts[order] * mean_length * (len(order) - 1 - np.arange(len(order))) / max(len(order), 1)
+        batches = _batch_ranks(costs, workers * BATCHES_PER_WORKER)
+        # 交易矩阵只落盘一次，各子进程内存映射读取并自行切出条件库，主进程不持有全部条件库
+        with tempfile.TemporaryDirectory(prefix="weaveai-fpgrowth-") as base_dir, _pool.acquire(workers) as pool:
+            _save_base(matrix, base_dir)
+            futures = [pool.submit(_mine_partitions, base_dir, order, matrix.shape[1], batch, min_count)
+                       for batch in batches]
+            counts = [itemset for future in futures for itemset in future.result()]
+
+    names = np.asarray(items, dtype=object)
+    return pd.DataFrame({
+        'support': np.array([c for _, c in counts], dtype=float) / n_orders,
+        'itemsets': [frozenset(names[list(cols)]) for cols, _ in counts],
+    })
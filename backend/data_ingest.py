@@ -0,0 +1,205 @@
+# backend/data_ingest.py
+
+"""
+上传文件的流式落盘与按需列投影解析。
+上传内容按块写入临时文件（同时计算内容哈希），解析在分析子进程中进行，
+并且只读取目标分析真正需要的列，峰值内存与所需列的大小成正比，而不是与整个文件成正比。
+"""
+
+import asyncio
+import csv
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+DATA_DIR = Path(os.getenv("WEAVEAI_DATA_DIR", "data"))
+UPLOADS_DIR = DATA_DIR / "uploads"
+
+UPLOAD_CHUNK_SIZE = 1 << 20          # 每次从请求体读取 1MB
+CSV_BLOCK_SIZE = 4 << 20             # pyarrow 流式 CSV 解析的块大小
+
+# 销售数据：clean_sales_data 所需列及其别名
+SALES_COLUMN_ALIASES = {'Total Sales': 'Amount', 'Product': 'SKU', 'Quantity': 'Qty', 'Order_ID': 'Order ID'}
+SALES_REQUIRED_COLUMNS = ["Amount", "Category", "Date", "Status", "SKU", "Order ID", "Qty"]
+# clean_sales_data 保留的订单状态
+VALID_ORDER_STATUSES = ["Shipped", "Shipped - Delivered to Buyer", "Completed", "Pending", "Cancelled"]
+# 这些列按字符串读取，日期解析与数值转换交给 clean_sales_data
+SALES_STRING_COLUMNS = {"Category", "Date", "Status", "SKU", "Order ID", "Product", "Order_ID"}
+
+# 评论数据：按列名识别候选评论列，另外保留已有的 rating 列
+REVIEW_PRIORITY_COLUMNS = ['reviews.text', 'review_text', 'content', 'comment', 'review']
+REVIEW_COLUMN_KEYWORDS = ['text', 'review', 'content', 'comment']
+
+
+@dataclass
+class UploadSource:
+    """已落盘、尚未解析的上传文件；在分析子进程中被读取后删除"""
+    path: str
+    filename: str
+
+    def discard(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _copy_upload(src, dst) -> str:
+    """同步地按块复制上传内容并计算 sha256（在线程池中执行）"""
+    digest = hashlib.sha256()
+    while chunk := src.read(UPLOAD_CHUNK_SIZE):
+        digest.update(chunk)
+        dst.write(chunk)
+    return digest.hexdigest()
+
+
+async def spool_upload(file, suffix: str) -> tuple[UploadSource, str]:
+    """
+    把上传内容按块写入临时文件，返回 (UploadSource, sha256 摘要)。
+    直接读取 UploadFile 底层的同步文件对象，复制与哈希都在线程池中完成，大文件落盘时不阻塞事件循环。
+    """
+    UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=UPLOADS_DIR, suffix=suffix, delete=False) as tmp:
+        try:
+            digest = await asyncio.to_thread(_copy_upload, file.file, tmp)
+        except BaseException:
+            # 请求被取消时线程可能仍在写入：文件已被删除，剩余写入落在匿名 inode 上随关闭释放
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+    return UploadSource(path=tmp.name, filename=file.filename or ""), digest
+
+
+def read_header(path: str, filename: str) -> list:
+    """只读取表头（CSV 首行 / Parquet schema），不解析数据"""
+    if filename.endswith('.parquet'):
+        return pq.read_schema(path).names
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def sales_projection(header: list) -> list:
+    wanted = set(SALES_REQUIRED_COLUMNS) | set(SALES_COLUMN_ALIASES)
+    return [c for c in header if c in wanted]
+
+
+def review_projection(header: list) -> Optional[list]:
+    """按列名挑出可能的评论列；一个都匹配不上时返回 None（读取全部列，交给内容探测）"""
+    candidates = [c for c in header
+                  if c in REVIEW_PRIORITY_COLUMNS
+                  or any(key in str(c).lower() for key in REVIEW_COLUMN_KEYWORDS)]
+    if not candidates:
+        return None
+    if 'rating' in header:
+        candidates.append('rating')
+    return candidates
+
+
+def read_table_projected(path: str, filename: str, columns: Optional[list],
+                         string_columns: set = frozenset()) -> pd.DataFrame:
+    """读取 CSV / Parquet 中的指定列；columns 为 None 时读取全部列"""
+    if filename.endswith('.parquet'):
+        table = pq.read_table(path, columns=columns)
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+
+    convert_options = pacsv.ConvertOptions(
+        include_columns=columns or [],
+        column_types={c: pa.string() for c in string_columns if columns is None or c in columns},
+        strings_can_be_null=True,
+    )
+    try:
+        reader = pacsv.open_csv(
+            path,
+            read_options=pacsv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+            convert_options=convert_options,
+        )
+        table = pa.Table.from_batches(list(reader), schema=reader.schema)
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+    except (pa.ArrowInvalid, UnicodeDecodeError):
+        # 后续数据块与首块推断的类型不一致（如数值列中混入文本）时，退回 pandas 分块读取
+        chunks = pd.read_csv(path, usecols=columns, chunksize=200_000,
+                             dtype={c: str for c in string_columns if columns is None or c in columns})
+        return pd.concat(chunks, ignore_index=True)
+
+
+def _value_type(arrow_type: pa.DataType) -> pa.DataType:
+    return arrow_type.value_type if pa.types.is_dictionary(arrow_type) else arrow_type
+
+
+def sales_parquet_filter(schema: pa.Schema) -> Optional[ds.Expression]:
+    """
+    把 clean_sales_data 中的行过滤条件（订单状态白名单 + 关键列非空）转换为 pyarrow 表达式，
+    扫描 Parquet 时下推到 row group 级别，统计信息表明整组不满足条件时直接跳过解码。
+    """
+    names = set(schema.names)
+    conditions = []
+    if "Status" in names and pa.types.is_string(_value_type(schema.field("Status").type)):
+        conditions.append(pc.field("Status").isin(VALID_ORDER_STATUSES))
+    for col in SALES_REQUIRED_COLUMNS:
+        # 别名列与标准列二选一，按文件中实际存在的列名下推非空条件
+        actual = next((old for old, new in SALES_COLUMN_ALIASES.items() if new == col and old in names), col)
+        if actual in names and col != "Status":
+            conditions.append(pc.field(actual).is_valid())
+    if not conditions:
+        return None
+    expr = conditions[0]
+    for cond in conditions[1:]:
+        expr = expr & cond
+    return expr
+
+
+def read_sales_parquet(path: str) -> pd.DataFrame:
+    """Parquet 销售数据：列投影 + 谓词下推，只解码满足条件的 row group 与所需列"""
+    dataset = ds.dataset(path, format="parquet")
+    columns = sales_projection(dataset.schema.names)
+    table = dataset.to_table(columns=columns, filter=sales_parquet_filter(dataset.schema))
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def read_sales_upload(source: UploadSource) -> pd.DataFrame:
+    """读取销售数据上传文件，只保留 clean_sales_data 需要的列"""
+    if source.filename.endswith('.parquet'):
+        return read_sales_parquet(source.path)
+    columns = sales_projection(read_header(source.path, source.filename))
+    return read_table_projected(source.path, source.filename, columns, SALES_STRING_COLUMNS)
+
+
+def read_reviews_upload(source: UploadSource) -> pd.DataFrame:
+    """读取评论数据上传文件，只保留候选评论列与 rating 列"""
+    columns = review_projection(read_header(source.path, source.filename))
+    string_columns = set(columns or []) - {'rating'}
+    return read_table_projected(source.path, source.filename, columns, string_columns)
+
+
+def iter_reviews_upload(source: UploadSource, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    按块读取评论上传文件（列投影同 read_reviews_upload），每块最多 chunk_rows 行。
+    CSV 的所有列都按字符串读取：流式解析无法在后续数据块类型不一致时回退，rating 由调用方再转换为数值。
+    """
+    header = read_header(source.path, source.filename)
+    columns = review_projection(header)
+    if source.filename.endswith('.parquet'):
+        batches = pq.ParquetFile(source.path).iter_batches(batch_size=chunk_rows, columns=columns)
+    else:
+        batches = pacsv.open_csv(
+            source.path,
+            read_options=pacsv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+            convert_options=pacsv.ConvertOptions(
+                include_columns=columns or [],
+                column_types={c: pa.string() for c in (columns or header)},
+                strings_can_be_null=True,
+            ),
+        )
+    for batch in batches:
+        for offset in range(0, batch.num_rows, chunk_rows):
+            yield batch.slice(offset, chunk_rows).to_pandas()
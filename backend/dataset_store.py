@@ -0,0 +1,243 @@
+# backend/dataset_store.py
+
+"""
+数据集注册表：上传一次、清洗一次，之后所有分析接口通过 dataset_id 复用。
+清洗后的数据以未压缩的 Arrow IPC（Feather V2）格式按内容哈希落盘，读取时直接内存映射。
+每次读取都会刷新文件的修改时间作为最近使用时间；写入新文件后按最近使用时间淘汰：
+超过 WEAVEAI_DATASET_TTL_DAYS 天（默认 30）未使用的文件，以及总大小超过上限时最久未使用的文件。
+"""
+
+import json
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+
+DATA_DIR = Path(os.getenv("WEAVEAI_DATA_DIR", "data"))
+DATASETS_DIR = DATA_DIR / "datasets"
+
+# sales: 已经过 clean_sales_data 清洗的销售数据；reviews: 原始评论数据
+DATASET_KINDS = ("sales", "reviews")
+
+_DATASET_ID_RE = re.compile(r"^(sales|reviews)-[0-9a-f]{32}$")
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+# ==============================================================================
+# 按最近使用时间淘汰（文件 mtime 即最近使用时间）
+# ==============================================================================
+
+def touch_entry(path: Path):
+    """把文件或目录的 mtime 刷新为当前时间（记为最近使用）"""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def _entry_size(path: Path) -> int:
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+    return path.stat().st_size
+
+
+def evict_entries(directory: Path, max_bytes: float, ttl_days: float, pattern: str = "*.arrow",
+                  companions: tuple = ()):
+    """
+    删除 directory 下匹配 pattern 的条目（文件或目录）中超过 ttl_days 天未使用的，
+    并在总大小超过 max_bytes 时从最久未使用的开始删除（连同同名的附属文件）。最近写入 / 使用的条目始终保留。
+    """
+    entries = []
+    for path in directory.glob(pattern):
+        if ".tmp" in path.name:
+            continue
+        try:
+            entries.append((path.stat().st_mtime, _entry_size(path), path))
+        except FileNotFoundError:
+            continue
+    entries.sort()
+    expire_before = time.time() - ttl_days * 86400
+    total = sum(size for _, size, _ in entries)
+    for used_at, size, path in entries[:-1]:
+        if used_at >= expire_before and total <= max_bytes:
+            break
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+        for suffix in companions:
+            path.with_suffix(suffix).unlink(missing_ok=True)
+        total -= size
+
+
+def _dataset_ttl_days() -> float:
+    return _env_number("WEAVEAI_DATASET_TTL_DAYS", 30)
+
+
+def make_dataset_id(kind: str, digest: str) -> str:
+    """由数据类型与原始文件内容的 sha256 摘要生成 dataset_id"""
+    if kind not in DATASET_KINDS:
+        raise ValueError(f"未知的数据集类型: {kind}，可选值为 {list(DATASET_KINDS)}")
+    return f"{kind}-{digest[:32]}"
+
+
+def _paths(dataset_id: str) -> tuple[Path, Path]:
+    if not _DATASET_ID_RE.fullmatch(dataset_id or ""):
+        raise ValueError(f"无效的 dataset_id: {dataset_id}")
+    return DATASETS_DIR / f"{dataset_id}.arrow", DATASETS_DIR / f"{dataset_id}.json"
+
+
+def get_dataset_info(dataset_id: str) -> Optional[dict]:
+    """返回数据集元信息；不存在时返回 None"""
+    data_path, meta_path = _paths(dataset_id)
+    if not (data_path.exists() and meta_path.exists()):
+        return None
+    touch_entry(data_path)
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def to_arrow_table(df: pd.DataFrame) -> pa.Table:
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        # 混合类型的 object 列（如数字与字符串混杂的 SKU）统一转为字符串，保留缺失值
+        df = df.copy()
+        for col in df.select_dtypes(include=["object"]).columns:
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def save_dataset(df: pd.DataFrame, dataset_id: str, filename: str = "") -> dict:
+    """持久化 DataFrame 并写入元信息，写入过程原子化，避免并发请求读到半个文件"""
+    data_path, meta_path = _paths(dataset_id)
+    DATASETS_DIR.mkdir(parents=True, exist_ok=True)
+
+    table = to_arrow_table(df)
+    tmp_path = data_path.with_suffix(f".{os.getpid()}.tmp")
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, data_path)
+
+    info = {
+        "dataset_id": dataset_id,
+        "kind": dataset_id.split("-", 1)[0],
+        "filename": filename,
+        "rows": table.num_rows,
+        "columns": table.column_names,
+        "size_bytes": data_path.stat().st_size,
+        "created_at": time.time(),
+    }
+    tmp_meta = meta_path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False)
+    os.replace(tmp_meta, meta_path)
+    evict_entries(DATASETS_DIR, _env_number("WEAVEAI_DATASET_STORE_MAX_GB", 20) * 1024 ** 3, _dataset_ttl_days(),
+                  companions=(".json",))
+    return info
+
+
+def delete_dataset(dataset_id: str) -> bool:
+    """删除数据集及其元信息；不存在时返回 False"""
+    data_path, meta_path = _paths(dataset_id)
+    existed = data_path.exists()
+    data_path.unlink(missing_ok=True)
+    meta_path.unlink(missing_ok=True)
+    return existed
+
+
+def load_dataset(dataset_id: str, columns: Optional[list] = None, kind: Optional[str] = None) -> pd.DataFrame:
+    """
+    内存映射读取数据集。指定 columns 时只有这些列的数据页会被实际读入。
+    """
+    info = get_dataset_info(dataset_id)
+    if info is None:
+        raise ValueError(f"数据集不存在或已被清理: {dataset_id}")
+    if kind and info["kind"] != kind:
+        raise ValueError(f"数据集 {dataset_id} 的类型为 {info['kind']}，此分析需要 {kind} 数据。")
+
+    data_path, _ = _paths(dataset_id)
+    # 不显式关闭映射：to_pandas 得到的数值列可能直接引用映射内存，随对象回收自动释放
+    source = pa.memory_map(str(data_path), "r")
+    table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select([c for c in columns if c in table.column_names])
+    return table.to_pandas()
+
+
+def iter_dataset(dataset_id: str, chunk_rows: int, columns: Optional[list] = None,
+                 kind: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """按块读取数据集（内存映射，逐个 record batch 切片），每块最多 chunk_rows 行"""
+    info = get_dataset_info(dataset_id)
+    if info is None:
+        raise ValueError(f"数据集不存在或已被清理: {dataset_id}")
+    if kind and info["kind"] != kind:
+        raise ValueError(f"数据集 {dataset_id} 的类型为 {info['kind']}，此分析需要 {kind} 数据。")
+
+    data_path, _ = _paths(dataset_id)
+    reader = pa.ipc.open_file(pa.memory_map(str(data_path), "r"))
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        if columns is not None:
+            batch = batch.select([c for c in columns if c in batch.schema.names])
+        for offset in range(0, batch.num_rows, chunk_rows):
+            yield batch.slice(offset, chunk_rows).to_pandas()
+
+
+# ==============================================================================
+# 聚类结果的完整商品点：响应里只放降采样后的点，完整表按需分页读取
+# ==============================================================================
+
+CLUSTER_POINTS_DIR = DATA_DIR / "cluster_points"
+_POINTS_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _points_path(points_id: str) -> Path:
+    if not _POINTS_ID_RE.fullmatch(points_id or ""):
+        raise ValueError(f"无效的 points_id: {points_id}")
+    return CLUSTER_POINTS_DIR / f"{points_id}.arrow"
+
+
+def save_cluster_points(df: pd.DataFrame, points_id: str):
+    """points_id 由内容哈希生成，相同的聚类结果只写一次"""
+    path = _points_path(points_id)
+    if path.exists():
+        touch_entry(path)
+        return
+    CLUSTER_POINTS_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    feather.write_feather(to_arrow_table(df), tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+    evict_entries(CLUSTER_POINTS_DIR, _env_number("WEAVEAI_CLUSTER_POINTS_MAX_GB", 2) * 1024 ** 3, _dataset_ttl_days())
+
+
+def read_cluster_points(points_id: str, offset: int = 0, limit: int = 1000,
+                        cluster: Optional[int] = None) -> Optional[dict]:
+    """内存映射读取一页商品点；不存在时返回 None"""
+    path = _points_path(points_id)
+    if not path.exists():
+        return None
+    touch_entry(path)
+    table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    if cluster is not None:
+        table = table.filter(pc.equal(table["cluster"], cluster))
+    page = table.slice(offset, limit)
+    return {
+        "points_id": points_id,
+        "total": table.num_rows,
+        "offset": offset,
+        "limit": limit,
+        "points": page.to_pylist(),
+    }
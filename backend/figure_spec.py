@@ -0,0 +1,158 @@
+# backend/figure_spec.py
+
+"""
+轻量 Plotly 图表规格构建器：直接拼装 {"data": [...], "layout": {...}} 字典并用 orjson 输出，
+不经过 plotly.graph_objects 的逐属性校验。
+  - 数值型 NumPy 数组编码为 plotly.js 的二进制类型数组 {"dtype": "f8", "bdata": <base64>}
+  - 日期数组输出为 ISO 字符串，其余数组（文本等）输出为普通列表
+  - layout.template 可以写模板名（如 'plotly_white'），输出时展开为完整模板（进程内缓存）
+报告阶段用 patch_figure 以字典深度合并的方式覆盖主题，用 figure_html 直接生成 Plotly.newPlot 片段。
+"""
+
+import base64
+import uuid
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+import orjson
+import pandas as pd
+
+# plotly.js 支持的类型数组；int64 / uint64 不在其中，需要先降级
+_TYPED_ARRAY_DTYPES = {
+    np.dtype(np.int8): "i1", np.dtype(np.uint8): "u1",
+    np.dtype(np.int16): "i2", np.dtype(np.uint16): "u2",
+    np.dtype(np.int32): "i4", np.dtype(np.uint32): "u4",
+    np.dtype(np.float32): "f4", np.dtype(np.float64): "f8",
+}
+
+
+@lru_cache(maxsize=None)
+def get_template(name: str) -> dict:
+    """把 plotly 内置模板名展开为模板字典（只在每个进程首次使用时构建一次）"""
+    import plotly.io as pio
+    return pio.templates[name].to_plotly_json()
+
+
+def _typed_array(values: np.ndarray):
+    if values.dtype.kind == "b":
+        values = values.astype(np.uint8)
+    elif values.dtype.kind in "iu" and values.dtype not in _TYPED_ARRAY_DTYPES:
+        # 64 位整数：取值范围放得进 int32 就降级，否则按 float64 输出
+        if len(values) == 0 or (values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max):
+            values = values.astype(np.int32)
+        else:
+            values = values.astype(np.float64)
+    elif values.dtype not in _TYPED_ARRAY_DTYPES:
+        values = values.astype(np.float64)  # float16 / 非本机字节序等
+    code = _TYPED_ARRAY_DTYPES[values.dtype]
+    # plotly.js 按小端序解码
+    data = np.ascontiguousarray(values).astype(values.dtype.newbyteorder("<"), copy=False).tobytes()
+    return {"dtype": code, "bdata": base64.b64encode(data).decode("ascii")}
+
+
+def encode_array(values):
+    """把 ndarray / Series / Index 转成 plotly.js 可直接读取的值"""
+    if isinstance(values, (pd.Series, pd.Index)):
+        if isinstance(values.dtype, pd.DatetimeTZDtype) or values.dtype.kind == "M":
+            return pd.DatetimeIndex(values).strftime("%Y-%m-%dT%H:%M:%S").tolist()
+        values = values.to_numpy()
+    if values.dtype.kind == "M":
+        return np.datetime_as_string(values, unit="s").tolist()
+    if values.dtype.kind in "biuf" and values.ndim == 1:
+        return _typed_array(values)
+    return values.tolist()
+
+
+def _encode(obj):
+    if isinstance(obj, dict):
+        return {key: _encode(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_encode(value) for value in obj]
+    if isinstance(obj, (np.ndarray, pd.Series, pd.Index)):
+        return encode_array(obj)
+    return obj
+
+
+def deep_merge(base: dict, patch: dict) -> dict:
+    """把 patch 递归合并进 base（就地修改并返回 base）；非字典值直接覆盖"""
+    for key, value in patch.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            deep_merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def _resolve_template(layout: dict) -> dict:
+    if isinstance(layout.get("template"), str):
+        layout = {**layout, "template": get_template(layout["template"])}
+    return layout
+
+
+class FigureSpec:
+    """
+    与 go.Figure 用法相近的最小子集：add_trace / update_layout / add_vline / to_dict / to_json。
+    属性名直接使用 plotly.js 的嵌套结构（如 xaxis=dict(title=...)），不做 magic underscore 展开与校验。
+    """
+
+    def __init__(self, data: Optional[list] = None, layout: Optional[dict] = None):
+        self.data = list(data or [])
+        self.layout = dict(layout or {})
+
+    def add_trace(self, trace_type: str, **props) -> "FigureSpec":
+        self.data.append({"type": trace_type, **props})
+        return self
+
+    def update_layout(self, patch: Optional[dict] = None, **props) -> "FigureSpec":
+        deep_merge(self.layout, {**(patch or {}), **props})
+        return self
+
+    def add_vline(self, x, **line) -> "FigureSpec":
+        """在 x 处画一条贯穿绘图区的竖线（等价于 go.Figure.add_vline）"""
+        self.layout.setdefault("shapes", []).append({
+            "type": "line", "xref": "x", "yref": "y domain",
+            "x0": x, "x1": x, "y0": 0, "y1": 1, "line": line,
+        })
+        return self
+
+    def to_dict(self) -> dict:
+        return {"data": _encode(self.data), "layout": _encode(_resolve_template(self.layout))}
+
+    def to_json(self) -> str:
+        return orjson.dumps(self.to_dict(), option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+
+
+def patch_figure(figure_json: str, patch: dict) -> dict:
+    """解析图表 JSON 并以字典深度合并方式覆盖 layout（template 可写模板名）"""
+    figure = orjson.loads(figure_json)
+    layout = deep_merge(figure.get("layout") or {}, patch)
+    figure["layout"] = _resolve_template(layout)
+    return figure
+
+
+def plotly_cdn_script() -> str:
+    """与已安装 plotly 版本一致的 plotly.js CDN 脚本标签"""
+    from plotly.offline import get_plotlyjs_version
+    return f'<script src="https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js" charset="utf-8"></script>'
+
+
+def figure_html(figure: dict, div_id: Optional[str] = None) -> str:
+    """
+    生成图表的 HTML 片段（div + Plotly.newPlot），页面需要另外引入 plotly_cdn_script()。
+    JSON 中的 < > & 转义为 \\u 形式，避免提前闭合 <script>。
+    """
+    div_id = div_id or str(uuid.uuid4())
+    data, layout, config = (_script_json(part) for part in
+                            (figure.get("data", []), figure.get("layout", {}), {"responsive": True}))
+    return (
+        f'<div><div id="{div_id}" class="plotly-graph-div" style="height:100%; width:100%;"></div>'
+        f'<script type="text/javascript">'
+        f'if (document.getElementById("{div_id}")) {{ Plotly.newPlot("{div_id}", {data}, {layout}, {config}); }}'
+        f'</script></div>'
+    )
+
+
+def _script_json(obj) -> str:
+    text = orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+    return text.replace("<", "\\u003c").replace(">", "\\u003e").replace("&", "\\u0026")
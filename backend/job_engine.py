@@ -0,0 +1,270 @@
+# backend/job_engine.py
+
+"""
+分析任务引擎：把 CPU 密集的分析函数（LSTM 训练、聚类、FP-Growth、情感打分）
+放到独立的进程池中执行，避免阻塞 uvicorn 的事件循环。
+"""
+
+import asyncio
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional
+from contextlib import contextmanager
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+# 每种分析类型允许同时占用的进程数，可通过环境变量覆盖，例如 WEAVEAI_JOB_CONCURRENCY_FORECAST=2
+DEFAULT_CONCURRENCY = {
+    "forecast": 1,
+    "forecast_batch": 1,
+    "clustering": 2,
+    "sentiment": 2,
+    "ingest": 2,
+}
+
+
+@dataclass
+class Job:
+    job_id: str
+    kind: str
+    status: str = "queued"          # queued / running / succeeded / failed
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Any = None
+    result_bytes: int = 0           # 已编码结果的字节数，计入引擎的结果内存上限
+    error: Optional[str] = None
+    error_type: Optional[str] = None  # invalid_input（对应 400）/ internal（对应 500）
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "analysis_type": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "error_type": self.error_type,
+        }
+
+
+class JobEngine:
+    """
+    有界进程池 + 按分析类型划分的并发配额。
+    - run(): 在进程池中执行并等待结果（供原有的同步风格接口使用）
+    - submit(): 后台执行并立即返回 job_id，之后通过 get() 轮询状态与结果
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, concurrency: Optional[dict] = None,
+                 job_ttl: int = 3600, max_jobs: int = 500, max_result_bytes: Optional[int] = None):
+        self.max_workers = max_workers or _env_int("WEAVEAI_JOB_WORKERS", os.cpu_count() or 1)
+        base = dict(DEFAULT_CONCURRENCY, **(concurrency or {}))
+        self.concurrency = {
+            kind: _env_int(f"WEAVEAI_JOB_CONCURRENCY_{kind.upper()}", limit)
+            for kind, limit in base.items()
+        }
+        self.job_ttl = job_ttl
+        self.max_jobs = max_jobs
+        self.max_result_bytes = max_result_bytes or _env_int("WEAVEAI_JOB_RESULT_MAX_MB", 512) * 1024 ** 2
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._jobs: dict[str, Job] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._finalizers: dict[str, Callable] = {}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # 延迟创建；使用 spawn 避免在已加载 TensorFlow / 线程的进程上 fork
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def _get_semaphore(self, kind: str) -> asyncio.Semaphore:
+        if kind not in self._semaphores:
+            limit = self.concurrency.get(kind, 1)
+            self._semaphores[kind] = asyncio.Semaphore(min(limit, self.max_workers))
+        return self._semaphores[kind]
+
+    async def run(self, kind: str, fn: Callable, *args, **kwargs) -> Any:
+        """在进程池中执行 fn(*args, **kwargs)，受 kind 对应的并发配额约束。"""
+        async with self._get_semaphore(kind):
+            return await self._run_in_pool(fn, *args, **kwargs)
+
+    async def _run_in_pool(self, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_pool(), _call, fn, args, kwargs)
+        except BrokenProcessPool:
+            # 子进程被 OOM 等原因杀死后进程池不可再用，重建后让本次请求失败
+            self._reset_pool()
+            raise RuntimeError("分析进程异常退出（可能是内存不足），请稍后重试或缩小数据规模。")
+
+    def _reset_pool(self):
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, kind: str, fn: Callable, *args, on_finish: Optional[Callable] = None, **kwargs) -> Job:
+        """
+        提交后台任务并立即返回 Job 记录。
+        on_finish 在任务结束（成功、失败、被取消或引擎关闭）后于主进程调用一次，用于兜底清理临时文件等资源。
+        """
+        self._evict_expired()
+        job = Job(job_id=uuid.uuid4().hex, kind=kind)
+        self._jobs[job.job_id] = job
+        if on_finish is not None:
+            self._finalizers[job.job_id] = on_finish
+        task = asyncio.get_running_loop().create_task(self._drive(job, fn, args, kwargs))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _drive(self, job: Job, fn: Callable, args: tuple, kwargs: dict):
+        try:
+            async with self._get_semaphore(job.kind):
+                job.status = "running"
+                job.started_at = time.time()
+                try:
+                    job.result = await self._run_in_pool(fn, *args, **kwargs)
+                    job.result_bytes = _payload_size(job.result)
+                    job.status = "succeeded"
+                except ValueError as e:
+                    job.status, job.error, job.error_type = "failed", str(e), "invalid_input"
+                except Exception as e:
+                    job.status, job.error, job.error_type = "failed", str(e), "internal"
+                finally:
+                    job.finished_at = time.time()
+            self._evict_expired()
+        finally:
+            self._finalize(job.job_id)
+
+    def _finalize(self, job_id: str):
+        finalizer = self._finalizers.pop(job_id, None)
+        if finalizer is not None:
+            finalizer()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def _evict_expired(self):
+        now = time.time()
+        finished = [j for j in self._jobs.values() if j.finished_at is not None]
+        for job in finished:
+            if now - job.finished_at > self.job_ttl:
+                del self._jobs[job.job_id]
+        # 任务数或结果总字节数超出上限时，按完成时间从旧到新淘汰已结束的任务
+        overflow = len(self._jobs) - self.max_jobs
+        total_bytes = sum(j.result_bytes for j in self._jobs.values())
+        finished = sorted((j for j in self._jobs.values() if j.finished_at is not None), key=lambda j: j.finished_at)
+        for job in finished[:-1]:  # 最近完成的任务始终保留，保证结果至少能被取走一次
+            if overflow <= 0 and total_bytes <= self.max_result_bytes:
+                break
+            del self._jobs[job.job_id]
+            overflow -= 1
+            total_bytes -= job.result_bytes
+
+    def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        # 被取消的任务可能来不及在事件循环关闭前执行 finally，这里直接完成清理
+        for job_id in list(self._finalizers):
+            self._finalize(job_id)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def _call(fn: Callable, args: tuple, kwargs: dict) -> Any:
+    return fn(*args, **kwargs)
+
+
+def _payload_size(result: Any) -> int:
+    """已编码结果（bytes 或 (bytes, media_type)）的字节数；其他类型的结果不计入上限"""
+    if isinstance(result, tuple) and result and isinstance(result[0], (bytes, bytearray)):
+        result = result[0]
+    return len(result) if isinstance(result, (bytes, bytearray)) else 0
+
+
+# ==============================================================================
+# 分析子进程内的二级进程池（并行 FP-Growth、情感打分）
+# ==============================================================================
+
+def nested_workers(env_name: str) -> int:
+    """
+    二级进程池的默认大小：CPU 核数按分析进程池大小均分，避免 N 个分析进程各开 CPU 核数个孙进程。
+    可通过 env_name 对应的环境变量覆盖。
+    """
+    cpus = os.cpu_count() or 1
+    job_workers = _env_int("WEAVEAI_JOB_WORKERS", cpus)
+    return _env_int(env_name, max(1, cpus // job_workers))
+
+
+class NestedPool:
+    """
+    分析子进程内按需创建的 spawn 进程池：连续的大任务之间复用，
+    空闲超过 idle_timeout 秒（WEAVEAI_NESTED_POOL_IDLE，默认 60）后自动关闭，进程退出时一并关闭。
+    """
+
+    def __init__(self, initializer: Optional[Callable] = None, idle_timeout: Optional[float] = None):
+        self.initializer = initializer
+        self.idle_timeout = idle_timeout if idle_timeout is not None else _env_int("WEAVEAI_NESTED_POOL_IDLE", 60)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._workers = 0
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    @contextmanager
+    def acquire(self, workers: int) -> Iterator[ProcessPoolExecutor]:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._pool is None or self._workers != workers:
+                self._shutdown_pool()
+                self._pool = ProcessPoolExecutor(max_workers=workers, initializer=self.initializer,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+                self._workers = workers
+            pool = self._pool
+        try:
+            yield pool
+        finally:
+            with self._lock:
+                if self._pool is pool:
+                    self._timer = threading.Timer(self.idle_timeout, self._expire, args=(pool,))
+                    self._timer.daemon = True
+                    self._timer.start()
+
+    def _expire(self, pool: ProcessPoolExecutor):
+        with self._lock:
+            if self._pool is pool:
+                self._timer = None
+                self._shutdown_pool()
+
+    def _shutdown_pool(self):
+        pool, self._pool, self._workers = self._pool, None, 0
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._shutdown_pool()
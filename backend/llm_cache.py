@@ -0,0 +1,90 @@
+# backend/llm_cache.py
+
+"""
+大模型流式输出的响应缓存（SQLite，按 expires_at 过期、按 used_at 做 LRU 淘汰）。
+  - 键：模型、渲染后的 system prompt、用户输入与 tools 设置的 SHA-256（请求参数按键排序后序列化）
+  - 值：一次完整输出的文本增量列表，命中时按原顺序逐块重放，与实时生成的分块格式一致
+  - 只缓存以 response.completed 正常结束的输出；失败、中断的请求不写入
+启用联网搜索的请求内容随时间变化，使用较短的 TTL。
+"""
+
+import os
+import sqlite3
+import time
+from contextlib import closing
+from hashlib import sha256
+from pathlib import Path
+from typing import Optional
+
+import orjson
+
+DATA_DIR = Path(os.getenv("WEAVEAI_DATA_DIR", "data"))
+LLM_CACHE_PATH = DATA_DIR / "llm_cache.sqlite"
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+def _cache_max_entries() -> int:
+    return max(1, int(_env_number("WEAVEAI_LLM_CACHE_SIZE", 500)))
+
+
+def cache_ttl(request_params: dict) -> float:
+    """缓存有效期（秒）；为 0 表示不缓存该请求"""
+    if any(tool.get("type") == "web_search" for tool in request_params.get("tools") or []):
+        return _env_number("WEAVEAI_LLM_CACHE_WEBSEARCH_TTL", 3600)
+    return _env_number("WEAVEAI_LLM_CACHE_TTL", 7 * 24 * 3600)
+
+
+def cache_key(request_params: dict) -> str:
+    """请求参数中决定输出内容的部分（model / input / tools）的哈希"""
+    material = {name: request_params.get(name) for name in ("model", "input", "tools")}
+    return sha256(orjson.dumps(material, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def _connect() -> sqlite3.Connection:
+    LLM_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(LLM_CACHE_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS responses ("
+        " key TEXT PRIMARY KEY, chunks BLOB NOT NULL, expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+    return conn
+
+
+def load_response(key: str) -> Optional[list]:
+    """返回未过期的缓存分块列表（并刷新 used_at），未命中返回 None"""
+    if not LLM_CACHE_PATH.exists():
+        return None
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        row = conn.execute("SELECT chunks FROM responses WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+    return orjson.loads(row[0])
+
+
+def store_response(key: str, chunks: list, ttl: float):
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                     (key, orjson.dumps(chunks), now + ttl, now))
+        conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        overflow = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - _cache_max_entries()
+        if overflow > 0:
+            conn.execute("DELETE FROM responses WHERE key IN"
+                         " (SELECT key FROM responses ORDER BY used_at LIMIT ?)", (overflow,))
+
+
+def clear_llm_cache():
+    if LLM_CACHE_PATH.exists():
+        with closing(_connect()) as conn, conn:
+            conn.execute("DELETE FROM responses")
@@ -0,0 +1,184 @@
+# backend/llm_client.py
+
+"""
+进程内共享的异步 Ark 客户端与流式调用。
+  - 整个进程只创建一个 AsyncArk，底层 httpx.AsyncClient 连接池复用 keep-alive 连接，避免每次请求重新 TLS 握手
+  - 流式响应在事件循环上逐块 await，等待模型输出时不占用线程池
+  - 相同请求优先从 llm_cache 重放已完成的输出，不再调用模型
+  - 同时进行中的相同请求合并为一次上游调用（single-flight）：首个请求驱动上游流，
+    其余请求订阅同一份增量缓冲，晚加入的请求先补发已产出的前缀
+连接池参数通过环境变量调整：
+  WEAVEAI_ARK_MAX_CONNECTIONS    同时打开的最大连接数（默认 100）
+  WEAVEAI_ARK_MAX_KEEPALIVE      空闲时保留的最大连接数（默认 20）
+  WEAVEAI_ARK_KEEPALIVE_EXPIRY   空闲连接的保留秒数（默认 60）
+"""
+
+import asyncio
+import os
+from typing import AsyncIterator, Optional
+
+import httpx
+from volcenginesdkarkruntime import AsyncArk
+
+from llm_cache import cache_key, cache_ttl, load_response, store_response
+
+ARK_MODEL = "doubao-seed-1-6-250615"
+
+# 流式生成可能持续数分钟，读超时按单次读取计算，与 SDK 默认一致
+ARK_TIMEOUT = httpx.Timeout(600.0, connect=60.0)
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max(1, int(_env_number("WEAVEAI_ARK_MAX_CONNECTIONS", 100))),
+        max_keepalive_connections=int(_env_number("WEAVEAI_ARK_MAX_KEEPALIVE", 20)),
+        keepalive_expiry=_env_number("WEAVEAI_ARK_KEEPALIVE_EXPIRY", 60.0),
+    )
+
+
+_client: Optional[AsyncArk] = None
+
+
+def get_async_ark_client() -> AsyncArk:
+    """返回进程内共享的 AsyncArk 客户端（首次调用时创建）"""
+    global _client
+    if _client is None:
+        api_key = os.getenv("ARK_API_KEY")
+        if not api_key:
+            raise ValueError("ARK_API_KEY not found in environment variables.")
+        http_client = httpx.AsyncClient(limits=_pool_limits(), timeout=ARK_TIMEOUT, follow_redirects=True)
+        _client = AsyncArk(api_key=api_key, timeout=ARK_TIMEOUT, http_client=http_client)
+    return _client
+
+
+async def close_async_ark_client():
+    """关闭共享客户端及其连接池（应用退出时调用）"""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.close()
+
+
+def build_request(system_prompt: str, user_input: str, tools: Optional[list] = None) -> dict:
+    """组装 responses.create 的流式请求参数"""
+    request_params = {
+        "model": ARK_MODEL,
+        "input": [
+            {"role": "system", "content": [{"type": "input_text", "text": system_prompt}]},
+            {"role": "user", "content": [{"type": "input_text", "text": user_input}]},
+        ],
+        "stream": True,
+    }
+    if tools:
+        request_params["tools"] = tools
+    return request_params
+
+
+async def _generate(request_params: dict, key: str, error_label: str, use_cache: bool) -> AsyncIterator[str]:
+    """命中缓存直接重放，未命中则调用模型，并在输出正常结束后写入缓存"""
+    ttl = cache_ttl(request_params) if use_cache else 0
+    if ttl:
+        cached = await asyncio.to_thread(load_response, key)
+        if cached is not None:
+            for delta_content in cached:
+                yield delta_content
+            return
+
+    chunks, completed = [], False
+    try:
+        response = await get_async_ark_client().responses.create(**request_params)
+        try:
+            async for chunk in response:
+                delta_content = getattr(chunk, 'delta', None)
+                if isinstance(delta_content, str):
+                    chunks.append(delta_content)
+                    yield delta_content
+                elif getattr(chunk, 'type', None) == "response.completed":
+                    completed = True
+        finally:
+            # 所有订阅者都已断开（任务被取消）时尽快释放上游连接，使其回到连接池
+            await response.close()
+    except Exception as e:
+        yield f"❌ {error_label}请求失败: {e}"
+        return
+
+    if ttl and completed and chunks:
+        await asyncio.to_thread(store_response, key, chunks, ttl)
+
+
+# ==============================================================================
+# 相同请求合并（single-flight）
+# ==============================================================================
+
+class _Flight:
+    """一次上游生成的增量缓冲：由后台任务写入，任意多个订阅者各自从头读取"""
+
+    def __init__(self):
+        self.chunks: list = []
+        self.done = False
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+    async def drive(self, source: AsyncIterator[str]):
+        try:
+            async for delta_content in source:
+                async with self.changed:
+                    self.chunks.append(delta_content)
+                    self.changed.notify_all()
+        finally:
+            async with self.changed:
+                self.done = True
+                self.changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        position = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: len(self.chunks) > position or self.done)
+                pending = self.chunks[position:]
+                finished = self.done
+            for delta_content in pending:
+                yield delta_content
+            position += len(pending)
+            if finished and position == len(self.chunks):
+                return
+
+
+_inflight: dict = {}
+
+
+def _release(key: tuple, flight: _Flight):
+    if _inflight.get(key) is flight:
+        del _inflight[key]
+
+
+async def stream_response(request_params: dict, error_label: str, use_cache: bool = True) -> AsyncIterator[str]:
+    """
+    逐块产出模型输出的文本增量；请求失败时产出一条 "❌ {error_label}请求失败: ..." 文本。
+    use_cache=True 时命中缓存直接重放，未命中则在输出正常结束后写入缓存。
+    与进行中的相同请求共享同一次上游调用；所有订阅者都断开后取消上游请求。
+    """
+    key = (cache_key(request_params), use_cache)
+    flight = _inflight.get(key)
+    if flight is None:
+        flight = _inflight[key] = _Flight()
+        flight.task = asyncio.create_task(flight.drive(_generate(request_params, key[0], error_label, use_cache)))
+        flight.task.add_done_callback(lambda _: _release(key, flight))
+    flight.subscribers += 1
+    try:
+        async for delta_content in flight.subscribe():
+            yield delta_content
+    finally:
+        flight.subscribers -= 1
+        if flight.subscribers == 0 and not flight.done:
+            # 没有人再读取这次生成，停止上游流；之后的相同请求重新发起
+            _release(key, flight)
+            flight.task.cancel()
@@ -1,19 +1,18 @@
 # backend/main.py
 
-import io
-import pandas as pd
 import uuid
 import os
 from pathlib import Path
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
-from fastapi.responses import StreamingResponse, JSONResponse, HTMLResponse
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from fastapi.concurrency import iterate_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional
 
 # >>> 新增/调整：为 PDF 导出做准备
-import asyncio
 from pyppeteer import launch
 import shutil
 import platform
@@ -23,24 +22,63 @@ from WAIapp_core import (
     generate_full_report_stream,
     agent_action_planner,
     generate_review_summary_report,
-    clean_sales_data,
-    perform_lstm_forecast,
-    perform_product_clustering,
-    perform_sentiment_analysis,
     generate_final_html_report,
-    perform_basket_analysis
+    run_forecast_pipeline,
+    run_batch_forecast_pipeline,
+    run_clustering_pipeline,
+    run_sentiment_pipeline,
+    run_ingest_pipeline,
+    FORECAST_ENGINES,
+    FORECAST_MODES,
+    BATCH_FORECAST_GROUPS,
+    K_SELECTION_METHODS,
+    CLUSTERING_MODES,
+    CLUSTER_MODEL_MODES,
+    SENTIMENT_ENGINES,
+    find_review_column,
+    iter_review_chunks,
+    score_review_chunk,
+    new_sentiment_summary,
+    merge_sentiment_summary,
+    finalize_sentiment_summary
 )
+from job_engine import JobEngine
+from dataset_store import DATASET_KINDS, get_dataset_info, delete_dataset, make_dataset_id, read_cluster_points
+from basket_index import query_pair_rules, get_basket_index_info
+from response_encoding import negotiate_format, run_and_encode, wants_ndjson, ndjson_line, NDJSON
+from data_ingest import UploadSource, spool_upload
+from llm_client import close_async_ark_client
+
+# CPU 密集的分析任务统一交给进程池执行，避免阻塞事件循环
+job_engine = JobEngine()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    job_engine.shutdown()
+    await close_async_ark_client()
 
 app = FastAPI(
     title="WeaveAI Backend API",
     description="为 WeaveAI 前端提供所有AI分析和数据处理能力的API服务。",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 REPORTS_DIR = Path("static/reports")
 REPORTS_DIR.mkdir(parents=True, exist_ok=True)
 app.mount("/reports", StaticFiles(directory=REPORTS_DIR), name="reports")
 
+# 分析类型 -> (子进程中执行的流水线, 允许的文件类型)
+ANALYSIS_PIPELINES = {
+    "forecast": (run_forecast_pipeline, ['.csv', '.parquet']),
+    "forecast_batch": (run_batch_forecast_pipeline, ['.csv', '.parquet']),
+    "clustering": (run_clustering_pipeline, ['.csv', '.parquet']),
+    "sentiment": (run_sentiment_pipeline, ['.csv', '.parquet']),
+}
+# 分析类型 -> 需要的数据集类型
+ANALYSIS_DATASET_KINDS = {"forecast": "sales", "forecast_batch": "sales", "clustering": "sales", "sentiment": "reviews"}
+
 origins = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
@@ -149,61 +187,325 @@ async def api_generate_and_save_report(payload: FinalReportRequest, request: Req
         raise HTTPException(status_code=500, detail=f"报告生成失败: {str(e)}")
 
 # --- Data Analysis ---
-async def process_uploaded_file(file: UploadFile, allowed_extensions: list) -> pd.DataFrame:
-    filename = file.filename
+def check_upload_extension(file: UploadFile, allowed_extensions: list) -> str:
+    filename = file.filename or ""
     if not any(filename.endswith(ext) for ext in allowed_extensions):
         raise HTTPException(status_code=400, detail=f"Invalid file type. Please upload one of {allowed_extensions}.")
+    return filename
+
+async def process_uploaded_file(file: UploadFile, allowed_extensions: list) -> tuple[UploadSource, str]:
+    """
+    把上传文件分块写入临时文件并计算内容哈希；解析（只读需要的列）留给分析子进程完成。
+    """
+    filename = check_upload_extension(file, allowed_extensions)
     try:
-        contents = await file.read()
-        if filename.endswith('.csv'):
-            return pd.read_csv(io.BytesIO(contents))
-        elif filename.endswith('.parquet'):
-            return pd.read_parquet(io.BytesIO(contents))
+        return await spool_upload(file, suffix=Path(filename).suffix)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error reading or parsing file: {e}")
+        raise HTTPException(status_code=500, detail=f"Error reading uploaded file: {e}")
+
+async def resolve_analysis_source(analysis_type: str, file: Optional[UploadFile], dataset_id: Optional[str]):
+    """
+    返回交给分析流水线的数据源：已入库的 dataset_id（子进程内存映射读取）或刚上传解析的 DataFrame。
+    """
+    if dataset_id:
+        try:
+            info = get_dataset_info(dataset_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if info is None:
+            raise HTTPException(status_code=404, detail=f"Dataset not found: {dataset_id}")
+        if info["kind"] != ANALYSIS_DATASET_KINDS[analysis_type]:
+            raise HTTPException(status_code=400, detail=f"Dataset {dataset_id} is of kind '{info['kind']}', expected '{ANALYSIS_DATASET_KINDS[analysis_type]}'.")
+        return dataset_id
+    if file is None:
+        raise HTTPException(status_code=400, detail="Please upload a file or provide a dataset_id.")
+    source, _ = await process_uploaded_file(file, ANALYSIS_PIPELINES[analysis_type][1])
+    return source
+
+def analysis_options(analysis_type: str, engine: Optional[str] = None, forecast_mode: str = "recursive",
+                     group_by: str = "Category", top_n: int = 50, n_clusters: Optional[int] = None,
+                     k_selection: str = "silhouette", clustering_mode: str = "top_n",
+                     cluster_model: str = "auto") -> dict:
+    """
+    校验分析参数并返回传给分析流水线的关键字参数（同步接口与异步任务共用，保证相同请求得到相同结果）。
+    engine 对预测默认为 lstm，对情感分析默认为 vader。
+    """
+    if analysis_type == "forecast":
+        engine = engine or "lstm"
+        if engine not in FORECAST_ENGINES:
+            raise HTTPException(status_code=400, detail=f"Unknown forecast engine. Use one of {list(FORECAST_ENGINES)}.")
+        if forecast_mode not in FORECAST_MODES:
+            raise HTTPException(status_code=400, detail=f"Invalid forecast_mode. Use one of {list(FORECAST_MODES)}.")
+        return {"engine": engine, "forecast_mode": forecast_mode}
+    if analysis_type == "forecast_batch":
+        if group_by not in BATCH_FORECAST_GROUPS:
+            raise HTTPException(status_code=400, detail=f"Invalid group_by. Use one of {list(BATCH_FORECAST_GROUPS)}.")
+        return {"group_by": group_by, "top_n": top_n}
+    if analysis_type == "clustering":
+        if k_selection not in K_SELECTION_METHODS:
+            raise HTTPException(status_code=400, detail=f"Invalid k_selection. Use one of {list(K_SELECTION_METHODS)}.")
+        if clustering_mode not in CLUSTERING_MODES:
+            raise HTTPException(status_code=400, detail=f"Invalid clustering_mode. Use one of {list(CLUSTERING_MODES)}.")
+        if cluster_model not in CLUSTER_MODEL_MODES:
+            raise HTTPException(status_code=400, detail=f"Invalid cluster_model. Use one of {list(CLUSTER_MODEL_MODES)}.")
+        if n_clusters is not None and n_clusters < 1:
+            raise HTTPException(status_code=400, detail="n_clusters must be a positive integer.")
+        return {"n_clusters": n_clusters, "k_selection": k_selection,
+                "clustering_mode": clustering_mode, "cluster_model": cluster_model}
+    if analysis_type == "sentiment":
+        engine = engine or "vader"
+        if engine not in SENTIMENT_ENGINES:
+            raise HTTPException(status_code=400, detail=f"Unknown sentiment engine. Use one of {list(SENTIMENT_ENGINES)}.")
+        return {"engine": engine}
+    raise HTTPException(status_code=404, detail=f"Unknown analysis type. Use one of {list(ANALYSIS_PIPELINES)}.")
+
+async def run_analysis(analysis_type: str, source, accept: Optional[str] = None, **options) -> Response:
+    """
+    在进程池中执行分析，并按 Accept 头在子进程内完成响应编码（Arrow IPC / 列式 JSON / 行式 JSON）；
+    子进程没来得及清理的临时上传文件在这里兜底删除。
+    """
+    try:
+        body, media_type = await job_engine.run(
+            analysis_type, run_and_encode, ANALYSIS_PIPELINES[analysis_type][0], negotiate_format(accept),
+            source, **options
+        )
+        return Response(content=body, media_type=media_type)
+    finally:
+        if isinstance(source, UploadSource):
+            source.discard()
+
+async def stream_sentiment_analysis(source, engine: str):
+    """
+    流式情感分析：在线程池中按块读取评论，每块交给分析进程池打分，立即输出该块的 NDJSON 评论行
+    （{"event": "review", ...}）与进度（{"event": "progress", ...}），最后输出汇总事件（{"event": "summary", ...}）。
+    响应头已发出后出错时输出 {"event": "error", "detail": ...} 并结束。
+    """
+    summary = new_sentiment_summary()
+    review_column = None
+    try:
+        async for chunk in iterate_in_threadpool(iter_review_chunks(source)):
+            if review_column is None:
+                review_column = find_review_column(chunk)
+                if review_column is None:
+                    raise ValueError("错误: 未能在评论文件中找到有效的文本列。")
+            lines, partial = await job_engine.run("sentiment", score_review_chunk, chunk, review_column, engine)
+            merge_sentiment_summary(summary, partial)
+            yield lines
+            yield ndjson_line({"event": "progress", "reviews": summary["reviews"]})
+        yield ndjson_line(finalize_sentiment_summary(summary, engine))
+    except Exception as e:
+        yield ndjson_line({"event": "error", "detail": str(e)})
+    finally:
+        if isinstance(source, UploadSource):
+            source.discard()
+
+# --- Datasets（上传一次，多次分析） ---
+@app.post("/api/v1/datasets", tags=["Datasets"])
+async def api_create_dataset(file: UploadFile = File(...), kind: str = Form("sales")):
+    if kind not in DATASET_KINDS:
+        raise HTTPException(status_code=400, detail=f"Invalid dataset kind. Use one of {list(DATASET_KINDS)}.")
+    source, digest = await process_uploaded_file(file, ['.csv', '.parquet'])
+    dataset_id = make_dataset_id(kind, digest)
+    try:
+        # 同一文件重复上传时直接复用已清洗的数据集
+        info = get_dataset_info(dataset_id)
+        if info is not None:
+            return {**info, "cached": True}
+        info = await job_engine.run("ingest", run_ingest_pipeline, source, dataset_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Dataset ingestion failed: {e}")
+    finally:
+        source.discard()
+    return {**info, "cached": False}
+
+@app.get("/api/v1/datasets/{dataset_id}", tags=["Datasets"])
+async def api_get_dataset(dataset_id: str):
+    try:
+        info = get_dataset_info(dataset_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if info is None:
+        raise HTTPException(status_code=404, detail=f"Dataset not found: {dataset_id}")
+    return info
+
+@app.delete("/api/v1/datasets/{dataset_id}", tags=["Datasets"])
+async def api_delete_dataset(dataset_id: str):
+    try:
+        deleted = delete_dataset(dataset_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"Dataset not found: {dataset_id}")
+    return {"dataset_id": dataset_id, "deleted": True}
 
 @app.post("/api/v1/data/forecast-sales", tags=["Data Analysis"])
-async def api_forecast_sales(file: UploadFile = File(...)):
+async def api_forecast_sales(
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
+    engine: str = Form("lstm"),
+    forecast_mode: str = Form("recursive"),
+    accept: Optional[str] = Header(None),
+):
+    try:
+        options = analysis_options("forecast", engine=engine, forecast_mode=forecast_mode)
+        source = await resolve_analysis_source("forecast", file, dataset_id)
+        return await run_analysis("forecast", source, accept, **options)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+
+@app.post("/api/v1/data/forecast-sales/batch", tags=["Data Analysis"])
+async def api_forecast_sales_batch(
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
+    group_by: str = Form("Category"),
+    top_n: int = Form(50),
+    accept: Optional[str] = Header(None),
+):
     try:
-        df = await process_uploaded_file(file, ['.csv', '.parquet'])
-        from WAIapp_core import clean_sales_data, perform_lstm_forecast
-        cleaned_df = clean_sales_data(df)
-        fig = perform_lstm_forecast(cleaned_df)
-        return JSONResponse(content=fig.to_json())
+        options = analysis_options("forecast_batch", group_by=group_by, top_n=top_n)
+        source = await resolve_analysis_source("forecast_batch", file, dataset_id)
+        return await run_analysis("forecast_batch", source, accept, **options)
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
 
 @app.post("/api/v1/data/product-clustering", tags=["Data Analysis"])
-async def api_product_clustering(file: UploadFile = File(...)):
+async def api_product_clustering(
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
+    n_clusters: Optional[int] = Form(None),
+    k_selection: str = Form("silhouette"),
+    clustering_mode: str = Form("top_n"),
+    cluster_model: str = Form("auto"),
+    accept: Optional[str] = Header(None),
+):
     try:
-        df = await process_uploaded_file(file, ['.csv', '.parquet'])
-        from WAIapp_core import clean_sales_data, perform_product_clustering, perform_basket_analysis
-        cleaned_df = clean_sales_data(df)
-        clustering_result = perform_product_clustering(cleaned_df)
-        basket_analysis_result = perform_basket_analysis(cleaned_df)
-        return JSONResponse(content={
-            "clustering_results": clustering_result,
-            "basket_analysis_results": basket_analysis_result
-        })
+        options = analysis_options("clustering", n_clusters=n_clusters, k_selection=k_selection,
+                                   clustering_mode=clustering_mode, cluster_model=cluster_model)
+        source = await resolve_analysis_source("clustering", file, dataset_id)
+        return await run_analysis("clustering", source, accept, **options)
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
 
+@app.get("/api/v1/data/product-clustering/{points_id}/points", tags=["Data Analysis"])
+def api_product_points(points_id: str, offset: int = 0, limit: int = 1000, cluster: Optional[int] = None):
+    """分页读取聚类结果中的完整商品点（按销售额降序），可按簇过滤"""
+    if offset < 0 or not 1 <= limit <= 5000:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit between 1 and 5000.")
+    try:
+        page = read_cluster_points(points_id, offset=offset, limit=limit, cluster=cluster)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if page is None:
+        raise HTTPException(status_code=404, detail=f"Clustering points not found: {points_id}")
+    return page
+
 @app.post("/api/v1/data/sentiment-analysis", tags=["Data Analysis"])
-async def api_sentiment_analysis(file: UploadFile = File(...)):
+async def api_sentiment_analysis(
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
+    engine: str = Form("vader"),
+    stream: bool = Form(False),
+    accept: Optional[str] = Header(None),
+):
     try:
-        df = await process_uploaded_file(file, ['.csv', '.parquet'])
-        from WAIapp_core import perform_sentiment_analysis
-        result = perform_sentiment_analysis(df)
-        return JSONResponse(content=result)
+        options = analysis_options("sentiment", engine=engine)
+        source = await resolve_analysis_source("sentiment", file, dataset_id)
+        if stream or wants_ndjson(accept):
+            return StreamingResponse(stream_sentiment_analysis(source, **options), media_type=NDJSON)
+        return await run_analysis("sentiment", source, accept, **options)
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
 
+# --- Basket Index（增量共现索引上的成对规则查询） ---
+@app.get("/api/v1/basket-rules", tags=["Basket Index"])
+def api_basket_rules(
+    sku: Optional[str] = None,
+    min_support: float = 0.02,
+    min_confidence: float = 0.0,
+    min_lift: float = 1.05,
+    top_n: int = 20,
+):
+    try:
+        return {
+            "rules": query_pair_rules(sku=sku, min_support=min_support, min_confidence=min_confidence,
+                                      min_lift=min_lift, top_n=top_n),
+            **get_basket_index_info(),
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Basket index query failed: {e}")
+
+@app.get("/api/v1/basket-index", tags=["Basket Index"])
+def api_basket_index():
+    return get_basket_index_info()
+
+# --- Analysis Jobs（异步提交 + 轮询） ---
+@app.post("/api/v1/jobs/{analysis_type}", tags=["Analysis Jobs"], status_code=202)
+async def api_submit_job(
+    analysis_type: str,
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
+    engine: Optional[str] = Form(None),
+    forecast_mode: str = Form("recursive"),
+    group_by: str = Form("Category"),
+    top_n: int = Form(50),
+    n_clusters: Optional[int] = Form(None),
+    k_selection: str = Form("silhouette"),
+    clustering_mode: str = Form("top_n"),
+    cluster_model: str = Form("auto"),
+    accept: Optional[str] = Header(None),
+):
+    """
+    接受与对应同步接口相同的参数；只有与 analysis_type 相关的字段会传给分析流水线。
+    结果在分析子进程中按提交时的 Accept 头编码，主进程只保存编码后的字节。
+    """
+    options = analysis_options(analysis_type, engine=engine, forecast_mode=forecast_mode, group_by=group_by,
+                               top_n=top_n, n_clusters=n_clusters, k_selection=k_selection,
+                               clustering_mode=clustering_mode, cluster_model=cluster_model)
+    source = await resolve_analysis_source(analysis_type, file, dataset_id)
+    # 子进程没来得及清理（进程池损坏、任务被取消等）的临时上传文件在任务结束后兜底删除
+    on_finish = source.discard if isinstance(source, UploadSource) else None
+    job = job_engine.submit(analysis_type, run_and_encode, ANALYSIS_PIPELINES[analysis_type][0],
+                            negotiate_format(accept), source, on_finish=on_finish, **options)
+    return job.to_dict()
+
+@app.get("/api/v1/jobs/{job_id}", tags=["Analysis Jobs"])
+async def api_job_status(job_id: str):
+    job = job_engine.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return job.to_dict()
+
+@app.get("/api/v1/jobs/{job_id}/result", tags=["Analysis Jobs"])
+async def api_job_result(job_id: str):
+    job = job_engine.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    if job.status == "failed":
+        status_code = 400 if job.error_type == "invalid_input" else 500
+        raise HTTPException(status_code=status_code, detail=job.error)
+    if job.status != "succeeded":
+        return JSONResponse(status_code=202, content=job.to_dict())
+    body, media_type = job.result
+    return Response(content=body, media_type=media_type)
+
 # =========================
 # 导出 PDF （改为优先使用本机浏览器）
 # =========================
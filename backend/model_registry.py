@@ -0,0 +1,161 @@
+# backend/model_registry.py
+
+"""
+模型注册表：按「数据序列指纹」持久化训练好的预测模型及其缩放参数，
+使每天追加新数据的同一序列可以在已有权重上增量微调，而不是每次从随机权重重新训练。
+聚类模型（标准化参数 + 簇中心）同样按数据集谱系保存，用于只预测模式与跨次运行的稳定簇编号。
+两类条目都按最近使用时间淘汰（与 dataset_store 的数据集相同）：读取时刷新 mtime，
+写入新条目后删除超过保留天数未使用的条目，总大小超过上限时从最久未使用的开始删除。
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from dataset_store import evict_entries, touch_entry
+
+DATA_DIR = Path(os.getenv("WEAVEAI_DATA_DIR", "data"))
+FORECAST_MODELS_DIR = DATA_DIR / "models" / "forecast"
+
+# 用序列开头的这么多个点识别「同一条序列」，追加新日期不会改变它
+LINEAGE_PREFIX_LENGTH = 28
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+def _evict_forecast_models():
+    evict_entries(FORECAST_MODELS_DIR, _env_number("WEAVEAI_FORECAST_MODELS_MAX_GB", 5) * 1024 ** 3,
+                  _env_number("WEAVEAI_MODEL_TTL_DAYS", 30), pattern="*")
+
+
+def _hash_values(values: np.ndarray) -> str:
+    return hashlib.sha256(np.ascontiguousarray(values, dtype=np.float64).tobytes()).hexdigest()
+
+
+def forecast_lineage_key(values: np.ndarray, series_name: str, config: dict) -> str:
+    """由序列名、模型配置与序列前缀生成注册表键"""
+    h = hashlib.sha256()
+    h.update(series_name.encode("utf-8"))
+    h.update(json.dumps(config, sort_keys=True).encode("utf-8"))
+    h.update(_hash_values(values[:LINEAGE_PREFIX_LENGTH]).encode("ascii"))
+    return h.hexdigest()[:32]
+
+
+def classify_history(state: Optional[dict], values: np.ndarray) -> str:
+    """
+    比较当前序列与注册表中的训练历史：
+      - "new":       没有可用的历史模型
+      - "unchanged": 与上次训练时完全一致，可直接复用
+      - "extended":  上次训练的序列是当前序列的前缀，只需在新增部分上微调
+      - "changed":   历史数据被修改，需要完整重训
+    """
+    if state is None:
+        return "new"
+    n_old = state["n_obs"]
+    if len(values) < n_old or _hash_values(values[:n_old]) != state["history_hash"]:
+        return "changed"
+    return "unchanged" if len(values) == n_old else "extended"
+
+
+def load_forecast_entry(key: str):
+    """返回 (state, keras 模型)；不存在或文件不完整时返回 (None, None)"""
+    entry_dir = FORECAST_MODELS_DIR / key
+    state_path = entry_dir / "state.json"
+    if not state_path.exists():
+        return None, None
+    with open(state_path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    model_path = entry_dir / state["model_file"]
+    if not model_path.exists():
+        return None, None
+    touch_entry(entry_dir)
+    from keras.models import load_model
+    return state, load_model(model_path)
+
+
+def save_forecast_entry(key: str, model, values: np.ndarray, state: dict):
+    """
+    保存模型与训练状态。模型文件名带随机后缀，先写模型再原子替换 state.json，
+    并发读取方总能拿到一组相互匹配的 (state, 模型)。
+    """
+    entry_dir = FORECAST_MODELS_DIR / key
+    entry_dir.mkdir(parents=True, exist_ok=True)
+    old_model_file = None
+    state_path = entry_dir / "state.json"
+    if state_path.exists():
+        with open(state_path, "r", encoding="utf-8") as f:
+            old_model_file = json.load(f).get("model_file")
+
+    model_file = f"model-{uuid.uuid4().hex[:12]}.keras"
+    model.save(entry_dir / model_file)
+
+    state = {
+        **state,
+        "model_file": model_file,
+        "n_obs": int(len(values)),
+        "history_hash": _hash_values(values),
+        "updated_at": time.time(),
+    }
+    tmp_path = entry_dir / f"state.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+    if old_model_file and old_model_file != model_file:
+        try:
+            os.unlink(entry_dir / old_model_file)
+        except FileNotFoundError:
+            pass
+    touch_entry(entry_dir)
+    _evict_forecast_models()
+
+
+# ==============================================================================
+# 聚类模型：按数据集谱系保存标准化参数、簇中心与稳定的簇编号
+# ==============================================================================
+
+CLUSTERING_MODELS_DIR = DATA_DIR / "models" / "clustering"
+
+
+def clustering_lineage_key(first_order_ids: list, config: dict) -> str:
+    """由最早一天的订单 ID（追加新订单不会改变它）与特征配置生成注册表键"""
+    h = hashlib.sha256()
+    h.update(json.dumps(config, sort_keys=True).encode("utf-8"))
+    h.update("\x1f".join(first_order_ids[:LINEAGE_PREFIX_LENGTH]).encode("utf-8"))
+    return h.hexdigest()[:32]
+
+
+def load_clustering_entry(key: str) -> Optional[dict]:
+    """返回 {"mean", "scale", "centers", "cluster_ids", **state}；不存在时返回 None"""
+    path = CLUSTERING_MODELS_DIR / f"{key}.npz"
+    if not path.exists():
+        return None
+    touch_entry(path)
+    with np.load(path, allow_pickle=False) as data:
+        entry = json.loads(str(data["state"]))
+        entry.update({name: data[name] for name in ("mean", "scale", "centers", "cluster_ids")})
+    return entry
+
+
+def save_clustering_entry(key: str, entry: dict):
+    """数组与状态写入同一个 npz 文件并原子替换，读取方不会拿到不匹配的中心与编号"""
+    CLUSTERING_MODELS_DIR.mkdir(parents=True, exist_ok=True)
+    arrays = {name: np.asarray(entry[name]) for name in ("mean", "scale", "centers", "cluster_ids")}
+    state = {k: v for k, v in entry.items() if k not in arrays}
+    state["updated_at"] = time.time()
+    tmp_path = CLUSTERING_MODELS_DIR / f"{key}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, state=np.array(json.dumps(state)), **arrays)
+    os.replace(tmp_path, CLUSTERING_MODELS_DIR / f"{key}.npz")
+    evict_entries(CLUSTERING_MODELS_DIR, _env_number("WEAVEAI_CLUSTERING_MODELS_MAX_GB", 1) * 1024 ** 3,
+                  _env_number("WEAVEAI_MODEL_TTL_DAYS", 30), pattern="*.npz")
@@ -0,0 +1,133 @@
+# backend/response_encoding.py
+
+"""
+分析结果的响应编码与内容协商。
+分析流水线返回的结果中，大表（评论、商品点等）保持为 DataFrame，直到最终编码时才按客户端
+Accept 头选择输出格式：
+  - application/vnd.apache.arrow.stream：主表编码为 Arrow IPC 流，其余字段以 JSON 放在 schema 元数据中
+  - application/vnd.weaveai.columnar+json：orjson 编码，表格按列输出 {列名: [值, ...]}
+  - 其他（默认）：orjson 编码，表格按行输出 [{列名: 值}, ...]，与原 JSONResponse 的结构一致
+流式接口（如流式情感分析）使用 NDJSON：每行一个 JSON 事件。
+"""
+
+import json
+from typing import Optional
+
+import orjson
+import pandas as pd
+import pyarrow as pa
+
+from dataset_store import to_arrow_table
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+COLUMNAR_JSON = "application/vnd.weaveai.columnar+json"
+RECORDS_JSON = "application/json"
+NDJSON = "application/x-ndjson"
+
+RESPONSE_FORMATS = {"arrow": ARROW_STREAM, "columnar": COLUMNAR_JSON, "records": RECORDS_JSON}
+
+# Arrow 流的 schema 元数据键：主表在结果中的路径、其余字段（JSON）
+ARROW_TABLE_PATH_KEY = b"weaveai.table_path"
+ARROW_REST_KEY = b"weaveai.rest"
+
+
+def negotiate_format(accept: Optional[str]) -> str:
+    """按 Accept 头选择 arrow / columnar / records，未声明或不认识时返回 records"""
+    media_types = [part.split(";")[0].strip().lower() for part in (accept or "").split(",")]
+    if ARROW_STREAM in media_types:
+        return "arrow"
+    if COLUMNAR_JSON in media_types:
+        return "columnar"
+    return "records"
+
+
+def wants_ndjson(accept: Optional[str]) -> bool:
+    return NDJSON in [part.split(";")[0].strip().lower() for part in (accept or "").split(",")]
+
+
+def ndjson_line(obj) -> bytes:
+    return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE)
+
+
+def ndjson_records(df: pd.DataFrame, **fields) -> bytes:
+    """每行输出一条 {**fields, 列名: 值} 记录"""
+    return b"".join(ndjson_line({**fields, **record}) for record in _records(df))
+
+
+def _records(df: pd.DataFrame) -> list:
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False).to_pylist()
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        return df.to_dict(orient="records")
+
+
+def _columns(df: pd.DataFrame) -> dict:
+    return {
+        str(col): df[col].to_numpy() if df[col].dtype.kind in "biuf" else df[col].tolist()
+        for col in df.columns
+    }
+
+
+def _dumps(result, columnar: bool) -> bytes:
+    def default(obj):
+        if isinstance(obj, pd.DataFrame):
+            return _columns(obj) if columnar else _records(obj)
+        raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+    return orjson.dumps(result, default=default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def _find_table(result, path: tuple = ()) -> Optional[tuple]:
+    """深度优先找出行数最多的 DataFrame，返回其在结果中的路径"""
+    best = None
+    if isinstance(result, pd.DataFrame):
+        return path, len(result)
+    if isinstance(result, dict):
+        for key, value in result.items():
+            found = _find_table(value, path + (key,))
+            if found is not None and (best is None or found[1] > best[1]):
+                best = found
+    return best
+
+
+def _without(result: dict, path: tuple) -> dict:
+    head, *rest = path
+    trimmed = dict(result)
+    if rest:
+        trimmed[head] = _without(result[head], tuple(rest))
+    else:
+        del trimmed[head]
+    return trimmed
+
+
+def _arrow_stream(result: dict, path: tuple) -> bytes:
+    table = result
+    for key in path:
+        table = table[key]
+    arrow_table = to_arrow_table(table)
+    metadata = {
+        ARROW_TABLE_PATH_KEY: json.dumps(list(path)).encode("utf-8"),
+        ARROW_REST_KEY: _dumps(_without(result, path), columnar=False),
+    }
+    arrow_table = arrow_table.replace_schema_metadata({**(arrow_table.schema.metadata or {}), **metadata})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, arrow_table.schema) as writer:
+        writer.write_table(arrow_table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_result(result, response_format: str = "records") -> tuple[bytes, str]:
+    """
+    返回 (响应体, media type)。请求 Arrow 但结果中没有表格（如预测图表 JSON）时退回 records JSON。
+    """
+    if response_format == "arrow" and isinstance(result, dict):
+        found = _find_table(result)
+        if found is not None:
+            return _arrow_stream(result, found[0]), ARROW_STREAM
+    if response_format == "columnar":
+        return _dumps(result, columnar=True), COLUMNAR_JSON
+    return _dumps(result, columnar=False), RECORDS_JSON
+
+
+def run_and_encode(pipeline, response_format: str, *args, **kwargs) -> tuple[bytes, str]:
+    """在分析子进程中执行流水线并直接完成编码，主进程只转发字节"""
+    return encode_result(pipeline(*args, **kwargs), response_format)
@@ -0,0 +1,249 @@
+# backend/sentiment_lexicon.py
+
+"""
+向量化的 VADER 词典打分：整列分词后，把 VADER 的规则改写成对 token 数组的 NumPy 运算。
+  - 词表只在去重后的 token 上做一次（去标点、小写、全大写判断），再按 token 编号查表得到
+    词典分值、程度副词增量、否定词标记
+  - 程度副词 / 否定 / 全大写强调 / "no" / "least" / 特殊短语 / "but" 转折 / 感叹号与问号强调
+    都按 token 在文本中的相对位置（前 1~3 个、后 1~2 个）以数组平移实现
+  - 每条文本的分值用 bincount 汇总后按 VADER 的方式归一化为 compound
+
+"but" 转折是唯一保留逐条处理的规则：VADER 的 _but_check 用 list.index 按「值」定位要缩放的分值，
+重复分值可能被缩放两次，这一行为无法按位置向量化，只对含 "but" 的文本在其少量有分值的 token 上逐条复刻。
+与逐条 polarity_scores 的差异不超过 COMPOUND_TOLERANCE（compound 用 np.round 与 Python round
+保留 4 位小数，在恰好落在舍入边界的值上可能差最后一位）。
+"""
+
+import string
+from functools import lru_cache
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+from vaderSentiment.vaderSentiment import (
+    BOOSTER_DICT, C_INCR, N_SCALAR, NEGATE, SPECIAL_CASES, SentimentIntensityAnalyzer
+)
+
+# 一次向量化处理的文本条数，控制 token 数组的内存占用
+BATCH_TEXTS = 100_000
+# 与逐条 VADER 的 compound 差值上限（仅来自 4 位小数的舍入方式）
+COMPOUND_TOLERANCE = 1e-4
+
+_PADDING = -1  # 越过文本边界的位置
+
+
+class _Vocabulary:
+    """按小写词建立的查表数组；末尾多放一个哨兵元素，使编号 -1 查到的是「不存在的词」"""
+
+    def __init__(self, lower_words: np.ndarray, lexicon: dict):
+        self.index = {word: i for i, word in enumerate(lower_words)}
+        valence = pd.Series(lower_words, dtype=object).map(lexicon).to_numpy(dtype=np.float64)
+        booster = pd.Series(lower_words, dtype=object).map(BOOSTER_DICT).to_numpy(dtype=np.float64)
+        negate = set(NEGATE)
+        self.in_lexicon = np.append(~np.isnan(valence), False)
+        self.valence = np.append(np.nan_to_num(valence), 0.0)
+        self.is_booster = np.append(~np.isnan(booster), False)
+        self.booster = np.append(np.nan_to_num(booster), 0.0)
+        self.negated = np.append(
+            np.fromiter((w in negate or "n't" in w for w in lower_words), dtype=bool, count=len(lower_words)),
+            False)
+
+    def id(self, word: str) -> int:
+        # 文本中没出现的词返回一个不会与任何 token 相等的编号
+        return self.index.get(word, -2)
+
+    def phrase(self, text: str):
+        ids = tuple(self.id(w) for w in text.split())
+        return None if -2 in ids else ids
+
+
+@lru_cache(maxsize=1)
+def _reference_tables():
+    analyzer = SentimentIntensityAnalyzer()
+    emojis = {ch: desc for ch, desc in analyzer.emojis.items() if len(ch) == 1}
+    special_cases = [(phrase, value) for phrase, value in SPECIAL_CASES.items() if " " in phrase]
+    booster_ngrams = [(phrase, value) for phrase, value in BOOSTER_DICT.items() if " " in phrase]
+    return analyzer.lexicon, emojis, frozenset(emojis), special_cases, booster_ngrams
+
+
+def _replace_emojis(text: str, emojis: dict) -> str:
+    # 与 SentimentIntensityAnalyzer.polarity_scores 开头的 emoji 替换逐字符一致
+    out = []
+    prev_space = True
+    for ch in text:
+        description = emojis.get(ch)
+        if description is not None:
+            if not prev_space:
+                out.append(' ')
+            out.append(description)
+            prev_space = False
+        else:
+            out.append(ch)
+            prev_space = ch == ' '
+    return ''.join(out).strip()
+
+
+def _strip_punc_if_word(token: str) -> str:
+    stripped = token.strip(string.punctuation)
+    return token if len(stripped) <= 2 else stripped
+
+
+def _punctuation_amplifier(texts: pd.Series) -> np.ndarray:
+    exclamations = np.minimum(texts.str.count("!").to_numpy(), 4) * 0.292
+    questions = texts.str.count(r"\?").to_numpy()
+    question_amp = np.where(questions > 1, np.where(questions <= 3, questions * 0.18, 0.96), 0.0)
+    return exclamations + question_amp
+
+
+def _score_batch(texts: pd.Series) -> np.ndarray:
+    lexicon, emojis, emoji_chars, special_cases, booster_ngrams = _reference_tables()
+    n_docs = len(texts)
+    texts = texts.astype(str)
+    # emoji 都是非 ASCII 字符，纯 ASCII 文本无需逐字符检查
+    has_emoji = np.fromiter((not t.isascii() and not emoji_chars.isdisjoint(t) for t in texts),
+                            dtype=bool, count=n_docs)
+    if has_emoji.any():
+        texts = texts.copy()
+        texts[has_emoji] = [_replace_emojis(t, emojis) for t in texts[has_emoji]]
+
+    # --- 分词并在去重后的 token 上建立词表 ---
+    token_lists = texts.str.split().tolist()
+    lengths = np.fromiter(map(len, token_lists), dtype=np.int64, count=n_docs)
+    raw_codes, raw_vocab = pd.factorize(pd.Series(list(chain.from_iterable(token_lists)), dtype=object))
+    words = [_strip_punc_if_word(t) for t in raw_vocab]
+    raw_upper = np.fromiter((w.isupper() for w in words), dtype=bool, count=len(words))
+    lower_codes, lower_words = pd.factorize(pd.Series([w.lower() for w in words], dtype=object))
+    vocab = _Vocabulary(np.asarray(lower_words, dtype=object), lexicon)
+
+    token_ids = lower_codes[raw_codes].astype(np.int64)
+    token_upper = raw_upper[raw_codes]
+    doc = np.repeat(np.arange(n_docs), lengths)
+    pos = np.arange(len(token_ids)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    upper_count = np.bincount(doc, weights=token_upper, minlength=n_docs)
+    cap_diff = (upper_count > 0) & (upper_count < lengths)
+
+    # --- 有词典分值的 token（程度副词本身与 "kind of" 中的 kind 记 0 分） ---
+    kind_of = (token_ids == vocab.id("kind")) & (pos < lengths[doc] - 1)
+    kind_of[kind_of] = token_ids[np.flatnonzero(kind_of) + 1] == vocab.id("of")
+    candidates = np.flatnonzero(vocab.in_lexicon[token_ids] & ~vocab.is_booster[token_ids] & ~kind_of)
+    w = token_ids[candidates]
+    p = pos[candidates]
+    length = lengths[doc[candidates]]
+    cap = cap_diff[doc[candidates]]
+
+    def prev(k):
+        valid = p >= k
+        return np.where(valid, token_ids[candidates - k * valid], _PADDING)
+
+    def prev_upper(k):
+        return (p >= k) & token_upper[candidates - k * (p >= k)]
+
+    def nxt(k):
+        valid = p + k < length
+        return np.where(valid, token_ids[np.where(valid, candidates + k, candidates)], _PADDING)
+
+    p1, p2, p3 = prev(1), prev(2), prev(3)
+    n1, n2 = nxt(1), nxt(2)
+    ids = vocab.id
+    so_this = lambda ids_: (ids_ == ids("so")) | (ids_ == ids("this"))
+
+    # "no" 后面紧跟词典词时自身不计分；前 1~2 个词（或 "no ... or/nor"）为 "no" 时取反
+    base = vocab.valence[w]
+    v = np.where((w == ids("no")) & vocab.in_lexicon[n1], 0.0, base)
+    no_before = (p1 == ids("no")) | (p2 == ids("no")) | \
+                ((p3 == ids("no")) & ((p1 == ids("or")) | (p1 == ids("nor"))))
+    v = np.where(no_before, base * N_SCALAR, v)
+    v = np.where(cap & token_upper[candidates], np.where(v > 0, v + C_INCR, v - C_INCR), v)
+
+    for start_i, (pk, damp) in enumerate(((p1, 1.0), (p2, 0.95), (p3, 0.9))):
+        active = (pk != _PADDING) & ~vocab.in_lexicon[pk]
+        is_booster = vocab.is_booster[pk]
+        scalar = np.where(v < 0, -vocab.booster[pk], vocab.booster[pk])
+        booster_cap = is_booster & prev_upper(start_i + 1) & cap
+        scalar = np.where(booster_cap, np.where(v > 0, scalar + C_INCR, scalar - C_INCR), scalar)
+        v = np.where(active, v + scalar * damp, v)
+
+        # 否定检查
+        if start_i == 0:
+            v = np.where(active & vocab.negated[p1], v * N_SCALAR, v)
+        elif start_i == 1:
+            never = (p2 == ids("never")) & so_this(p1)
+            without_doubt = (p2 == ids("without")) & (p1 == ids("doubt"))
+            v = np.where(active & never, v * 1.25,
+                         np.where(active & ~without_doubt & vocab.negated[p2], v * N_SCALAR, v))
+        else:
+            never = ((p3 == ids("never")) & so_this(p2)) | so_this(p1)
+            without_doubt = (p3 == ids("without")) & ((p2 == ids("doubt")) | (p1 == ids("doubt")))
+            v = np.where(active & never, v * 1.25,
+                         np.where(active & ~without_doubt & vocab.negated[p3], v * N_SCALAR, v))
+            v = np.where(active, _special_idioms(v, vocab, special_cases, booster_ngrams, w, p1, p2, p3, n1, n2), v)
+
+    # "least" 作为否定（"at least" / "very least" 除外）
+    least = (p1 == ids("least")) & ~vocab.in_lexicon[p1]
+    v = np.where(least & ((p < 2) | ((p2 != ids("at")) & (p2 != ids("very")))), v * N_SCALAR, v)
+
+    # "but" 转折：第一个 "but" 之前的分值 ×0.5，之后 ×1.5（按 VADER 的定位方式逐条处理）
+    buts = np.flatnonzero(token_ids == ids("but"))
+    no_but = np.iinfo(np.int64).max
+    first_but = np.full(n_docs, no_but)
+    np.minimum.at(first_but, doc[buts], pos[buts])
+    but_docs = np.flatnonzero(first_but != no_but)
+    if len(but_docs):
+        candidate_docs = doc[candidates]
+        bounds = np.searchsorted(candidate_docs, np.stack([but_docs, but_docs + 1]))
+        for d, lo, hi in zip(but_docs, *bounds):
+            v[lo:hi] = _but_check(v[lo:hi].tolist(), p[lo:hi].tolist(), first_but[d])
+
+    # --- 汇总与归一化 ---
+    total = np.bincount(doc[candidates], weights=v, minlength=n_docs)
+    amplifier = _punctuation_amplifier(texts)
+    total = np.where(total > 0, total + amplifier, np.where(total < 0, total - amplifier, total))
+    compound = np.clip(total / np.sqrt(total * total + 15), -1.0, 1.0)
+    return np.round(compound, 4)
+
+
+def _but_check(values: list, positions: list, but_position: int) -> list:
+    """
+    复刻 VADER _but_check：遍历分值列表，用 list.index 找到「第一个等于当前值」的位置再缩放。
+    只传入有分值的 token 即可，其余 token 的分值为 0，不会与非零分值相等，也不影响结果。
+    """
+    for j in range(len(values)):
+        sentiment = values[j]
+        si = values.index(sentiment)
+        if positions[si] < but_position:
+            values[si] = sentiment * 0.5
+        elif positions[si] > but_position:
+            values[si] = sentiment * 1.5
+    return values
+
+
+def _special_idioms(v, vocab, special_cases, booster_ngrams, w, p1, p2, p3, n1, n2):
+    """VADER _special_idioms_check：特殊短语直接给定分值，"kind of" / "sort of" 等作为程度修饰"""
+    windows = [(p1, w), (p2, p1, w), (p2, p1), (p3, p2, p1), (p3, p2)]
+
+    def matched(window, phrase_ids):
+        if phrase_ids is None or len(phrase_ids) != len(window):
+            return np.zeros(len(v), dtype=bool)
+        return np.logical_and.reduce([col == i for col, i in zip(window, phrase_ids)])
+
+    phrases = [(vocab.phrase(text), value) for text, value in special_cases]
+    override = np.full(len(v), np.nan)
+    for window in windows:
+        for phrase_ids, value in phrases:
+            override = np.where(np.isnan(override) & matched(window, phrase_ids), value, override)
+    v = np.where(np.isnan(override), v, override)
+    for window in [(w, n1), (w, n1, n2)]:
+        for phrase_ids, value in phrases:
+            v = np.where(matched(window, phrase_ids) & (window[-1] != _PADDING), value, v)
+    for window in [(p3, p2, p1), (p3, p2), (p2, p1)]:
+        for text, value in booster_ngrams:
+            v = np.where(matched(window, vocab.phrase(text)), v + value, v)
+    return v
+
+
+def lexicon_compound_scores(texts) -> np.ndarray:
+    """对一组文本计算 compound 分数（与 VADER 的差异见模块说明与 COMPOUND_TOLERANCE）"""
+    texts = pd.Series(texts, dtype=object).reset_index(drop=True)
+    if texts.empty:
+        return np.zeros(0, dtype=np.float64)
+    return np.concatenate([_score_batch(texts[i:i + BATCH_TEXTS]) for i in range(0, len(texts), BATCH_TEXTS)])
@@ -0,0 +1,195 @@
+# backend/sentiment_scoring.py
+
+"""
+评论情感打分：去重 + 持久化分数缓存 + 二级进程池（空闲超时后关闭）。
+  1. 规范化空白后去重：VADER 按空白切词，首尾空白与连续空白不影响分数，只对不同的文本各打分一次
+  2. 以文本哈希查询 SQLite 缓存（按最近使用时间淘汰，条数有上限），跨上传、跨进程共享
+  3. 只把缓存中没有的文本交给打分引擎并写回缓存：
+     vader   —— 逐条 polarity_scores，大批量时交给二级进程池（每个进程只构建一次 SentimentIntensityAnalyzer，空闲超时后关闭）
+     lexicon —— sentiment_lexicon 的向量化实现，整批在当前进程内完成
+同一批评论重复上传时几乎全部命中缓存。
+"""
+
+import math
+import os
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from job_engine import NestedPool, nested_workers
+from sentiment_lexicon import lexicon_compound_scores
+
+DATA_DIR = Path(os.getenv("WEAVEAI_DATA_DIR", "data"))
+SENTIMENT_CACHE_PATH = DATA_DIR / "sentiment_cache.sqlite"
+
+SENTIMENT_ENGINES = ("vader", "lexicon")
+
+# 待打分的文本少于该数量时直接在当前进程打分，进程间传输的开销不值得
+PARALLEL_MIN_TEXTS = 5000
+CHUNKS_PER_WORKER = 4
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+def _cache_max_entries() -> int:
+    return _env_int("WEAVEAI_SENTIMENT_CACHE_SIZE", 2_000_000)
+
+
+# ==============================================================================
+# 打分进程池
+# ==============================================================================
+
+_analyzer = None
+
+
+def _get_analyzer():
+    global _analyzer
+    if _analyzer is None:
+        from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+        _analyzer = SentimentIntensityAnalyzer()
+    return _analyzer
+
+
+def _vader_scores(texts: list) -> np.ndarray:
+    analyzer = _get_analyzer()
+    return np.fromiter((analyzer.polarity_scores(t)['compound'] for t in texts), dtype=np.float64, count=len(texts))
+
+
+# 二级进程池：每个打分进程只在启动时构建一次 SentimentIntensityAnalyzer；空闲超时后自动关闭
+_pool = NestedPool(initializer=_get_analyzer)
+
+
+def _score_unique(texts: np.ndarray, engine: str, workers: int) -> np.ndarray:
+    if len(texts) == 0:
+        return np.zeros(0, dtype=np.float64)
+    if engine == "lexicon":
+        return lexicon_compound_scores(texts)
+    if workers <= 1 or len(texts) < PARALLEL_MIN_TEXTS:
+        return _vader_scores(texts.tolist())
+    chunk = math.ceil(len(texts) / (workers * CHUNKS_PER_WORKER))
+    with _pool.acquire(workers) as pool:
+        futures = [pool.submit(_vader_scores, texts[i:i + chunk].tolist()) for i in range(0, len(texts), chunk)]
+        return np.concatenate([f.result() for f in futures])
+
+
+# ==============================================================================
+# 分数缓存（SQLite，按 used_at 做 LRU 淘汰）
+# ==============================================================================
+
+def _connect() -> sqlite3.Connection:
+    SENTIMENT_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(SENTIMENT_CACHE_PATH, timeout=30)
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS scores ("
+        " engine TEXT NOT NULL, text_hash INTEGER NOT NULL, compound REAL NOT NULL, used_at REAL NOT NULL,"
+        " PRIMARY KEY (engine, text_hash)) WITHOUT ROWID"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS scores_used_at ON scores (used_at)")
+    return conn
+
+
+def _cache_lookup(conn: sqlite3.Connection, engine: str, hashes: np.ndarray) -> dict:
+    """返回 {哈希: 分数}。只读查询，不持有写锁（WAL 下读不阻塞其他进程写入）"""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (text_hash INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.wanted")
+    conn.executemany("INSERT OR IGNORE INTO temp.wanted VALUES (?)", ((int(h),) for h in hashes))
+    rows = conn.execute(
+        "SELECT s.text_hash, s.compound FROM scores s JOIN temp.wanted w ON s.text_hash = w.text_hash"
+        " WHERE s.engine = ?", (engine,)
+    ).fetchall()
+    return dict(rows)
+
+
+def _cache_store(conn: sqlite3.Connection, engine: str, hit_hashes: np.ndarray,
+                 hashes: np.ndarray, scores: np.ndarray):
+    """刷新命中条目的 used_at 并写入新分数（调用方在一个短写事务中执行）"""
+    now = time.time()
+    conn.executemany(
+        "UPDATE scores SET used_at = ? WHERE engine = ? AND text_hash = ?",
+        ((now, engine, int(h)) for h in hit_hashes),
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)",
+        ((engine, int(h), float(s), now) for h, s in zip(hashes, scores)),
+    )
+    overflow = conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0] - _cache_max_entries()
+    if overflow > 0:
+        conn.execute(
+            "DELETE FROM scores WHERE (engine, text_hash) IN"
+            " (SELECT engine, text_hash FROM scores ORDER BY used_at LIMIT ?)", (overflow,)
+        )
+
+
+def clear_sentiment_cache():
+    if SENTIMENT_CACHE_PATH.exists():
+        with closing(_connect()) as conn, conn:
+            conn.execute("DELETE FROM scores")
+
+
+# ==============================================================================
+# 对外接口
+# ==============================================================================
+
+def normalize_texts(texts: pd.Series) -> pd.Series:
+    """折叠连续空白并去掉首尾空白（不改变 VADER 分数，但让这类近似重复的文本共享同一个缓存条目）"""
+    return texts.astype(str).str.replace(r"\s+", " ", regex=True).str.strip()
+
+
+def score_texts(texts: pd.Series, engine: str = "vader", use_cache: bool = True,
+                workers: Optional[int] = None) -> tuple[np.ndarray, dict]:
+    """
+    engine: vader（逐条参考实现）/ lexicon（向量化实现，与 vader 的差异见 sentiment_lexicon.COMPOUND_TOLERANCE）。
+    返回 (与 texts 等长的 compound 分数数组, 统计信息)。
+    统计信息：texts 总条数、unique 去重后条数、cache_hits 缓存命中数、scored 实际打分数、score_ms 总耗时。
+    """
+    if engine not in SENTIMENT_ENGINES:
+        raise ValueError(f"未知的情感打分引擎: {engine}，可选值为 {list(SENTIMENT_ENGINES)}")
+    start = time.perf_counter()
+    # 先按原文去重，再只对去重后的文本做空白规范化并二次去重
+    raw_codes, raw_uniques = pd.factorize(texts.astype(str), sort=False)
+    norm_codes, uniques = pd.factorize(normalize_texts(pd.Series(raw_uniques, dtype=object)), sort=False)
+    codes = norm_codes[raw_codes]
+    uniques = np.asarray(uniques, dtype=object)
+    hashes = pd.util.hash_array(uniques).view(np.int64)
+    unique_scores = np.full(len(uniques), np.nan)
+    workers = workers or nested_workers("WEAVEAI_SENTIMENT_WORKERS")
+
+    if use_cache and len(uniques):
+        # 查询 -> 打分 -> 写回分三步：打分可能耗时数分钟，期间不能持有数据库写锁
+        with closing(_connect()) as conn:
+            with conn:
+                cached = _cache_lookup(conn, engine, hashes)
+            if cached:
+                unique_scores = pd.Series(hashes).map(cached).to_numpy(dtype=np.float64)
+            missing = np.flatnonzero(np.isnan(unique_scores))
+            hits = np.flatnonzero(~np.isnan(unique_scores))
+            unique_scores[missing] = _score_unique(uniques[missing], engine, workers)
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                _cache_store(conn, engine, hashes[hits], hashes[missing], unique_scores[missing])
+    else:
+        missing = np.arange(len(uniques))
+        unique_scores = _score_unique(uniques, engine, workers)
+
+    stats = {
+        "engine": engine,
+        "texts": int(len(texts)),
+        "unique": int(len(uniques)),
+        "cache_hits": int(len(uniques) - len(missing)),
+        "scored": int(len(missing)),
+        "score_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+    return unique_scores[codes], stats
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# 测试直接导入 backend 下的扁平模块（与 uvicorn 在 backend 目录启动时一致）
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# 各模块在导入时读取 WEAVEAI_DATA_DIR，测试产生的数据集 / 模型 / 缓存统一写到临时目录
+os.environ.setdefault("WEAVEAI_DATA_DIR", tempfile.mkdtemp(prefix="weaveai-test-"))
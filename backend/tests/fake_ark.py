@@ -0,0 +1,33 @@
+"""测试用的假 AsyncArk：responses.create 返回按预设节奏产出增量的流式响应"""
+
+import asyncio
+from types import SimpleNamespace
+
+
+class FakeStream:
+    def __init__(self, deltas, completed, delay):
+        self.deltas, self.completed, self.delay = deltas, completed, delay
+        self.closed = False
+
+    async def __aiter__(self):
+        for delta in self.deltas:
+            await asyncio.sleep(self.delay)
+            yield SimpleNamespace(type="response.output_text.delta", delta=delta)
+        if self.completed:
+            yield SimpleNamespace(type="response.completed", delta=None)
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeArk:
+    def __init__(self, deltas=("我需要", "分析", "报告"), completed=True, delay=0.01):
+        self.deltas, self.completed, self.delay = list(deltas), completed, delay
+        self.calls, self.streams = [], []
+        self.responses = SimpleNamespace(create=self._create)
+
+    async def _create(self, **request_params):
+        self.calls.append(request_params)
+        stream = FakeStream(self.deltas, self.completed, self.delay)
+        self.streams.append(stream)
+        return stream
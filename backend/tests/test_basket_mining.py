@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+from mlxtend.frequent_patterns import fpgrowth
+from scipy import sparse
+
+import basket_mining
+from basket_mining import mine_frequent_itemsets
+
+
+def _transactions(n_orders: int = 400, n_items: int = 30, seed: int = 0) -> sparse.csr_matrix:
+    rng = np.random.default_rng(seed)
+    # 热门程度按幂律分布，并植入几组经常一起购买的组合
+    popularity = 1.0 / np.arange(1, n_items + 1) ** 0.8
+    dense = rng.random((n_orders, n_items)) < popularity * 0.35
+    for bundle in ([3, 7, 11], [5, 9], [0, 2, 4, 6]):
+        buyers = rng.random(n_orders) < 0.12
+        dense[np.ix_(buyers, bundle)] = True
+    return sparse.csr_matrix(dense)
+
+
+def _as_dict(frame: pd.DataFrame) -> dict:
+    return {frozenset(s): round(v, 12) for s, v in zip(frame['itemsets'], frame['support'])}
+
+
+def _reference(matrix: sparse.csr_matrix, items: list, min_support: float) -> dict:
+    frame = pd.DataFrame(matrix.toarray(), columns=items)
+    return _as_dict(fpgrowth(frame, min_support=min_support, use_colnames=True))
+
+
+@pytest.fixture
+def partitioned(monkeypatch):
+    # 强制走分区并行路径（测试数据远小于默认阈值）
+    monkeypatch.setattr(basket_mining, "PARALLEL_MIN_NNZ", 0)
+
+
+@pytest.mark.parametrize("min_support", [0.02, 0.05, 0.1])
+def test_partitioned_counts_match_single_process_fpgrowth(partitioned, min_support):
+    matrix = _transactions()
+    items = [f"sku{i}" for i in range(matrix.shape[1])]
+    expected = _reference(matrix, items, min_support)
+    assert _as_dict(mine_frequent_itemsets(matrix, items, min_support, workers=2)) == expected
+    assert _as_dict(mine_frequent_itemsets(matrix, items, min_support, workers=1)) == expected
+
+
+def test_min_support_boundary_is_inclusive(partitioned):
+    matrix = _transactions(seed=3)
+    n_orders = matrix.shape[0]
+    items = [f"sku{i}" for i in range(matrix.shape[1])]
+    counts = np.asarray(matrix.sum(axis=0)).ravel()
+    # 阈值恰好等于某个单品的订单数：该单品必须被计入，订单数少一个的则不计入
+    boundary = int(np.sort(counts)[len(counts) // 2])
+    min_support = boundary / n_orders
+    for workers in (1, 2):
+        result = _as_dict(mine_frequent_itemsets(matrix, items, min_support, workers=workers))
+        singles = {next(iter(s)) for s in result if len(s) == 1}
+        assert singles == {items[i] for i in np.flatnonzero(counts >= boundary)}
+        assert result == _reference(matrix, items, min_support)
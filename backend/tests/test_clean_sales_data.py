@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import WAIapp_core
+from WAIapp_core import clean_sales_data
+from data_ingest import SALES_COLUMN_ALIASES, SALES_REQUIRED_COLUMNS, VALID_ORDER_STATUSES
+
+
+def _baseline_clean(df: pd.DataFrame) -> pd.DataFrame:
+    """重写前的 clean_sales_data，作为输出等价性的参照"""
+    df = df.rename(columns={old: new for old, new in SALES_COLUMN_ALIASES.items() if old in df.columns})
+    df = df.dropna(subset=["Amount", "Category", "Date"])
+    try:
+        df["Date"] = pd.to_datetime(df["Date"], format='%m-%d-%y')
+    except ValueError:
+        df["Date"] = pd.to_datetime(df["Date"], errors='coerce')
+    df["Amount"] = pd.to_numeric(df["Amount"], errors='coerce')
+    df = df[df["Status"].isin(VALID_ORDER_STATUSES)]
+    return df.dropna(subset=['Date', 'Amount', 'SKU', 'Order ID', 'Qty'])
+
+
+def _fixture(dates: list) -> pd.DataFrame:
+    # 覆盖：无效状态、缺失 / 非法金额、缺失数量 / 类别 / SKU / 订单号，以及按别名提供的列
+    return pd.DataFrame({
+        "Order_ID": ["O1", "O2", "O3", "O4", "O5", None, "O7", "O8", "O9", "O10"],
+        "Date": dates,
+        "Status": ["Shipped", "Completed", "Returned", "Pending", "Cancelled",
+                   "Shipped", "Shipped", "Shipped", "Shipped - Delivered to Buyer", "Shipped"],
+        "Category": ["Set", "Kurta", "Set", None, "Top", "Set", "Kurta", "Set", "Top", "Set"],
+        "Product": ["A", "B", "A", "C", "D", "A", None, "B", "C", "A"],
+        "Quantity": [1, 2, 1, 3, np.nan, 1, 1, 2, 4, 1],
+        "Total Sales": ["100.5", "200", "50", "75", "20", "10", "30", "abc", np.nan, "999.99"],
+    })
+
+
+MDY_DATES = ["04-30-22", "04-30-22", "05-01-22", "05-02-22", "05-02-22",
+             "05-03-22", "05-03-22", "05-04-22", "05-05-22", "05-06-22"]
+ISO_DATES = ["2022-04-30", "2022-04-30", "2022-05-01", "2022-05-02", "2022-05-02",
+             "2022-05-03", "2022-05-03", "2022-05-04", "2022-05-05", "2022-05-06"]
+
+
+@pytest.fixture
+def fresh_format_cache(monkeypatch):
+    monkeypatch.setattr(WAIapp_core, "_DATE_FORMAT_CACHE", ['%m-%d-%y'])
+    return WAIapp_core._DATE_FORMAT_CACHE
+
+
+def _assert_matches_baseline(cleaned: pd.DataFrame, expected: pd.DataFrame):
+    assert list(cleaned.columns) == SALES_REQUIRED_COLUMNS
+    assert cleaned.index.tolist() == expected.index.tolist()
+    for col in ("Category", "Status", "SKU", "Order ID"):
+        assert cleaned[col].astype(object).tolist() == expected[col].tolist()
+    assert cleaned["Date"].tolist() == expected["Date"].tolist()
+    np.testing.assert_array_equal(cleaned["Amount"].to_numpy(), expected["Amount"].to_numpy())
+    np.testing.assert_array_equal(cleaned["Qty"].to_numpy(), expected["Qty"].to_numpy())
+
+
+@pytest.mark.parametrize("dates", [MDY_DATES, ISO_DATES], ids=["cached-format", "guessed-format"])
+def test_matches_baseline_output_and_dtypes(fresh_format_cache, dates):
+    raw = _fixture(dates)
+    cleaned = clean_sales_data(raw.copy())
+    expected = _baseline_clean(raw.copy())
+    assert cleaned.index.tolist() == [0, 1, 9]
+    _assert_matches_baseline(cleaned, expected)
+
+    for col in ("Category", "Status", "SKU", "Order ID"):
+        assert isinstance(cleaned[col].dtype, pd.CategoricalDtype)
+    assert cleaned["Amount"].dtype == np.float64
+    assert cleaned["Qty"].dtype == np.int8
+    assert pd.api.types.is_datetime64_any_dtype(cleaned["Date"])
+
+
+def test_format_cache_does_not_change_output(fresh_format_cache):
+    raw = _fixture(ISO_DATES)
+    cold = clean_sales_data(raw.copy())
+    assert fresh_format_cache[0] == "%Y-%m-%d"  # 推断出的格式被记入缓存并排在最前
+    warm = clean_sales_data(raw.copy())
+    pd.testing.assert_frame_equal(cold, warm)
+    # 缓存中最前的格式不适用时，回退到其余格式，结果不变
+    pd.testing.assert_frame_equal(clean_sales_data(_fixture(MDY_DATES)),
+                                  clean_sales_data(_fixture(MDY_DATES)))
+    assert fresh_format_cache[0] == "%m-%d-%y"
+
+
+@pytest.mark.filterwarnings("ignore:Could not infer format")
+def test_unparseable_dates_are_dropped(fresh_format_cache):
+    dates = list(MDY_DATES)
+    dates[1] = "not a date"
+    cleaned = clean_sales_data(_fixture(dates))
+    assert cleaned.index.tolist() == [0, 9]
+
+
+def test_missing_required_columns_are_reported():
+    with pytest.raises(ValueError, match="缺少关键列: Qty"):
+        clean_sales_data(_fixture(MDY_DATES).drop(columns=["Quantity"]))
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from WAIapp_core import STREAM_CHUNK_SIZE, _chunks, _cluster_streaming
+
+
+@pytest.mark.parametrize("n_rows", [STREAM_CHUNK_SIZE + 1, STREAM_CHUNK_SIZE + 2, 3 * STREAM_CHUNK_SIZE + 1])
+def test_chunks_merge_short_tail(n_rows):
+    parts = list(_chunks(n_rows, np.random.default_rng(0)))
+    sizes = [part.stop - part.start for part in parts]
+    assert sum(sizes) == n_rows
+    assert min(sizes) >= STREAM_CHUNK_SIZE
+    covered = np.zeros(n_rows, dtype=int)
+    for part in parts:
+        covered[part] += 1
+    assert (covered == 1).all()
+
+
+@pytest.mark.parametrize("n_clusters", [None, 4])
+@pytest.mark.parametrize("n_rows", [STREAM_CHUNK_SIZE + 1, STREAM_CHUNK_SIZE + 2])
+def test_streaming_clustering_with_remainder_chunk(n_rows, n_clusters):
+    rng = np.random.default_rng(1)
+    features = rng.normal(size=(n_rows, 3)) + rng.integers(0, 4, size=(n_rows, 1)) * 5
+    labels, _, k_info, model = _cluster_streaming(features, n_clusters, "silhouette")
+    assert labels.shape == (n_rows,)
+    assert model["centers"].shape[0] == k_info["chosen_k"]
+    if n_clusters is not None:
+        assert k_info["chosen_k"] == n_clusters
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+from WAIapp_core import perform_product_clustering
+
+
+def _sales(n_skus: int = 60, n_orders: int = 600, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 30, n_orders), unit="D"),
+        "Order ID": [f"o{seed}-{i}" for i in range(n_orders)],
+        "SKU": [f"sku{i}" for i in rng.integers(0, n_skus, n_orders)],
+        "Qty": rng.integers(1, 5, n_orders),
+        "Amount": rng.gamma(2.0, 50.0, n_orders),
+    })
+
+
+def test_same_config_reuses_saved_model():
+    df = _sales(seed=1)
+    assert perform_product_clustering(df)["cluster_model"]["status"] == "fitted"
+    assert perform_product_clustering(df)["cluster_model"]["status"] == "reused"
+
+
+def test_different_mode_or_k_selection_does_not_reuse():
+    df = _sales(seed=2)
+    first = perform_product_clustering(df)
+    assert first["cluster_model"]["status"] == "fitted"
+    knee = perform_product_clustering(df, k_selection="knee")
+    assert knee["cluster_model"]["status"] == "fitted"
+    assert knee["k_selection"]["method"] == "knee"
+    streaming = perform_product_clustering(df, clustering_mode="streaming")
+    assert streaming["cluster_model"]["status"] == "fitted"
+    assert streaming["k_selection"]["mode"] == "streaming"
@@ -0,0 +1,64 @@
+import asyncio
+import hashlib
+import io
+import threading
+
+import pytest
+from starlette.datastructures import UploadFile
+
+import data_ingest
+from data_ingest import spool_upload
+
+
+@pytest.fixture
+def uploads_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(data_ingest, "UPLOADS_DIR", tmp_path / "uploads")
+    return tmp_path / "uploads"
+
+
+def test_spool_upload_copies_content_and_hashes_it(uploads_dir, monkeypatch):
+    monkeypatch.setattr(data_ingest, "UPLOAD_CHUNK_SIZE", 1000)
+    payload = b"Date,Amount\n" + b"04-30-22,1.5\n" * 5000
+    source, digest = asyncio.run(spool_upload(UploadFile(io.BytesIO(payload), filename="sales.csv"), ".csv"))
+    assert source.filename == "sales.csv"
+    assert digest == hashlib.sha256(payload).hexdigest()
+    with open(source.path, "rb") as f:
+        assert f.read() == payload
+    source.discard()
+    assert list(uploads_dir.iterdir()) == []
+
+
+def test_spool_upload_hashes_and_writes_off_the_event_loop(uploads_dir, monkeypatch):
+    threads, sha256 = set(), hashlib.sha256
+
+    class RecordingHash:
+        def __init__(self):
+            self._digest = sha256()
+
+        def update(self, chunk):
+            threads.add(threading.get_ident())
+            self._digest.update(chunk)
+
+        def hexdigest(self):
+            return self._digest.hexdigest()
+
+    monkeypatch.setattr(data_ingest.hashlib, "sha256", RecordingHash)
+    monkeypatch.setattr(data_ingest, "UPLOAD_CHUNK_SIZE", 10)
+
+    async def scenario():
+        source, _ = await spool_upload(UploadFile(io.BytesIO(b"x" * 100), filename="a.csv"), ".csv")
+        source.discard()
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert threads and loop_thread not in threads
+
+
+def test_spool_upload_removes_partial_file_on_error(uploads_dir):
+    class BrokenFile(io.BytesIO):
+        def read(self, size=-1):
+            raise OSError("connection reset")
+
+    with pytest.raises(OSError, match="connection reset"):
+        asyncio.run(spool_upload(UploadFile(BrokenFile(), filename="a.csv"), ".csv"))
+    assert list(uploads_dir.iterdir()) == []
@@ -0,0 +1,74 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import dataset_store
+from dataset_store import delete_dataset, get_dataset_info, load_dataset, save_dataset
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    monkeypatch.setattr(dataset_store, "DATASETS_DIR", tmp_path / "datasets")
+    return tmp_path / "datasets"
+
+
+def _dataset_id(n: int) -> str:
+    return f"sales-{n:032x}"
+
+
+def _save(n: int, age_seconds: float = 0) -> str:
+    dataset_id = _dataset_id(n)
+    save_dataset(pd.DataFrame({"Sales": [float(n)] * 1000}), dataset_id)
+    used_at = time.time() - age_seconds
+    os.utime(dataset_store.DATASETS_DIR / f"{dataset_id}.arrow", (used_at, used_at))
+    return dataset_id
+
+
+def test_size_bound_evicts_least_recently_used_and_keeps_newest(store, monkeypatch):
+    _save(0)
+    size = (store / f"{_dataset_id(0)}.arrow").stat().st_size
+    delete_dataset(_dataset_id(0))
+    monkeypatch.setenv("WEAVEAI_DATASET_STORE_MAX_GB", str(2.5 * size / 1024 ** 3))
+
+    oldest, older = _save(1, age_seconds=300), _save(2, age_seconds=200)
+    get_dataset_info(oldest)  # 读取刷新最近使用时间，oldest 变为最近使用
+    newest = _save(3)
+
+    assert get_dataset_info(older) is None
+    assert not (store / f"{older}.json").exists()
+    assert load_dataset(oldest)["Sales"].iloc[0] == 1.0
+    assert get_dataset_info(newest) is not None
+
+
+def test_newest_dataset_survives_even_above_the_cap(store, monkeypatch):
+    monkeypatch.setenv("WEAVEAI_DATASET_STORE_MAX_GB", "0")
+    first, second = _save(1, age_seconds=10), _save(2)
+    assert get_dataset_info(first) is None
+    assert get_dataset_info(second)["rows"] == 1000
+
+
+def test_unused_datasets_expire_after_ttl(store, monkeypatch):
+    monkeypatch.setenv("WEAVEAI_DATASET_TTL_DAYS", "1")
+    stale, fresh = _save(1, age_seconds=2 * 86400), _save(2, age_seconds=3600)
+    _save(3)
+    assert get_dataset_info(stale) is None
+    assert get_dataset_info(fresh) is not None
+
+
+def test_delete_dataset(store):
+    dataset_id = _save(1)
+    assert delete_dataset(dataset_id) is True
+    assert get_dataset_info(dataset_id) is None
+    assert delete_dataset(dataset_id) is False
+
+
+@pytest.mark.parametrize("dataset_id", [
+    "", "sales-xyz", "orders-" + "0" * 32, "sales-" + "0" * 31, "sales-" + "A" * 32,
+    "../sales-" + "0" * 32, "sales-" + "0" * 32 + "/../x", "sales-" + "0" * 32 + "\n",
+])
+def test_invalid_dataset_ids_are_rejected(store, dataset_id):
+    for fn in (get_dataset_info, delete_dataset, load_dataset):
+        with pytest.raises(ValueError, match="无效的 dataset_id"):
+            fn(dataset_id)
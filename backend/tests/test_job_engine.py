@@ -0,0 +1,68 @@
+import asyncio
+
+from job_engine import JobEngine
+
+
+def _fail():
+    raise RuntimeError("boom")
+
+
+def _echo(value):
+    return value
+
+
+def test_on_finish_runs_after_success_and_failure():
+    async def scenario():
+        engine = JobEngine(max_workers=1)
+        finished = []
+        try:
+            ok = engine.submit("sentiment", _echo, 42, on_finish=lambda: finished.append("ok"))
+            bad = engine.submit("sentiment", _fail, on_finish=lambda: finished.append("bad"))
+            while ok.finished_at is None or bad.finished_at is None:
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(0)
+            return ok, bad, finished
+        finally:
+            engine.shutdown()
+
+    ok, bad, finished = asyncio.run(scenario())
+    assert ok.status == "succeeded" and ok.result == 42
+    assert bad.status == "failed" and bad.error_type == "internal"
+    assert sorted(finished) == ["bad", "ok"]
+
+
+def test_on_finish_runs_when_engine_shuts_down():
+    async def scenario():
+        engine = JobEngine(max_workers=1, concurrency={"sentiment": 1})
+        finished = []
+        engine.submit("sentiment", _echo, 1)
+        engine.submit("sentiment", _echo, 2, on_finish=lambda: finished.append("queued"))
+        await asyncio.sleep(0)
+        engine.shutdown()
+        return finished
+
+    assert asyncio.run(scenario()) == ["queued"]
+
+
+def _payload(n):
+    return b"x" * n, "application/octet-stream"
+
+
+def test_encoded_results_are_bounded_by_total_bytes():
+    async def scenario():
+        engine = JobEngine(max_workers=1, max_result_bytes=2500)
+        jobs = []
+        try:
+            for _ in range(4):
+                job = engine.submit("sentiment", _payload, 1000)
+                while job.finished_at is None:
+                    await asyncio.sleep(0.05)
+                jobs.append(job)
+            return engine, jobs
+        finally:
+            engine.shutdown()
+
+    engine, jobs = asyncio.run(scenario())
+    kept = [job for job in jobs if engine.get(job.job_id) is not None]
+    assert kept == jobs[-2:]
+    assert all(job.result_bytes == 1000 for job in jobs)
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import pytest
+
+import llm_cache
+import llm_client
+from fake_ark import FakeArk
+from llm_client import build_request, stream_response
+
+
+@pytest.fixture
+def fake_ark(monkeypatch, tmp_path):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_PATH", tmp_path / "llm_cache.sqlite")
+    fake = FakeArk()
+    monkeypatch.setattr(llm_client, "_client", fake)
+    return fake
+
+
+async def _collect(request_params):
+    return [delta async for delta in stream_response(request_params, "测试")]
+
+
+def test_cache_hit_replays_chunks_without_upstream_call(fake_ark):
+    request = build_request("system", "user")
+    assert asyncio.run(_collect(request)) == fake_ark.deltas
+    assert asyncio.run(_collect(request)) == fake_ark.deltas
+    assert len(fake_ark.calls) == 1
+    # 不同的输入 / tools 使用不同的缓存键
+    asyncio.run(_collect(build_request("system", "user", tools=[{"type": "web_search", "limit": 15}])))
+    assert len(fake_ark.calls) == 2
+
+
+def test_incomplete_stream_is_not_cached(fake_ark):
+    fake_ark.completed = False
+    request = build_request("system", "user")
+    asyncio.run(_collect(request))
+    asyncio.run(_collect(request))
+    assert len(fake_ark.calls) == 2
+    assert llm_cache.load_response(llm_cache.cache_key(request)) is None
+
+
+def test_failed_request_is_not_cached(fake_ark, monkeypatch):
+    async def broken(**_):
+        raise RuntimeError("upstream down")
+    monkeypatch.setattr(fake_ark.responses, "create", broken)
+    request = build_request("system", "user")
+    assert asyncio.run(_collect(request)) == ["❌ 测试请求失败: upstream down"]
+    assert llm_cache.load_response(llm_cache.cache_key(request)) is None
+
+
+def test_web_search_requests_use_shorter_ttl(monkeypatch):
+    monkeypatch.setenv("WEAVEAI_LLM_CACHE_TTL", "1000")
+    monkeypatch.setenv("WEAVEAI_LLM_CACHE_WEBSEARCH_TTL", "10")
+    assert llm_cache.cache_ttl(build_request("s", "u")) == 1000
+    assert llm_cache.cache_ttl(build_request("s", "u", tools=[{"type": "web_search"}])) == 10
+
+
+def test_expired_entries_are_not_served(fake_ark, monkeypatch):
+    llm_cache.store_response("k", ["a"], ttl=60)
+    assert llm_cache.load_response("k") == ["a"]
+    real_time = time.time
+    monkeypatch.setattr(llm_cache.time, "time", lambda: real_time() + 120)
+    assert llm_cache.load_response("k") is None
+
+
+def test_size_bound_evicts_least_recently_used(fake_ark, monkeypatch):
+    monkeypatch.setenv("WEAVEAI_LLM_CACHE_SIZE", "2")
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(llm_cache.time, "time", lambda: float(next(clock)))
+    llm_cache.store_response("a", ["1"], ttl=3600)
+    llm_cache.store_response("b", ["2"], ttl=3600)
+    assert llm_cache.load_response("a") == ["1"]  # a 变为最近使用
+    llm_cache.store_response("c", ["3"], ttl=3600)
+    assert llm_cache.load_response("b") is None
+    assert llm_cache.load_response("a") == ["1"]
+    assert llm_cache.load_response("c") == ["3"]
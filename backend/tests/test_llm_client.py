@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+import llm_cache
+import llm_client
+from fake_ark import FakeArk
+from llm_client import build_request, stream_response
+
+
+@pytest.fixture
+def fake_ark(monkeypatch, tmp_path):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_PATH", tmp_path / "llm_cache.sqlite")
+    fake = FakeArk(deltas=[f"段落{i}" for i in range(10)])
+    monkeypatch.setattr(llm_client, "_client", fake)
+    return fake
+
+
+async def _collect(request_params, use_cache=True):
+    return [delta async for delta in stream_response(request_params, "测试", use_cache=use_cache)]
+
+
+def test_concurrent_identical_requests_share_one_upstream_call(fake_ark):
+    async def scenario():
+        request = build_request("system", "user")
+        first = asyncio.create_task(_collect(request))
+        await asyncio.sleep(0.035)  # 后加入的订阅者需要先补发已产出的前缀
+        rest = await asyncio.gather(*[_collect(request) for _ in range(4)])
+        return [await first, *rest]
+
+    outputs = asyncio.run(scenario())
+    assert len(fake_ark.calls) == 1
+    assert all(output == fake_ark.deltas for output in outputs)
+    assert llm_client._inflight == {}
+
+
+def test_uncached_requests_are_still_coalesced(fake_ark):
+    async def scenario():
+        request = build_request("system", "user")
+        return await asyncio.gather(*[_collect(request, use_cache=False) for _ in range(3)])
+
+    outputs = asyncio.run(scenario())
+    assert len(fake_ark.calls) == 1
+    assert all(output == fake_ark.deltas for output in outputs)
+    assert llm_cache.load_response(llm_cache.cache_key(build_request("system", "user"))) is None
+
+
+def test_last_subscriber_leaving_cancels_upstream(fake_ark):
+    async def read_two(request):
+        stream = stream_response(request, "测试")
+        received = [await stream.__anext__(), await stream.__anext__()]
+        await stream.aclose()
+        return received
+
+    async def scenario():
+        request = build_request("system", "user")
+        await asyncio.gather(read_two(request), read_two(request))
+        await asyncio.sleep(0.02)  # 让被取消的上游任务执行完清理
+        # 仍在事件循环内检查：上游流已在生成结束前被关闭
+        return request, fake_ark.streams[0].closed
+
+    request, closed_early = asyncio.run(scenario())
+    assert len(fake_ark.calls) == 1
+    assert closed_early
+    assert llm_client._inflight == {}
+    # 中断的输出不写入缓存，之后的相同请求重新调用上游
+    assert llm_cache.load_response(llm_cache.cache_key(request)) is None
+    assert asyncio.run(_collect(request)) == fake_ark.deltas
+    assert len(fake_ark.calls) == 2
+
+
+def test_remaining_subscriber_keeps_upstream_alive(fake_ark):
+    async def scenario():
+        request = build_request("system", "user")
+        quitter = stream_response(request, "测试")
+        await quitter.__anext__()
+        reader = asyncio.create_task(_collect(request))
+        await asyncio.sleep(0)
+        await quitter.aclose()
+        return await reader
+
+    assert asyncio.run(scenario()) == fake_ark.deltas
+    assert len(fake_ark.calls) == 1
+    assert llm_cache.load_response(llm_cache.cache_key(build_request("system", "user"))) == fake_ark.deltas
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+from sentiment_lexicon import COMPOUND_TOLERANCE, lexicon_compound_scores
+
+# 覆盖 VADER 各条规则的固定语料：否定、but、全大写、标点放大、程度副词、emoji、习语与特殊短语
+RULE_CORPUS = [
+    "", "   ", "ok", "The product is good.", "The product is not good.", "The product isn't bad at all",
+    "never so happy", "without doubt the best", "not only good but great", "it wasn't that great",
+    "The color is much lighter but I don't mind, it's beautiful!", "good but terrible",
+    "but I love it", "I love it but", "it is bad but not terrible but okay", "nice BUT awful",
+    "GREAT product", "This is GREAT but the box is BAD", "ALL CAPS TEXT IS GOOD", "good!!!", "good!!!!!!",
+    "is it good???", "bad?!?!", "extremely good", "very very bad", "kind of good", "sort of nice",
+    "barely acceptable", "hardly useful", "incredibly awful", "slightly disappointing",
+    "I love it 😍", "terrible 😡😡", "ok 👍", "meh 😐 but 💯", "❤️ this bag", "no 🙂",
+    "the bomb", "this is the shit", "kiss of death", "yeah right", "cut the mustard", "hand to mouth",
+    "back handed compliment", "bad ass", "the least bit useful", "at least it works", "least favorite",
+    "not bad", "not the least bit bad", "never ever good", "no problems at all", "no, it's fine",
+    "Sooo goood", "great :) but sad :(", "lol this is funny", "wtf is this", "it's ok I guess",
+    "  leading and trailing   whitespace is good  ", "punctuation, everywhere; good: yes!",
+    "kinda sorta maybe good", "fairly decent", "really REALLY bad", "so much better than before",
+    "could be better", "I would not recommend", "do not buy", "did not work", "nothing special",
+    "😀😃😄", "good good good good good good good good good good", "BAD. Terrible. Awful!!!",
+]
+
+
+def _synthetic_corpus(n: int, seed: int = 0) -> list:
+    analyzer = SentimentIntensityAnalyzer()
+    rng = np.random.default_rng(seed)
+    vocabulary = list(analyzer.lexicon)[::7] + ["not", "never", "but", "very", "extremely", "kind", "of",
+                                                "the", "it", "is", "was", "least", "no", "without"]
+    fillers = ["!", "?", "!!", ".", ",", "😍", "😡", "👍", ""]
+    texts = []
+    for _ in range(n):
+        words = list(rng.choice(vocabulary, rng.integers(1, 15)))
+        words = [w.upper() if rng.random() < 0.1 else w for w in words]
+        texts.append(" ".join(words) + rng.choice(fillers))
+    return texts
+
+
+@pytest.fixture(scope="module")
+def analyzer():
+    return SentimentIntensityAnalyzer()
+
+
+def _vader(analyzer, texts):
+    return np.array([analyzer.polarity_scores(t)["compound"] for t in texts])
+
+
+def test_rule_corpus_matches_vader(analyzer):
+    scores = lexicon_compound_scores(RULE_CORPUS)
+    expected = _vader(analyzer, RULE_CORPUS)
+    mismatched = [(t, s, e) for t, s, e in zip(RULE_CORPUS, scores, expected) if abs(s - e) > COMPOUND_TOLERANCE]
+    assert mismatched == []
+
+
+def test_synthetic_corpus_matches_vader(analyzer):
+    texts = _synthetic_corpus(3000)
+    scores = lexicon_compound_scores(texts)
+    np.testing.assert_allclose(scores, _vader(analyzer, texts), atol=COMPOUND_TOLERANCE, rtol=0)